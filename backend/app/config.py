@@ -55,6 +55,23 @@ class Settings:
             "items_per_page": 64,
             "default_sort": "uploaded_at",
             "default_order": "desc",
+            "media_processing": {
+                "workers": 0,
+                "queue_size": 32
+            },
+            "archive_import": {
+                "max_size_mb": 2048,
+                "max_extracted_size_mb": 8192
+            },
+            "auto_ingest": {
+                "enabled": False,
+                "debounce_seconds": 5
+            },
+            "ai_tagger": {
+                "preprocess_processes": False,
+                "model_variant": "fp32",
+                "auto_calibrate": True
+            },
             "secret_key": os.urandom(32).hex()
         }
     
@@ -142,6 +159,92 @@ class Settings:
             
         return self.settings.get("redis", {}).get("enabled", False)
     
+    @property
+    def MEDIA_PROCESSING_WORKERS(self) -> int:
+        val = self.file_settings.get("media_processing", {}).get("workers")
+        if val is None:
+            val = os.getenv("MEDIA_PROCESSING_WORKERS", self.settings.get("media_processing", {}).get("workers", 0))
+        workers = int(val or 0)
+        return workers if workers > 0 else (os.cpu_count() or 1)
+    
+    @property
+    def MEDIA_PROCESSING_QUEUE_SIZE(self) -> int:
+        val = self.file_settings.get("media_processing", {}).get("queue_size")
+        if val is None:
+            val = os.getenv("MEDIA_PROCESSING_QUEUE_SIZE", self.settings.get("media_processing", {}).get("queue_size", 32))
+        return max(0, int(val))
+    
+    @property
+    def ARCHIVE_MAX_SIZE_MB(self) -> int:
+        val = self.file_settings.get("archive_import", {}).get("max_size_mb")
+        if val is None:
+            val = os.getenv("ARCHIVE_MAX_SIZE_MB", self.settings.get("archive_import", {}).get("max_size_mb", 2048))
+        return max(1, int(val))
+    
+    @property
+    def ARCHIVE_MAX_EXTRACTED_SIZE_MB(self) -> int:
+        val = self.file_settings.get("archive_import", {}).get("max_extracted_size_mb")
+        if val is None:
+            val = os.getenv("ARCHIVE_MAX_EXTRACTED_SIZE_MB", self.settings.get("archive_import", {}).get("max_extracted_size_mb", 8192))
+        return max(1, int(val))
+    
+    @property
+    def AUTO_INGEST_ENABLED(self) -> bool:
+        file_enabled = self.file_settings.get("auto_ingest", {}).get("enabled")
+        if file_enabled is not None:
+            if isinstance(file_enabled, bool):
+                return file_enabled
+            return str(file_enabled).lower() in ("true", "1", "yes")
+            
+        env_enabled = os.getenv("AUTO_INGEST_ENABLED")
+        if env_enabled is not None:
+            return env_enabled.lower() in ("true", "1", "yes")
+            
+        return self.settings.get("auto_ingest", {}).get("enabled", False)
+    
+    @property
+    def AUTO_INGEST_DEBOUNCE_SECONDS(self) -> float:
+        val = self.file_settings.get("auto_ingest", {}).get("debounce_seconds")
+        if val is None:
+            val = os.getenv("AUTO_INGEST_DEBOUNCE_SECONDS", self.settings.get("auto_ingest", {}).get("debounce_seconds", 5))
+        return max(0.5, float(val))
+    
+    @property
+    def AI_TAGGER_PREPROCESS_PROCESSES(self) -> bool:
+        file_enabled = self.file_settings.get("ai_tagger", {}).get("preprocess_processes")
+        if file_enabled is not None:
+            if isinstance(file_enabled, bool):
+                return file_enabled
+            return str(file_enabled).lower() in ("true", "1", "yes")
+            
+        env_enabled = os.getenv("AI_TAGGER_PREPROCESS_PROCESSES")
+        if env_enabled is not None:
+            return env_enabled.lower() in ("true", "1", "yes")
+            
+        return self.settings.get("ai_tagger", {}).get("preprocess_processes", False)
+    
+    @property
+    def AI_TAGGER_MODEL_VARIANT(self) -> str:
+        val = self.file_settings.get("ai_tagger", {}).get("model_variant")
+        if val is None:
+            val = os.getenv("AI_TAGGER_MODEL_VARIANT", self.settings.get("ai_tagger", {}).get("model_variant", "fp32"))
+        val = str(val).lower()
+        return val if val in ("fp32", "int8") else "fp32"
+    
+    @property
+    def AI_TAGGER_AUTO_CALIBRATE(self) -> bool:
+        file_enabled = self.file_settings.get("ai_tagger", {}).get("auto_calibrate")
+        if file_enabled is not None:
+            if isinstance(file_enabled, bool):
+                return file_enabled
+            return str(file_enabled).lower() in ("true", "1", "yes")
+            
+        env_enabled = os.getenv("AI_TAGGER_AUTO_CALIBRATE")
+        if env_enabled is not None:
+            return env_enabled.lower() in ("true", "1", "yes")
+            
+        return self.settings.get("ai_tagger", {}).get("auto_calibrate", True)
+    
     @property
     def SECRET_KEY(self) -> str:
         return self.settings["secret_key"]
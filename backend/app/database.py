@@ -70,6 +70,10 @@ def check_and_migrate_schema(engine):
     migrations = [
         migrate_add_parent_id,
         migrate_add_share_language,
+        migrate_rehash_media,
+        migrate_add_perceptual_hash,
+        migrate_backfill_album_closure,
+        migrate_add_album_aggregates,
     ]
     
     for migration in migrations:
@@ -120,3 +124,139 @@ def migrate_add_share_language(engine, inspector):
             "ALTER TABLE blombooru_media ADD COLUMN share_language VARCHAR(10)"
         ))
         conn.commit()
+
+def migrate_rehash_media(engine, inspector):
+    """
+    Rehash media stored with a legacy (MD5) hash so every row uses SHA-256.
+    Rows that cannot be rehashed (file missing, content already stored under
+    another row) are recorded in blombooru_rehash_skipped so later startups
+    do not read their files again.
+    """
+    from sqlalchemy import text
+    from concurrent.futures import ThreadPoolExecutor
+    from .config import settings
+    from .utils.media_processor import calculate_file_hash, HASH_HEX_LENGTH
+    
+    with engine.connect() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS blombooru_rehash_skipped ("
+            "media_id INTEGER PRIMARY KEY REFERENCES blombooru_media(id) ON DELETE CASCADE, "
+            "reason VARCHAR(32) NOT NULL)"
+        ))
+        conn.commit()
+        rows = conn.execute(text(
+            "SELECT m.id, m.path FROM blombooru_media AS m "
+            "WHERE length(m.hash) <> :length "
+            "AND NOT EXISTS (SELECT 1 FROM blombooru_rehash_skipped AS s WHERE s.media_id = m.id)"
+        ), {"length": HASH_HEX_LENGTH}).fetchall()
+    
+    if not rows:
+        return
+    
+    print(f"Rehashing {len(rows)} media files with a legacy hash...")
+    
+    def rehash(row):
+        media_id, path = row
+        file_path = settings.BASE_DIR / path
+        if not file_path.is_file():
+            return media_id, None
+        return media_id, calculate_file_hash(file_path)
+    
+    def skip(conn, media_id, reason):
+        conn.execute(text(
+            "INSERT INTO blombooru_rehash_skipped (media_id, reason) VALUES (:id, :reason) "
+            "ON CONFLICT (media_id) DO NOTHING"
+        ), {"id": media_id, "reason": reason})
+    
+    rehashed = 0
+    with engine.connect() as conn, ThreadPoolExecutor(max_workers=4) as executor:
+        for media_id, new_hash in executor.map(rehash, rows):
+            if new_hash is None:
+                print(f"Cannot rehash media {media_id}: file not found")
+                skip(conn, media_id, "file_not_found")
+                continue
+            
+            duplicate = conn.execute(text(
+                "SELECT id FROM blombooru_media WHERE hash = :hash"
+            ), {"hash": new_hash}).first()
+            if duplicate:
+                print(f"Cannot rehash media {media_id}: same content as media {duplicate[0]}")
+                skip(conn, media_id, "duplicate")
+                continue
+            
+            conn.execute(text(
+                "UPDATE blombooru_media SET hash = :hash WHERE id = :id"
+            ), {"hash": new_hash, "id": media_id})
+            rehashed += 1
+            
+            if rehashed % 500 == 0:
+                conn.commit()
+                print(f"Rehashed {rehashed} media files...")
+        
+        conn.commit()
+    
+    print(f"Rehashed {rehashed} of {len(rows)} media files")
+
+def migrate_add_perceptual_hash(engine, inspector):
+    """Add perceptual_hash column and index to media table"""
+    from sqlalchemy import text
+    
+    columns = [c['name'] for c in inspector.get_columns('blombooru_media')]
+    
+    if 'perceptual_hash' in columns:
+        return
+    
+    # Existing rows are hashed later by the near-duplicate report job
+    print("Adding perceptual_hash column to blombooru_media...")
+    
+    with engine.connect() as conn:
+        conn.execute(text(
+            "ALTER TABLE blombooru_media ADD COLUMN perceptual_hash VARCHAR(16)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX ix_blombooru_media_perceptual_hash ON blombooru_media(perceptual_hash)"
+        ))
+        conn.commit()
+
+def migrate_backfill_album_closure(engine, inspector):
+    """Fill the album closure table from the existing album hierarchy"""
+    from sqlalchemy import text
+    from .utils.album_hierarchy import rebuild_album_closure
+    
+    with engine.connect() as conn:
+        has_albums = conn.execute(text("SELECT 1 FROM blombooru_albums LIMIT 1")).first()
+        has_closure = conn.execute(text("SELECT 1 FROM blombooru_album_closure LIMIT 1")).first()
+        if not has_albums or has_closure:
+            return
+        
+        print("Building album closure table...")
+        rebuild_album_closure(conn)
+        conn.commit()
+
+def migrate_add_album_aggregates(engine, inspector):
+    """Add media_count, max_rating and cover_media_ids columns to albums and fill them"""
+    from sqlalchemy import text
+    from .utils.album_utils import refresh_album_aggregates
+    
+    columns = [c['name'] for c in inspector.get_columns('blombooru_albums')]
+    
+    if 'media_count' in columns:
+        return
+    
+    print("Adding aggregate columns to blombooru_albums...")
+    
+    with engine.connect() as conn:
+        conn.execute(text(
+            "ALTER TABLE blombooru_albums ADD COLUMN media_count INTEGER NOT NULL DEFAULT 0"
+        ))
+        conn.execute(text(
+            "ALTER TABLE blombooru_albums ADD COLUMN max_rating ratingenum NOT NULL DEFAULT 'safe'"
+        ))
+        conn.execute(text(
+            "ALTER TABLE blombooru_albums ADD COLUMN cover_media_ids INTEGER[] NOT NULL DEFAULT '{}'"
+        ))
+        conn.execute(text(
+            "CREATE INDEX ix_blombooru_albums_max_rating ON blombooru_albums(max_rating)"
+        ))
+        refresh_album_aggregates(conn)
+        conn.commit()
@@ -7,7 +7,7 @@ from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
 from pathlib import Path
 from .config import settings
 from .database import get_db, init_db, init_engine
-from .routes import admin, media, tags, search, sharing, albums, ai_tagger, danbooru, system
+from .routes import admin, media, tags, search, sharing, albums, ai_tagger, danbooru, system, jobs
 from .auth_middleware import AuthMiddleware
 from .translations import translation_helper, language_registry
 from datetime import datetime
@@ -37,6 +37,7 @@ app.include_router(albums.router)
 app.include_router(ai_tagger.router)
 app.include_router(danbooru.router)
 app.include_router(system.router)
+app.include_router(jobs.router)
 
 @app.on_event("startup")
 async def startup_event():
@@ -45,6 +46,18 @@ async def startup_event():
         try:
             init_engine()
             init_db()
+            
+            # Build the in-memory indexes off the event loop
+            from .services.phash_index import phash_index
+            from .services.tag_autocomplete import tag_autocomplete
+            phash_index.schedule_rebuild()
+            tag_autocomplete.schedule_rebuild()
+            from .routes.ai_tagger import schedule_filename_index_rebuild
+            schedule_filename_index_rebuild()
+            
+            from .services.media_watcher import media_watcher
+            if media_watcher.start():
+                print(f"Auto-ingest watching {settings.ORIGINAL_DIR}")
                 
             print("Blombooru started successfully")
         except Exception as e:
@@ -61,6 +74,18 @@ async def shutdown_event():
     except Exception as e:
         print(f"Error during shutdown: {e}")
 
+    try:
+        from .services.media_watcher import media_watcher
+        media_watcher.stop()
+    except Exception as e:
+        print(f"Error during shutdown: {e}")
+
+    try:
+        from .services.media_processing import media_processing
+        media_processing.shutdown()
+    except Exception as e:
+        print(f"Error during shutdown: {e}")
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     """Home page"""
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Table, Float, Enum, Index
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Text, ForeignKey, Table, Float, Enum, Index, LargeBinary
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -44,6 +45,7 @@ class Media(Base):
     path = Column(String(500), nullable=False, unique=True)
     thumbnail_path = Column(String(500))
     hash = Column(String(64), unique=True, index=True)
+    perceptual_hash = Column(String(16), nullable=True, index=True)
     file_type = Column(Enum(FileTypeEnum), nullable=False)
     mime_type = Column(String(100))
     file_size = Column(Integer)
@@ -83,6 +85,18 @@ class Tag(Base):
     media = relationship('Media', secondary=blombooru_media_tags, back_populates='tags')
     aliases = relationship('TagAlias', foreign_keys='TagAlias.target_tag_id', back_populates='target_tag', cascade="all, delete-orphan")
 
+# Precomputed co-occurrence counts: for every tag, the tags appearing on the
+# most media together with it (top entries per related tag category), plus a
+# row pairing the tag with itself once it has been computed.
+# Maintained by services.tag_cooccurrence
+blombooru_tag_cooccurrence = Table(
+    'blombooru_tag_cooccurrence',
+    Base.metadata,
+    Column('tag_id', Integer, ForeignKey('blombooru_tags.id', ondelete='CASCADE'), primary_key=True),
+    Column('related_tag_id', Integer, ForeignKey('blombooru_tags.id', ondelete='CASCADE'), primary_key=True, index=True),
+    Column('count', Integer, nullable=False)
+)
+
 class TagAlias(Base):
     __tablename__ = 'blombooru_tag_aliases'
     
@@ -109,6 +123,17 @@ blombooru_album_hierarchy = Table(
     Column('child_album_id', Integer, ForeignKey('blombooru_albums.id', ondelete='CASCADE'), primary_key=True)
 )
 
+# Album closure: one row per (ancestor, descendant) pair with the shortest
+# distance between them, including a depth-0 row for every album itself.
+# Maintained alongside blombooru_album_hierarchy by utils.album_hierarchy
+blombooru_album_closure = Table(
+    'blombooru_album_closure',
+    Base.metadata,
+    Column('ancestor_id', Integer, ForeignKey('blombooru_albums.id', ondelete='CASCADE'), primary_key=True),
+    Column('descendant_id', Integer, ForeignKey('blombooru_albums.id', ondelete='CASCADE'), primary_key=True, index=True),
+    Column('depth', Integer, nullable=False, default=0)
+)
+
 class Album(Base):
     __tablename__ = 'blombooru_albums'
     
@@ -118,6 +143,12 @@ class Album(Base):
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     last_modified = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
+    # Aggregates over the album and all sub-albums, kept current by the
+    # helpers in utils.album_utils
+    media_count = Column(Integer, nullable=False, default=0, server_default='0')
+    max_rating = Column(Enum(RatingEnum), nullable=False, default=RatingEnum.safe, server_default=RatingEnum.safe.value, index=True)
+    cover_media_ids = Column(ARRAY(Integer), nullable=False, default=list, server_default='{}')
+    
     # Relationships
     media = relationship('Media', secondary=blombooru_album_media, back_populates='albums')
     
@@ -146,3 +177,23 @@ class ApiKey(Base):
     is_active = Column(Boolean, default=True, index=True)
     
     user = relationship('User', backref='api_keys')
+
+# Last seen size/mtime and hash of files in ORIGINAL_DIR, so unchanged files are not rehashed
+class ScanManifestEntry(Base):
+    __tablename__ = 'blombooru_scan_manifest'
+    
+    path = Column(String(1000), primary_key=True)
+    file_size = Column(BigInteger, nullable=False)
+    mtime_ns = Column(BigInteger, nullable=False)
+    hash = Column(String(64), nullable=False, index=True)
+    scanned_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# Raw WD tagger scores per file content and model (zlib-compressed float16 vector),
+# so thresholds can be re-applied without running the model again
+class TaggerScoreEntry(Base):
+    __tablename__ = 'blombooru_tagger_scores'
+    
+    media_hash = Column(String(64), primary_key=True)
+    model_name = Column(String(100), primary_key=True)
+    scores = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
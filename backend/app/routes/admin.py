@@ -6,14 +6,14 @@ from sqlalchemy.exc import OperationalError, IntegrityError
 from sqlalchemy import create_engine as sqlalchemy_create_engine, text
 from typing import Optional
 from datetime import timedelta
-import csv
-import io
 from ..database import get_db, init_db
 from ..auth import get_password_hash, create_access_token, get_current_admin_user, require_admin_mode, generate_api_key, hash_api_key
-from ..models import User, Tag, TagAlias, ApiKey
+from ..models import User, Tag, TagAlias, ApiKey, TagCategoryEnum
 from ..schemas import OnboardingData, SettingsUpdate, UserLogin, Token, ApiKeyCreate, ApiKeyResponse, ApiKeyListResponse
 from ..config import settings
-from ..utils.file_scanner import find_untracked_media
+from ..utils.file_scanner import run_media_scan
+from ..utils.tag_utils import get_or_create_tags, reconcile_tag_counts
+from ..services.phash_index import DEFAULT_NEAR_DUPLICATE_DISTANCE, MAX_NEAR_DUPLICATE_DISTANCE
 from ..themes import theme_registry
 from ..utils.backup import generate_tags_dump, stream_zip_generator, get_media_files_generator, import_full_backup, generate_tags_csv_stream
 from fastapi.responses import StreamingResponse
@@ -426,16 +426,55 @@ async def update_settings(
 
 @router.post("/scan-media")
 async def scan_media(
-    current_user: User = Depends(require_admin_mode),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(require_admin_mode)
 ):
-    """Find untracked media files"""    
-    result = find_untracked_media(db)
+    """Start a background scan for untracked media files"""
+    from ..services.jobs import job_manager
     
-    return {
-        'new_files': result['new_files'],
-        'files': [f['path'] for f in result['files']]
-    }
+    job = job_manager.find_running("media_scan")
+    if not job:
+        job = job_manager.start("media_scan", run_media_scan)
+    
+    return {"job_id": job.id}
+
+@router.get("/scan-media/{job_id}")
+async def get_scan_media_status(
+    job_id: str,
+    current_user: User = Depends(require_admin_mode)
+):
+    """Poll a media scan; the result holds new_files and files once completed"""
+    from ..services.jobs import job_manager
+    
+    job = job_manager.get(job_id)
+    if not job or job.kind != "media_scan":
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    return job.to_dict()
+    
+@router.post("/import-untracked")
+async def import_untracked_media(
+    data: dict,
+    current_user: User = Depends(require_admin_mode)
+):
+    """Start a background job that imports every untracked file in place"""
+    from ..services.jobs import job_manager
+    from ..services.media_ingest import run_untracked_import
+    from ..schemas import RatingEnum
+    
+    try:
+        rating = RatingEnum(data.get('rating') or RatingEnum.safe)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid rating")
+    
+    tag_names = [t.strip() for t in (data.get('tags') or []) if t and t.strip()]
+    album_ids = [int(a_id) for a_id in (data.get('album_ids') or []) if str(a_id).isdigit()]
+    source = data.get('source') or None
+    
+    job = job_manager.find_running("untracked_import")
+    if not job:
+        job = job_manager.start("untracked_import", run_untracked_import, rating, tag_names, album_ids, source)
+    
+    return {"job_id": job.id}
     
 @router.get("/get-untracked-file")
 async def get_untracked_file(
@@ -474,6 +513,112 @@ async def get_untracked_file(
         filename=file_path.name
     )
 
+@router.post("/regenerate-thumbnails")
+async def regenerate_thumbnails(
+    missing_only: bool = True,
+    current_user: User = Depends(require_admin_mode),
+    db: Session = Depends(get_db)
+):
+    """Regenerate media thumbnails using the media processing pool"""
+    from ..models import Media
+    from ..services.media_processing import media_processing
+    from ..utils.cache import invalidate_media_cache
+    from starlette.concurrency import run_in_threadpool
+
+    rows = db.query(Media.id, Media.path, Media.thumbnail_path, Media.file_type).all()
+
+    jobs = []
+    for media_id, path, thumbnail_path, file_type in rows:
+        if missing_only and thumbnail_path and (settings.BASE_DIR / thumbnail_path).exists():
+            continue
+
+        source_path = settings.BASE_DIR / path
+        if not source_path.exists():
+            continue
+
+        thumb_path = settings.THUMBNAIL_DIR / f"{source_path.stem}.jpg"
+        jobs.append((media_id, source_path, thumb_path, file_type))
+
+    def run_jobs():
+        # submit() blocks while the pool queue is full, so feed it from a worker thread
+        futures = [
+            (media_id, thumb_path, media_processing.generate_thumbnail(source_path, thumb_path, file_type))
+            for media_id, source_path, thumb_path, file_type in jobs
+        ]
+        results = []
+        for media_id, thumb_path, future in futures:
+            try:
+                results.append((media_id, thumb_path, future.result()))
+            except Exception as e:
+                print(f"Thumbnail regeneration failed for media {media_id}: {e}")
+                results.append((media_id, thumb_path, False))
+        return results
+
+    results = await run_in_threadpool(run_jobs)
+
+    updates = [
+        {'id': media_id, 'thumbnail_path': str(thumb_path.relative_to(settings.BASE_DIR))}
+        for media_id, thumb_path, generated in results if generated
+    ]
+    if updates:
+        db.bulk_update_mappings(Media, updates)
+        db.commit()
+        invalidate_media_cache()
+
+    return {
+        "processed": len(jobs),
+        "regenerated": len(updates),
+        "failed": len(jobs) - len(updates)
+    }
+
+@router.post("/near-duplicates")
+async def start_near_duplicate_report(
+    distance: int = DEFAULT_NEAR_DUPLICATE_DISTANCE,
+    current_user: User = Depends(require_admin_mode)
+):
+    """Start a job that groups the library into near-duplicate clusters"""
+    from ..services.jobs import job_manager
+    from ..services.phash_index import run_near_duplicate_report
+
+    if distance < 0 or distance > MAX_NEAR_DUPLICATE_DISTANCE:
+        raise HTTPException(status_code=400, detail=f"Distance must be between 0 and {MAX_NEAR_DUPLICATE_DISTANCE}")
+
+    job = job_manager.find_running("near_duplicate_report")
+    if not job:
+        job = job_manager.start("near_duplicate_report", run_near_duplicate_report, distance)
+
+    return {"job_id": job.id}
+
+@router.post("/rebuild-related-tags")
+async def start_related_tags_rebuild(
+    current_user: User = Depends(require_admin_mode)
+):
+    """Start a job that recomputes tag co-occurrence for related-tag lookups"""
+    from ..services.jobs import job_manager
+    from ..services.tag_cooccurrence import run_cooccurrence_rebuild
+
+    job = job_manager.find_running("tag_cooccurrence_rebuild")
+    if not job:
+        job = job_manager.start("tag_cooccurrence_rebuild", run_cooccurrence_rebuild)
+
+    return {"job_id": job.id}
+
+@router.post("/reconcile-tag-counts")
+async def reconcile_tag_post_counts(
+    current_user: User = Depends(require_admin_mode),
+    db: Session = Depends(get_db)
+):
+    """Recount tag post counts to fix any drift from the incremental updates"""
+    from ..utils.cache import invalidate_tag_cache
+
+    fixed = reconcile_tag_counts(db)
+    db.commit()
+
+    if fixed:
+        invalidate_tag_cache(rebuild_index=True)
+
+    return {"fixed": fixed}
+
 @router.get("/media-stats")
 async def get_media_stats(
     current_user: User = Depends(get_current_admin_user),
@@ -653,242 +798,23 @@ async def get_comprehensive_stats(
     }
 
 
-def import_tags_csv_logic(csv_text: str, db: Session):
-    """
-    Core logic for importing tags from CSV content.
-    Returns a dict with import statistics.
-    """
-    import csv
-    import io
-    from ..models import Tag, TagAlias
-    
-    category_map = {
-        0: 'general',
-        1: 'artist',
-        3: 'copyright',
-        4: 'character',
-        5: 'meta'
-    }
-    
-    MAX_TAG_LENGTH = 255
-    MAX_ALIAS_LENGTH = 255
-    
-    tags_created = 0
-    aliases_created = 0
-    tags_updated = 0
-    errors = []
-    skipped_long_tags = 0
-    skipped_long_aliases = 0
-    
-    BATCH_SIZE = 1000
-    
-    # PASS 1: Import tags only
-    print("Pass 1: Importing tags...")
-    csv_reader = csv.reader(io.StringIO(csv_text))
-    
-    tag_data = []
-    tags_to_create = []
-    rows_processed = 0
-    existing_tags = {tag.name: tag for tag in db.query(Tag).all()}
-    
-    for row_num, row in enumerate(csv_reader, 1):
-        try:
-            if len(row) < 2:
-                continue
-            
-            tag_name = row[0].strip().lower()
-            if not tag_name:
-                continue
-            
-            if len(tag_name) > MAX_TAG_LENGTH:
-                skipped_long_tags += 1
-                errors.append({"key": "notifications.admin.error_tag_too_long", "row": row_num, "tag": tag_name[:50], "length": len(tag_name)})
-                continue
-            
-            try:
-                category_num = int(row[1])
-            except (ValueError, IndexError):
-                errors.append({"key": "notifications.admin.error_invalid_category", "row": row_num})
-                continue
-            
-            aliases_str = row[3] if len(row) > 3 else ""
-            category = category_map.get(category_num, 'general')
-            
-            tag_data.append((tag_name, category, aliases_str))
-            
-            if tag_name in existing_tags:
-                tag = existing_tags[tag_name]
-                if tag.category != category:
-                    tag.category = category
-                    tags_updated += 1
-            else:
-                tags_to_create.append({
-                    'name': tag_name,
-                    'category': category,
-                    'post_count': 0
-                })
-                tags_created += 1
-            
-            rows_processed += 1
-            
-            if rows_processed % BATCH_SIZE == 0:
-                try:
-                    if tags_to_create:
-                        db.bulk_insert_mappings(Tag, tags_to_create)
-                        tags_to_create = []
-                    
-                    db.commit()
-                    print(f"Pass 1: Processed {rows_processed} tags...")
-                    db.expire_all()
-                except Exception as e:
-                    db.rollback()
-                    errors.append({"key": "notifications.admin.error_batch_error", "row": row_num, "error": str(e)})
-                    tags_to_create = []
-                    existing_tags = {tag.name: tag for tag in db.query(Tag).all()}
-        
-        except Exception as e:
-            errors.append({"key": "notifications.admin.error_row_error", "row": row_num, "error": str(e)})
-            continue
-    
-    # Final commit for pass 1
-    try:
-        if tags_to_create:
-            db.bulk_insert_mappings(Tag, tags_to_create)
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        errors.append({"key": "notifications.admin.error_final_batch_pass1", "error": str(e)})
-    
-    print(f"Pass 1 complete: {tags_created} tags created, {tags_updated} updated, {skipped_long_tags} skipped")
-    
-    existing_tags = None
-    tags_to_create = None
-    db.expire_all()
-    
-    # PASS 2: Import aliases
-    print("Pass 2: Importing aliases...")
-    print("Building tag mapping...")
-    tag_map = {}
-    offset = 0
-    chunk_size = 10000
-    
-    while True:
-        tags_chunk = db.query(Tag.name, Tag.id).limit(chunk_size).offset(offset).all()
-        if not tags_chunk:
-            break
-        
-        for name, tag_id in tags_chunk:
-            tag_map[name] = tag_id
-        
-        offset += chunk_size
-        if offset % 50000 == 0:
-            print(f"Loaded {offset} tag mappings...")
-    
-    print(f"Tag mapping complete: {len(tag_map)} tags")
-    
-    existing_aliases = {alias.alias_name for alias in db.query(TagAlias.alias_name).all()}
-    aliases_to_create = []
-    rows_processed = 0
-    
-    for tag_name, category, aliases_str in tag_data:
-        try:
-            if not aliases_str or tag_name not in tag_map:
-                continue
-            
-            tag_id = tag_map[tag_name]
-            
-            alias_names = set()
-            for a in aliases_str.split(','):
-                alias = a.strip().lower()
-                if not alias or alias == tag_name:
-                    continue
-                
-                if len(alias) > MAX_ALIAS_LENGTH:
-                    skipped_long_aliases += 1
-                    continue
-                
-                alias_names.add(alias)
-            
-            for alias_name in alias_names:
-                if alias_name not in existing_aliases:
-                    aliases_to_create.append({
-                        'alias_name': alias_name,
-                        'target_tag_id': tag_id
-                    })
-                    existing_aliases.add(alias_name)
-                    aliases_created += 1
-            
-            rows_processed += 1
-            
-            if rows_processed % BATCH_SIZE == 0:
-                try:
-                    if aliases_to_create:
-                        db.bulk_insert_mappings(TagAlias, aliases_to_create)
-                        aliases_to_create = []
-                    
-                    db.commit()
-                    print(f"Pass 2: Processed {rows_processed} tags, created {aliases_created} aliases...")
-                    db.expire_all()
-                except IntegrityError as e:
-                    db.rollback()
-                    errors.append({"key": "notifications.admin.error_alias_batch_integrity", "row": rows_processed, "error": str(e)})
-                    aliases_to_create = []
-                    existing_aliases = {alias.alias_name for alias in db.query(TagAlias.alias_name).all()}
-                except Exception as e:
-                    db.rollback()
-                    errors.append({"key": "notifications.admin.error_alias_batch", "row": rows_processed, "error": str(e)})
-                    aliases_to_create = []
-                    existing_aliases = {alias.alias_name for alias in db.query(TagAlias.alias_name).all()}
-        
-        except Exception as e:
-            errors.append({"key": "notifications.admin.error_pass2_tag", "tag": tag_name, "error": str(e)})
-            continue
-    
-    # Final commit for pass 2
-    try:
-        if aliases_to_create:
-            db.bulk_insert_mappings(TagAlias, aliases_to_create)
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        errors.append({"key": "notifications.admin.error_final_batch_pass2", "error": str(e)})
-    
-    print(f"Pass 2 complete: {aliases_created} aliases created, {skipped_long_aliases} skipped")
-    
-    return {
-        "message_key": "notifications.admin.tags_imported",
-        "tags_created": tags_created,
-        "tags_updated": tags_updated,
-        "aliases_created": aliases_created,
-        "rows_processed": len(tag_data),
-        "skipped_long_tags": skipped_long_tags,
-        "skipped_long_aliases": skipped_long_aliases,
-        "errors": errors[:20] if errors else [],
-        "total_errors": len(errors)
-    }
-
 @router.post("/import-tags-csv")
 async def import_tags_csv(
     file: UploadFile = File(...),
-    current_user: User = Depends(require_admin_mode),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(require_admin_mode)
 ):
-    """Import tags from CSV file (two-pass, non-streaming)"""
+    """Stage an uploaded tag CSV and import it in a background job"""
+    from ..services.jobs import job_manager
+    from ..services.tag_import import run_tags_csv_import
     
     if not current_user:
         raise HTTPException(status_code=401, detail="Authentication required")
-        
-    try:
-        contents = await file.read()
-        csv_text = contents.decode('utf-8')
-        
-        result = import_tags_csv_logic(csv_text, db)
-        return result
     
-    except Exception as e:
-        db.rollback()
-        print(f"Error during import: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Error importing CSV: {str(e)}")
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp:
+        shutil.copyfileobj(file.file, tmp)
+    
+    job = job_manager.start("tags_csv_import", run_tags_csv_import, tmp.name)
+    return {"job_id": job.id}
 
 @router.get("/tag-stats")
 async def get_tag_stats(
@@ -928,12 +854,14 @@ async def clear_all_tags(
 ):
     """Clear all tags"""
     from ..models import Tag, TagAlias
+    from ..utils.cache import invalidate_tag_cache
     
     try:
         db.query(TagAlias).delete()
         db.query(Tag).delete()
         
         db.commit()
+        invalidate_tag_cache(rebuild_index=True)
         
         return {"message_key": "notifications.admin.tags_cleared"}
     except Exception as e:
@@ -948,6 +876,7 @@ async def delete_tag(
 ):
     """Delete a single tag and its aliases"""
     from ..models import Tag
+    from ..utils.cache import invalidate_tag_cache
     
     try:
         tag = db.query(Tag).filter(Tag.id == tag_id).first()
@@ -960,6 +889,7 @@ async def delete_tag(
         # Delete the tag (aliases will be deleted automatically due to CASCADE)
         db.delete(tag)
         db.commit()
+        invalidate_tag_cache(rebuild_index=True)
         
         return {"message_key": "notifications.admin.tag_deleted", "tag_name": tag_name}
     
@@ -1026,31 +956,36 @@ async def bulk_create_tags(
     created = 0
     skipped = 0
     errors = []
+    categories = {}
     
     for tag_data in tags_to_create:
         try:
             tag_name = tag_data['name'].lower().strip()
             if not tag_name:
                 continue
-
-            category = tag_data.get('category', 'general')
-            
-            existing = db.query(Tag).filter(Tag.name == tag_name).first()
-            if existing:
+            if tag_name in categories:
                 skipped += 1
                 continue
-            
-            alias = db.query(TagAlias).filter(TagAlias.alias_name == tag_name).first()
-            if alias:
-                skipped += 1
-                continue
-            
-            tag = Tag(name=tag_name, category=category)
-            db.add(tag)
-            created += 1
+
+            category = tag_data.get('category', 'general')
+            categories[tag_name] = TagCategoryEnum(category)
             
         except Exception as e:
             errors.append({"key": "notifications.admin.error_creating_tag", "tag": tag_data.get('name'), "error": str(e)})
+    
+    if categories:
+        names = list(categories.keys())
+        existing = {name for (name,) in db.query(Tag.name).filter(Tag.name.in_(names)).all()}
+        aliased = {name for (name,) in db.query(TagAlias.alias_name).filter(TagAlias.alias_name.in_(names)).all()}
+        new_names = [name for name in names if name not in existing and name not in aliased]
+        skipped += len(names) - len(new_names)
+        
+        if new_names:
+            try:
+                created = len(get_or_create_tags(db, new_names, categories))
+            except Exception as e:
+                db.rollback()
+                raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
             
     try:
         db.commit()
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Dict, Optional, List
 from pydantic import BaseModel
 from pathlib import Path
 import logging
@@ -9,13 +9,16 @@ import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import json
 import os
+import threading
 import time
 
 from ..database import get_db
 from ..auth import require_admin_mode
 from ..models import Media, User
 from ..services.wd_tagger import get_wd_tagger, WDTagger
+from ..services.tagger_cache import predict_scores
 from ..config import settings
+from ..utils.file_scanner import iter_media_files
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +27,13 @@ router = APIRouter(prefix="/api/ai-tagger", tags=["ai-tagger"])
 # Dedicated thread pool for inference
 _inference_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="wd_inference")
 
+# Seconds before a filename index miss schedules another walk of ORIGINAL_DIR
+FILENAME_INDEX_TTL = 300
+# Seconds between client disconnect checks while waiting for a batch
+DISCONNECT_CHECK_INTERVAL = 1.0
+# Marks the end of a prediction stream
+_STREAM_DONE = object()
+
 def shutdown_tagger_resources():
     """Cleanup tagger resources on application shutdown."""
     logger.info("Shutting down AI tagger resources...")
@@ -35,20 +45,83 @@ def shutdown_tagger_resources():
         logger.error(f"Error shutting down WD tagger: {e}")
 
 
-def find_media_file(filename: str) -> Optional[Path]:
-    """Find a media file in ORIGINAL_DIR or its subdirectories."""
-    direct_path = settings.ORIGINAL_DIR / filename
-    if direct_path.exists():
-        return direct_path
+class _FilenameIndex:
+    """
+    Filename -> path under ORIGINAL_DIR, for legacy rows whose stored path is
+    stale. Built with one directory walk in a background thread at startup.
+    Lookups never walk the directory: a miss only schedules a rebuild, at
+    most once per FILENAME_INDEX_TTL seconds, and the media counts as not
+    found until the rebuild has finished.
+    """
+    
+    def __init__(self):
+        self._paths: Dict[str, Path] = {}
+        self._built_at: Optional[float] = None
+        self._rebuilding = False
+        self._lock = threading.Lock()
+    
+    def _build(self):
+        try:
+            paths = {}
+            for path, _ in iter_media_files(settings.ORIGINAL_DIR):
+                paths.setdefault(path.name, path)
+            self._paths = paths
+            logger.info(f"Media filename index built ({len(paths)} files)")
+        except Exception as e:
+            logger.error(f"Media filename index build failed: {e}")
+        finally:
+            with self._lock:
+                self._built_at = time.monotonic()
+                self._rebuilding = False
     
-    if '/' in filename or '\\' in filename:
-        return direct_path if direct_path.exists() else None
+    def schedule_rebuild(self):
+        """Walk ORIGINAL_DIR in a background thread unless a walk is already running"""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._build, name="media-filename-index", daemon=True).start()
     
-    for path in settings.ORIGINAL_DIR.rglob(filename):
-        if path.is_file():
+    def lookup(self, filename: str) -> Optional[Path]:
+        path = self._paths.get(filename)
+        if path is not None and path.is_file():
             return path
+        if self._built_at is None or time.monotonic() - self._built_at > FILENAME_INDEX_TTL:
+            self.schedule_rebuild()
+        return None
+
+
+_filename_index = _FilenameIndex()
+
+
+def schedule_filename_index_rebuild():
+    """Build the filename index off the event loop (called on startup)."""
+    _filename_index.schedule_rebuild()
+
+
+def find_media_file(media: Media) -> Optional[Path]:
+    """Resolve a media file from its stored path, falling back to the filename index."""
+    if media.path:
+        stored_path = settings.BASE_DIR / media.path
+        if stored_path.is_file():
+            return stored_path
+    
+    direct_path = settings.ORIGINAL_DIR / media.filename
+    if direct_path.is_file():
+        return direct_path
     
-    return None
+    if '/' in media.filename or '\\' in media.filename:
+        return None
+    
+    return _filename_index.lookup(media.filename)
+
+
+async def find_media_files(media_records: List[Media]) -> Dict[int, Optional[Path]]:
+    """Resolve the files of several media in a worker thread, keyed by media ID."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, lambda: {media.id: find_media_file(media) for media in media_records}
+    )
 
 
 class PredictTagsRequest(BaseModel):
@@ -104,6 +177,10 @@ async def get_tagger_status():
             "available": True,
             "loaded": tagger.is_loaded,
             "current_model": tagger.current_model,
+            "model_variant": tagger.current_variant,
+            "configured_model_variant": settings.AI_TAGGER_MODEL_VARIANT,
+            "model_variant_error": tagger.variant_error,
+            "optimal_batch_size": tagger.get_optimal_batch_size() if tagger.is_loaded else None,
             "available_models": list(WDTagger.AVAILABLE_MODELS.keys()),
         }
     except ImportError as e:
@@ -163,7 +240,7 @@ async def get_model_status(
             is_downloaded=is_downloaded,
             is_loaded=is_loaded,
             download_size_mb=model_sizes.get(model_name),
-            optimal_batch_size=WDTagger.OPTIMAL_BATCH_SIZES.get(model_name)
+            optimal_batch_size=tagger.get_optimal_batch_size(model_name)
         )
         
     except ImportError as e:
@@ -221,7 +298,7 @@ async def predict_tags(
     if not media:
         raise HTTPException(status_code=404, detail="Media not found")
     
-    file_path = find_media_file(media.filename)
+    file_path = (await find_media_files([media]))[media.id]
     
     if not file_path:
         raise HTTPException(
@@ -232,17 +309,21 @@ async def predict_tags(
     try:
         loop = asyncio.get_event_loop()
         
+        media_hash = media.hash
+        
         def do_predict():
             tagger = get_wd_tagger()
-            tagger.ensure_loaded(request.model_name)
-            return tagger.predict_from_file(
-                str(file_path),
-                general_threshold=request.general_threshold,
-                character_threshold=request.character_threshold,
-                hide_rating_tags=request.hide_rating_tags,
-                character_tags_first=request.character_tags_first,
-                model_name=request.model_name
-            )
+            for _, scores in predict_scores([(media_id, media_hash, str(file_path))], request.model_name):
+                if scores is None:
+                    return []
+                return tagger.tags_from_scores(
+                    scores,
+                    general_threshold=request.general_threshold,
+                    character_threshold=request.character_threshold,
+                    hide_rating_tags=request.hide_rating_tags,
+                    character_tags_first=request.character_tags_first
+                )
+            return []
         
         predictions = await loop.run_in_executor(_inference_executor, do_predict)
         
@@ -294,6 +375,7 @@ async def predict_tags_batch(
     # Fetch all media records at once
     media_records = db.query(Media).filter(Media.id.in_(request.media_ids)).all()
     media_map = {m.id: m for m in media_records}
+    file_paths = await find_media_files(media_records)
     
     # Build file path list
     file_info = []
@@ -305,13 +387,13 @@ async def predict_tags_batch(
             continue
         
         media = media_map[media_id]
-        file_path = find_media_file(media.filename)
+        file_path = file_paths[media_id]
         
         if not file_path:
             not_found.append(media_id)
             continue
         
-        file_info.append((media_id, str(file_path)))
+        file_info.append((media_id, media.hash, str(file_path)))
     
     if not file_info:
         return BatchPredictResponse(
@@ -326,33 +408,28 @@ async def predict_tags_batch(
         
         def do_batch_predict():
             tagger = get_wd_tagger()
-            tagger.ensure_loaded(request.model_name)
-            
-            file_paths = [fp for _, fp in file_info]
-            
-            return tagger.predict_from_files_batch(
-                file_paths,
-                general_threshold=request.general_threshold,
-                character_threshold=request.character_threshold,
-                hide_rating_tags=request.hide_rating_tags,
-                character_tags_first=request.character_tags_first,
-                model_name=request.model_name
-            )
+            predictions = {}
+            for media_id, scores in predict_scores(file_info, request.model_name):
+                predictions[media_id] = [] if scores is None else tagger.tags_from_scores(
+                    scores,
+                    general_threshold=request.general_threshold,
+                    character_threshold=request.character_threshold,
+                    hide_rating_tags=request.hide_rating_tags,
+                    character_tags_first=request.character_tags_first
+                )
+            return predictions
         
         predictions = await loop.run_in_executor(_inference_executor, do_batch_predict)
         
-        # Build results
-        results = []
-        path_to_media_id = {fp: mid for mid, fp in file_info}
-        
-        for file_path, tags in predictions:
-            media_id = path_to_media_id.get(file_path)
-            if media_id is not None:
-                results.append(PredictTagsResponse(
-                    media_id=media_id,
-                    tags=[PredictedTag(**tag) for tag in tags],
-                    model_used=request.model_name
-                ))
+        # Build results in request order
+        results = [
+            PredictTagsResponse(
+                media_id=media_id,
+                tags=[PredictedTag(**tag) for tag in predictions.get(media_id, [])],
+                model_used=request.model_name
+            )
+            for media_id, _, _ in file_info
+        ]
         
         processing_time = (time.time() - start_time) * 1000
         
@@ -395,10 +472,10 @@ async def predict_tags_stream(
     # Fetch media records
     media_records = db.query(Media).filter(Media.id.in_(batch_request.media_ids)).all()
     media_map = {m.id: m for m in media_records}
+    file_paths = await find_media_files(media_records)
     
     # Build file info
     file_info = []
-    path_to_id = {}
     failed_ids = []
     
     for media_id in batch_request.media_ids:
@@ -407,12 +484,10 @@ async def predict_tags_stream(
             continue
         
         media = media_map[media_id]
-        file_path = find_media_file(media.filename)
+        file_path = file_paths[media_id]
         
         if file_path:
-            path_str = str(file_path)
-            file_info.append((media_id, path_str))
-            path_to_id[path_str] = media_id
+            file_info.append((media_id, media.hash, str(file_path)))
         else:
             failed_ids.append(media_id)
     
@@ -430,28 +505,56 @@ async def predict_tags_stream(
             yield f"data: {json.dumps({'type': 'complete', 'total': 0})}\n\n"
             return
         
+        total = len(file_info)
+        processed = 0
+        
+        # Preprocessing and inference run in a worker thread; results are
+        # handed to this generator through a queue so the event loop stays free
+        loop = asyncio.get_running_loop()
+        results: asyncio.Queue = asyncio.Queue()
+        stop_event = threading.Event()
+        
+        def produce():
+            try:
+                tagger = get_wd_tagger()
+                for media_id, scores in predict_scores(file_info, batch_request.model_name, stop_event):
+                    tags = [] if scores is None else tagger.tags_from_scores(
+                        scores,
+                        general_threshold=batch_request.general_threshold,
+                        character_threshold=batch_request.character_threshold,
+                        hide_rating_tags=batch_request.hide_rating_tags,
+                        character_tags_first=batch_request.character_tags_first
+                    )
+                    loop.call_soon_threadsafe(results.put_nowait, (media_id, tags))
+                    if stop_event.is_set():
+                        break
+            except Exception as e:
+                loop.call_soon_threadsafe(results.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(results.put_nowait, _STREAM_DONE)
+        
+        loop.run_in_executor(_inference_executor, produce)
+        
         try:
-            tagger = get_wd_tagger()
-            tagger.ensure_loaded(batch_request.model_name)
-            
-            file_paths = [fp for _, fp in file_info]
-            total = len(file_paths)
-            processed = 0
-            
-            for file_path, tags in tagger.predict_from_files_streaming(
-                file_paths,
-                general_threshold=batch_request.general_threshold,
-                character_threshold=batch_request.character_threshold,
-                hide_rating_tags=batch_request.hide_rating_tags,
-                character_tags_first=batch_request.character_tags_first,
-                model_name=batch_request.model_name
-            ):
+            while True:
+                try:
+                    item = await asyncio.wait_for(results.get(), timeout=DISCONNECT_CHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    item = None
+                
                 # Check for client disconnect
                 if await request.is_disconnected():
                     logger.info("Client disconnected, stopping stream")
                     return
                 
-                media_id = path_to_id.get(file_path)
+                if item is None:
+                    continue
+                if item is _STREAM_DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                
+                media_id, tags = item
                 processed += 1
                 
                 event = {
@@ -469,6 +572,8 @@ async def predict_tags_stream(
         except Exception as e:
             logger.error(f"Error in streaming prediction: {e}", exc_info=True)
             yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+        finally:
+            stop_event.set()
     
     return StreamingResponse(
         generate(),
@@ -514,3 +619,35 @@ async def load_model(
     except Exception as e:
         logger.error(f"Error loading model {model_name}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/calibrate/{model_name}")
+async def calibrate_model(
+    model_name: str,
+    current_user: User = Depends(require_admin_mode)
+):
+    """Measure the best batch size and thread counts for a model on this host (blocking)."""
+    if model_name not in WDTagger.AVAILABLE_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown model: {model_name}")
+    
+    try:
+        loop = asyncio.get_event_loop()
+        config = await loop.run_in_executor(_inference_executor, get_wd_tagger().calibrate, model_name)
+        
+        return {
+            "success": True,
+            "model": model_name,
+            "optimal_batch_size": config["batch_size"],
+            "calibration": config,
+            "message": f"Model {model_name} calibrated: batch size {config['batch_size']}, "
+                       f"{config['images_per_sec']} images/sec"
+        }
+    
+    except ImportError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"AI Tagger dependencies not installed: {str(e)}"
+        )
+    except Exception as e:
+        logger.error(f"Error calibrating model {model_name}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
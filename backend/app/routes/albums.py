@@ -6,20 +6,21 @@ from datetime import datetime
 import random
 from ..database import get_db
 from ..models import Album, Media, RatingEnum, blombooru_album_media, blombooru_album_hierarchy
-from ..schemas import AlbumCreate, AlbumUpdate, AlbumResponse, AlbumListResponse, MediaIds
+from ..schemas import AlbumCreate, AlbumUpdate, AlbumResponse, AlbumListResponse, MediaIds, AlbumMediaBulk, AlbumMediaMove
 from ..auth import get_current_admin_user, require_admin_mode, User
 from ..config import settings
 from ..utils.cache import cache_response, invalidate_album_cache
 from ..utils.album_utils import (
-    get_album_rating,
-    get_album_tags,
-    get_random_thumbnails,
     update_album_last_modified,
+    update_albums_last_modified,
+    add_media_to_albums,
+    remove_media_from_albums,
     get_parent_ids,
-    get_media_count,
     get_album_popular_tags,
-    get_bulk_album_metrics
+    refresh_album_aggregates
 )
+from ..services.album_covers import get_cover_thumbnail_map
+from ..utils.album_hierarchy import get_ancestor_ids, get_descendant_ids, is_descendant, rebuild_album_closure
 
 router = APIRouter(prefix="/api/albums", tags=["albums"])
 
@@ -31,6 +32,34 @@ def get_effective_limit(limit: Optional[int]) -> int:
     return limit
 
 
+def get_allowed_ratings(rating: Optional[str]) -> Optional[List[RatingEnum]]:
+    """Ratings visible under a max-rating filter, or None when nothing is filtered"""
+    if not rating or rating == "explicit":
+        return None
+    return {
+        "safe": [RatingEnum.safe],
+        "questionable": [RatingEnum.safe, RatingEnum.questionable]
+    }.get(rating)
+
+
+def album_list_responses(albums: List[Album], db: Session) -> List[AlbumListResponse]:
+    """List entries built from the albums' stored aggregates and sampled covers"""
+    thumbnails = get_cover_thumbnail_map(db, albums)
+    return [album_list_response(album, thumbnails.get(album.id, [])) for album in albums]
+
+
+def album_list_response(album: Album, thumbnails: List[str]) -> AlbumListResponse:
+    """List entry built from the album's stored aggregates"""
+    return AlbumListResponse(
+        id=album.id,
+        name=album.name,
+        last_modified=album.last_modified,
+        thumbnail_paths=thumbnails,
+        rating=album.max_rating,
+        media_count=album.media_count
+    )
+
+
 @router.get("", response_model=dict)
 @cache_response(expire=3600, key_prefix="album_list")
 async def get_albums(
@@ -65,46 +94,19 @@ async def get_albums(
     else:
         query = query.order_by(asc(sort_column))
     
-    # Get all albums
-    all_albums = query.all()
-    all_album_ids = [a.id for a in all_albums]
-    all_metrics = get_bulk_album_metrics(all_album_ids, db)
-    
-    # Filter and build list
-    filtered_albums = []
-    for album in all_albums:
-        metrics = all_metrics.get(album.id, {'rating': RatingEnum.safe, 'count': 0})
-        album_rating = metrics['rating']
-        
-        # Apply rating filter (max rating logic)
-        if rating and rating != "explicit":
-            if rating == "safe" and album_rating != RatingEnum.safe:
-                continue
-            if rating == "questionable" and album_rating == RatingEnum.explicit:
-                continue
-        
-        filtered_albums.append((album, album_rating, metrics['count']))
+    # Apply rating filter (max rating logic)
+    allowed_ratings = get_allowed_ratings(rating)
+    if allowed_ratings is not None:
+        query = query.filter(Album.max_rating.in_(allowed_ratings))
     
-    total = len(filtered_albums)
+    total = query.count()
     
-    # Paginate the filtered list
-    start = (page - 1) * limit
-    end = start + limit
-    paginated_albums = filtered_albums[start:end]
+    # Paginate in SQL
+    offset = (page - 1) * limit
+    albums = query.offset(offset).limit(limit).all()
     
     # Build response
-    album_list = []
-    for album, album_rating, media_count in paginated_albums:
-        thumbnails = get_random_thumbnails(album.id, db, count=4)
-        
-        album_list.append(AlbumListResponse(
-            id=album.id,
-            name=album.name,
-            last_modified=album.last_modified,
-            thumbnail_paths=thumbnails,
-            rating=album_rating,
-            media_count=media_count
-        ))
+    album_list = album_list_responses(albums, db)
     
     return {
         "items": album_list,
@@ -125,8 +127,6 @@ async def get_album(
         raise HTTPException(status_code=404, detail="Album not found")
     
     # Compute fields
-    album_rating = get_album_rating(album.id, db)
-    media_count = get_media_count(album.id, db)
     children_count = db.query(func.count(blombooru_album_hierarchy.c.child_album_id)).filter(
         blombooru_album_hierarchy.c.parent_album_id == album_id
     ).scalar()
@@ -138,9 +138,9 @@ async def get_album(
         created_at=album.created_at,
         updated_at=album.updated_at,
         last_modified=album.last_modified,
-        media_count=media_count,
+        media_count=album.media_count,
         children_count=children_count,
-        rating=album_rating,
+        rating=album.max_rating,
         parent_ids=parent_ids
     )
 
@@ -171,6 +171,7 @@ async def create_album(
             )
         )
     
+    rebuild_album_closure(db, [new_album.id])
     db.commit()
     db.refresh(new_album)
     
@@ -216,6 +217,14 @@ async def update_album(
             parent = db.query(Album).filter(Album.id == album_data.parent_album_id).first()
             if not parent:
                 raise HTTPException(status_code=404, detail="Parent album not found")
+            
+            # A descendant cannot become the parent
+            if is_descendant(db, album_data.parent_album_id, album_id):
+                raise HTTPException(status_code=400, detail="Album cannot be moved into one of its sub-albums")
+        
+        # Every album below this one gets new ancestors
+        subtree_ids = get_descendant_ids(db, album_id)
+        old_ancestor_ids = get_ancestor_ids(db, album_id)
         
         # Remove old parent relationship
         db.execute(
@@ -232,6 +241,10 @@ async def update_album(
                     child_album_id=album_id
                 )
             )
+        
+        rebuild_album_closure(db, subtree_ids)
+        # Old and new ancestors gain or lose this subtree's media
+        refresh_album_aggregates(db, old_ancestor_ids + [album_id])
     
     db.commit()
     db.refresh(album)
@@ -253,21 +266,13 @@ async def delete_album(
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
     
+    descendant_ids = get_descendant_ids(db, album_id, include_self=False)
+    ancestor_ids = [aid for aid in get_ancestor_ids(db, album_id) if aid not in descendant_ids]
+    
     if cascade:
-        # Delete child albums recursively
-        def delete_children(parent_id: int):
-            children = db.query(blombooru_album_hierarchy.c.child_album_id).filter(
-                blombooru_album_hierarchy.c.parent_album_id == parent_id
-            ).all()
-            
-            for child_tuple in children:
-                child_id = child_tuple[0]
-                delete_children(child_id)
-                child_album = db.query(Album).filter(Album.id == child_id).first()
-                if child_album:
-                    db.delete(child_album)
-        
-        delete_children(album_id)
+        # Delete all descendant albums; their closure rows go with them
+        if descendant_ids:
+            db.query(Album).filter(Album.id.in_(descendant_ids)).delete(synchronize_session=False)
     else:
         # Just remove parent relationships for children (orphan them)
         db.execute(
@@ -277,6 +282,11 @@ async def delete_album(
         )
     
     db.delete(album)
+    db.flush()
+    
+    if not cascade:
+        rebuild_album_closure(db, descendant_ids)
+    refresh_album_aggregates(db, ancestor_ids)
     db.commit()
     
     # Invalidate cache
@@ -284,6 +294,54 @@ async def delete_album(
     
     return {"message": "Album deleted successfully"}
 
+@router.post("/media/add")
+async def add_media_to_albums_bulk(
+    data: AlbumMediaBulk,
+    current_user: User = Depends(require_admin_mode),
+    db: Session = Depends(get_db)
+):
+    """Add media items to several albums at once (admin only)"""
+    album_ids = [a_id for (a_id,) in db.query(Album.id).filter(Album.id.in_(data.album_ids)).all()]
+    if not album_ids:
+        raise HTTPException(status_code=404, detail="Album not found")
+    
+    added_count = add_media_to_albums(db, album_ids, data.media_ids)
+    update_albums_last_modified(album_ids, db)
+    invalidate_album_cache()
+    
+    return {
+        "message": f"Added {added_count} media item(s) to {len(album_ids)} album(s)",
+        "added": added_count,
+        "album_ids": album_ids
+    }
+
+@router.post("/media/move")
+async def move_media_between_albums(
+    data: AlbumMediaMove,
+    current_user: User = Depends(require_admin_mode),
+    db: Session = Depends(get_db)
+):
+    """Move media items from one album to another (admin only)"""
+    if data.source_album_id == data.target_album_id:
+        raise HTTPException(status_code=400, detail="Source and target album are the same")
+    
+    album_ids = [data.source_album_id, data.target_album_id]
+    if db.query(func.count(Album.id)).filter(Album.id.in_(album_ids)).scalar() != 2:
+        raise HTTPException(status_code=404, detail="Album not found")
+    
+    # Only media that is actually in the source album moves
+    media_ids = [m_id for (m_id,) in db.query(blombooru_album_media.c.media_id).filter(
+        blombooru_album_media.c.album_id == data.source_album_id,
+        blombooru_album_media.c.media_id.in_(data.media_ids)
+    ).all()]
+    
+    moved_count = remove_media_from_albums(db, [data.source_album_id], media_ids)
+    add_media_to_albums(db, [data.target_album_id], media_ids)
+    update_albums_last_modified(album_ids, db)
+    invalidate_album_cache()
+    
+    return {"message": f"Moved {moved_count} media item(s)", "moved": moved_count}
+
 @router.post("/{album_id}/media")
 async def add_media_to_album(
     album_id: int,
@@ -296,28 +354,7 @@ async def add_media_to_album(
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
     
-    added_count = 0
-    for media_id in data.media_ids:
-        media = db.query(Media).filter(Media.id == media_id).first()
-        if not media:
-            continue
-        
-        # Check if already in album
-        existing = db.query(blombooru_album_media).filter(
-            and_(
-                blombooru_album_media.c.album_id == album_id,
-                blombooru_album_media.c.media_id == media_id
-            )
-        ).first()
-        
-        if not existing:
-            db.execute(
-                blombooru_album_media.insert().values(
-                    album_id=album_id,
-                    media_id=media_id
-                )
-            )
-            added_count += 1
+    added_count = add_media_to_albums(db, [album_id], data.media_ids)
     
     # Update last_modified
     update_album_last_modified(album_id, db)
@@ -325,7 +362,7 @@ async def add_media_to_album(
     # Invalidate cache
     invalidate_album_cache()
     
-    return {"message": f"Added {added_count} media item(s) to album"}
+    return {"message": f"Added {added_count} media item(s) to album", "added": added_count}
 
 @router.delete("/{album_id}/media")
 async def remove_media_from_album(
@@ -339,14 +376,7 @@ async def remove_media_from_album(
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
     
-    db.execute(
-        blombooru_album_media.delete().where(
-            and_(
-                blombooru_album_media.c.album_id == album_id,
-                blombooru_album_media.c.media_id.in_(data.media_ids)
-            )
-        )
-    )
+    removed_count = remove_media_from_albums(db, [album_id], data.media_ids)
     
     # Update last_modified
     update_album_last_modified(album_id, db)
@@ -354,7 +384,7 @@ async def remove_media_from_album(
     # Invalidate cache
     invalidate_album_cache()
     
-    return {"message": "Media removed from album"}
+    return {"message": "Media removed from album", "removed": removed_count}
 
 
 @router.get("/{album_id}/contents")
@@ -394,12 +424,9 @@ async def get_album_contents(
     ).options(selectinload(Media.tags))
     
     # Filter Rating
-    if rating and rating != "explicit":
-        allowed_ratings = {
-            "safe": [RatingEnum.safe],
-            "questionable": [RatingEnum.safe, RatingEnum.questionable]
-        }
-        media_query = media_query.filter(Media.rating.in_(allowed_ratings.get(rating, [])))
+    allowed_ratings = get_allowed_ratings(rating)
+    if allowed_ratings is not None:
+        media_query = media_query.filter(Media.rating.in_(allowed_ratings))
     
     # Sort Media
     media_sort_mapping = {
@@ -435,6 +462,10 @@ async def get_album_contents(
         blombooru_album_hierarchy.c.parent_album_id == album_id
     )
     
+    # Filter Rating
+    if allowed_ratings is not None:
+        child_albums_query = child_albums_query.filter(Album.max_rating.in_(allowed_ratings))
+    
     # Sort Albums
     album_sort_mapping = {
         'name': Album.name,
@@ -451,39 +482,7 @@ async def get_album_contents(
     else:
         child_albums_query = child_albums_query.order_by(album_sort_column.desc())
 
-    child_albums = child_albums_query.all()
-    
-    # Build Album Response List (with rating logic)
-    child_album_list = []
-    
-    if child_albums:
-        child_ids = [c.id for c in child_albums]
-        all_metrics = get_bulk_album_metrics(child_ids, db)
-        
-        rating_priority = {RatingEnum.explicit: 3, RatingEnum.questionable: 2, RatingEnum.safe: 1}
-        # Safely get max_rating_val based on the rating filter
-        target_rating = RatingEnum(rating) if rating and rating in [r.value for r in RatingEnum] else RatingEnum.explicit
-        max_rating_val = rating_priority.get(target_rating, 3)
-        
-        for child in child_albums:
-            metrics = all_metrics.get(child.id, {'rating': RatingEnum.safe, 'count': 0})
-            child_rating = metrics['rating']
-            
-            # Skip if rating is too high for current filter
-            if rating and rating_priority.get(child_rating, 1) > max_rating_val:
-                continue
-                
-            thumbnails = get_random_thumbnails(child.id, db, count=4)
-            media_count = metrics['count']
-            
-            child_album_list.append(AlbumListResponse(
-                id=child.id,
-                name=child.name,
-                last_modified=child.last_modified,
-                thumbnail_paths=thumbnails,
-                rating=child_rating,
-                media_count=media_count
-            ))
+    child_album_list = album_list_responses(child_albums_query.all(), db)
     
     # Calculate total pages
     total_pages = max(1, (total_media + limit - 1) // limit)
@@ -528,23 +527,7 @@ async def get_child_albums(
         blombooru_album_hierarchy.c.parent_album_id == album_id
     ).all()
     
-    result = []
-    if children:
-        child_ids = [c.id for c in children]
-        all_metrics = get_bulk_album_metrics(child_ids, db)
-        
-        for child in children:
-            metrics = all_metrics.get(child.id, {'rating': RatingEnum.safe, 'count': 0})
-            thumbnails = get_random_thumbnails(child.id, db, count=4)
-            
-            result.append(AlbumListResponse(
-                id=child.id,
-                name=child.name,
-                last_modified=child.last_modified,
-                thumbnail_paths=thumbnails,
-                rating=metrics['rating'],
-                media_count=metrics['count']
-            ))
+    result = album_list_responses(children, db)
     
     return result
 
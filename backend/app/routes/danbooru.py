@@ -1,18 +1,20 @@
 from fastapi import APIRouter, Depends, Query, Request, HTTPException, Header
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from sqlalchemy.orm import Session, selectinload, load_only
-from sqlalchemy import desc, asc, case, exists, and_, or_, func
-from typing import List, Optional, Union, Set
-from collections import deque
+from sqlalchemy import desc, asc, exists, and_, or_, func
+from typing import List, Optional, Union
 from pathlib import Path
 import re
 
 from ..database import get_db
-from ..models import Media, Tag, TagAlias, User, Album, ApiKey, TagCategoryEnum, blombooru_album_media, blombooru_media_tags, blombooru_album_hierarchy
+from ..models import Media, Tag, TagAlias, User, Album, ApiKey, TagCategoryEnum, blombooru_album_media, blombooru_media_tags
 from ..config import settings
 from ..auth import verify_api_key
 from ..utils.search_parser import parse_search_query, apply_search_criteria
 from ..utils.cache import cache_response, invalidate_cache
+from ..utils.album_hierarchy import get_descendant_media_ids
+from ..services.tag_autocomplete import suggest_tags
+from ..services.tag_cooccurrence import get_related_counts
 
 # --- AUTHENTICATION ---
 
@@ -143,30 +145,10 @@ def format_artist_response(tag: Tag) -> dict:
 
 def get_flattened_media_ids(db: Session, root_album_id: int) -> List[int]:
     """
-    Recursively fetches media IDs for an album and all its descendants (children, grandchildren, etc.).
-    Returns a distinct list of media IDs.
+    Fetches media IDs for an album and all its descendants (children, grandchildren, etc.)
+    in a single recursive query. Returns a distinct, sorted list of media IDs.
     """
-    # 1. Collect all Album IDs in the hierarchy using deque for O(1) popleft
-    all_album_ids: Set[int] = {root_album_id}
-    queue = deque([root_album_id])
-    
-    while queue:
-        current_id = queue.popleft()
-        children = db.query(blombooru_album_hierarchy.c.child_album_id).filter(
-            blombooru_album_hierarchy.c.parent_album_id == current_id
-        ).all()
-        
-        for (cid,) in children:
-            if cid not in all_album_ids:
-                all_album_ids.add(cid)
-                queue.append(cid)
-
-    # Fetch all media IDs belonging to this set of albums
-    results = db.query(blombooru_album_media.c.media_id).filter(
-        blombooru_album_media.c.album_id.in_(all_album_ids)
-    ).distinct().all()
-    
-    return sorted(r[0] for r in results)
+    return get_descendant_media_ids(db, root_album_id)
 
 def format_media_response(media: Media, base_url: str) -> dict:
     """
@@ -492,6 +474,43 @@ async def get_tags_json(
 
     return results
 
+def query_related_counts(db: Session, tag_id: int, category: Optional[TagCategoryEnum], limit: int):
+    """Co-occurrence counts for one tag aggregated over blombooru_media_tags"""
+    # Use table aliases for efficient self-join query
+    # This avoids an IN subquery which can be slower on large datasets
+    t1 = blombooru_media_tags.alias('t1')
+    t2 = blombooru_media_tags.alias('t2')
+    
+    # Count co-occurrences using self-join:
+    # Find all tags (t2) that appear on the same media as the query tag (t1)
+    co_occurrence_counts = db.query(
+        t2.c.tag_id,
+        func.count().label('co_count')
+    ).select_from(t1).join(
+        t2, t1.c.media_id == t2.c.media_id
+    ).filter(
+        t1.c.tag_id == tag_id
+    ).group_by(
+        t2.c.tag_id
+    ).subquery()
+    
+    # Join with Tag table to get full tag details
+    related_query = db.query(
+        Tag, co_occurrence_counts.c.co_count
+    ).join(
+        co_occurrence_counts, Tag.id == co_occurrence_counts.c.tag_id
+    ).options(
+        load_only(Tag.id, Tag.name, Tag.post_count, Tag.category, Tag.created_at)
+    )
+    
+    if category is not None:
+        related_query = related_query.filter(Tag.category == category)
+    
+    # Order by co-occurrence count (descending) and limit results
+    return related_query.order_by(
+        desc(co_occurrence_counts.c.co_count)
+    ).limit(limit).all()
+
 @router.get("/related_tag.json")
 @cache_response(expire=3600, key_prefix="danbooru")
 async def get_related_tag_json(
@@ -548,45 +567,17 @@ async def get_related_tag_json(
             "related_tags": []
         }
     
-    # Use table aliases for efficient self-join query
-    # This avoids an IN subquery which can be slower on large datasets
-    t1 = blombooru_media_tags.alias('t1')
-    t2 = blombooru_media_tags.alias('t2')
-    
-    # Count co-occurrences using self-join:
-    # Find all tags (t2) that appear on the same media as the query tag (t1)
-    co_occurrence_counts = db.query(
-        t2.c.tag_id,
-        func.count().label('co_count')
-    ).select_from(t1).join(
-        t2, t1.c.media_id == t2.c.media_id
-    ).filter(
-        t1.c.tag_id == query_tag.id
-    ).group_by(
-        t2.c.tag_id
-    ).subquery()
-    
-    # Join with Tag table to get full tag details
-    related_query = db.query(
-        Tag, co_occurrence_counts.c.co_count
-    ).join(
-        co_occurrence_counts, Tag.id == co_occurrence_counts.c.tag_id
-    ).options(
-        load_only(Tag.id, Tag.name, Tag.post_count, Tag.category, Tag.created_at)
-    )
-    
-    # Optional category filter
+    cat_enum = None
     if category:
         try:
             cat_enum = TagCategoryEnum(category.lower())
-            related_query = related_query.filter(Tag.category == cat_enum)
         except ValueError:
             pass  # Invalid category, ignore filter
     
-    # Order by co-occurrence count (descending) and limit results
-    related_data = related_query.order_by(
-        desc(co_occurrence_counts.c.co_count)
-    ).limit(limit).all()
+    # Precomputed co-occurrence counts; tags not computed yet use a live query
+    related_data = get_related_counts(db, query_tag.id, cat_enum, limit)
+    if related_data is None:
+        related_data = query_related_counts(db, query_tag.id, cat_enum, limit)
     
     # Calculate similarity metrics and build response
     related_tags = []
@@ -638,26 +629,18 @@ async def get_autocomplete_json(
     if not query:
         return []
 
-    tags = db.query(Tag).options(
-        load_only(Tag.id, Tag.name, Tag.post_count, Tag.category)
-    ).filter(
-        Tag.name.ilike(f"%{query}%")
-    ).order_by(
-        case((Tag.name.ilike(f"{query}%"), 1), else_=2),
-        desc(Tag.post_count)
-    ).limit(limit).all()
+    tags = suggest_tags(db, query, limit)
 
     response_type = type or "tag_query"
     results = []
     for tag in tags:
-        c_val = tag.category.value if hasattr(tag.category, 'value') else str(tag.category)
-        category_id = CATEGORY_MAP.get(c_val.lower(), 0)
+        category_id = CATEGORY_MAP.get(tag["category"].lower(), 0)
         results.append({
             "type": response_type,
-            "label": f"{tag.name} ({tag.post_count})",
-            "value": tag.name,
+            "label": f"{tag['name']} ({tag['count']})",
+            "value": tag["name"],
             "category": category_id,
-            "post_count": tag.post_count
+            "post_count": tag["count"]
         })
     return results
 
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from ..auth import require_admin_mode
+from ..models import User
+from ..services.jobs import job_manager
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+def get_job_or_404(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: str,
+    current_user: User = Depends(require_admin_mode)
+):
+    """Get the current state of a background job"""
+    return get_job_or_404(job_id).to_dict()
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    current_user: User = Depends(require_admin_mode)
+):
+    """Follow a background job using Server-Sent Events"""
+    job = get_job_or_404(job_id)
+
+    return StreamingResponse(
+        job_manager.stream(job),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",  # Disable nginx buffering
+        }
+    )
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(
+    job_id: str,
+    current_user: User = Depends(require_admin_mode)
+):
+    """Request cancellation of a running job"""
+    job = get_job_or_404(job_id)
+    job.cancel()
+    return {"message": "Cancellation requested"}
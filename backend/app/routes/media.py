@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request
 from fastapi.responses import FileResponse
+import asyncio
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy import desc, text, or_, and_
 from typing import List, Optional
 import uuid
 import shutil
-import hashlib
 from pathlib import Path
 from PIL import Image
 import json
@@ -14,45 +15,26 @@ from ..auth import require_admin_mode, get_current_user
 from ..models import Media, Tag, User, blombooru_media_tags
 from ..schemas import MediaResponse, MediaUpdate, MediaCreate, RatingEnum
 from ..config import settings
-from ..utils.media_processor import process_media_file, calculate_file_hash
-from ..utils.thumbnail_generator import generate_thumbnail
+from ..utils.media_processor import calculate_file_hash
+from ..services.media_processing import media_processing
+from ..services.media_ingest import (
+    stage_stream, place_staged_file, thumbnail_path_for, build_media, parse_tag_names, parse_album_ids,
+    resolve_scanned_path, write_processed_media, discard_processed_files, is_tracked_path, is_archive_filename, run_archive_import
+)
+from ..services.jobs import job_manager
+from ..services.phash_index import phash_index, find_near_duplicates
+from ..services.album_covers import get_cover_thumbnail_map
 from ..utils.media_helpers import extract_image_metadata, serve_media_file, sanitize_filename, get_unique_filename, delete_media_cache
-from ..utils.album_utils import get_random_thumbnails, get_album_rating, get_media_count, update_album_last_modified
+from ..utils.tag_utils import get_or_create_tags, tag_count_deltas, apply_tag_count_deltas
+from ..utils.album_utils import (
+    album_media_added, album_media_rating_changed, unlink_media_from_all_albums, update_albums_last_modified
+)
 from ..models import Media, Tag, User, blombooru_media_tags, Album, blombooru_album_media
-from ..schemas import MediaResponse, MediaUpdate, MediaCreate, RatingEnum, AlbumListResponse, ShareSettingsUpdate
+from ..schemas import MediaResponse, MediaUploadResponse, MediaUpdate, MediaCreate, RatingEnum, AlbumListResponse, ShareSettingsUpdate
 from ..utils.cache import cache_response, invalidate_media_cache, invalidate_tag_cache, invalidate_album_cache, invalidate_media_item_cache
 
 router = APIRouter(prefix="/api/media", tags=["media"])
 
-def update_tag_counts(db: Session, tag_ids: List[int]):
-    """Update post counts for given tags"""
-    for tag_id in tag_ids:
-        count = db.query(blombooru_media_tags).filter(
-            blombooru_media_tags.c.tag_id == tag_id
-        ).count()
-        
-        db.query(Tag).filter(Tag.id == tag_id).update(
-            {"post_count": count},
-            synchronize_session=False
-        )
-        
-def get_or_create_tags(db: Session, tag_names: List[str]) -> List[Tag]:
-    """Get or create tags by name"""
-    tags = []
-    for name in tag_names:
-        name = name.strip().lower()
-        if not name:
-            continue
-        
-        tag = db.query(Tag).filter(Tag.name == name).first()
-        if not tag:
-            tag = Tag(name=name, post_count=0)
-            db.add(tag)
-            db.flush()
-        tags.append(tag)
-    
-    return tags
-
 @router.get("/")
 @cache_response(expire=300, key_prefix="media_list")
 async def get_media_list(
@@ -202,7 +184,7 @@ async def get_media_metadata(
     
     return extract_image_metadata(file_path)
 
-@router.post("/", response_model=MediaResponse)
+@router.post("/", response_model=MediaUploadResponse)
 async def upload_media(
     file: UploadFile = File(None),
     scanned_path: Optional[str] = Form(None),
@@ -214,109 +196,69 @@ async def upload_media(
     db: Session = Depends(get_db)
 ):
     """Upload new media"""
+    temp_path = None
     try:
         if scanned_path:
-            # SCANNED FILE 
-            file_path = Path(scanned_path)
+            # SCANNED FILE - must be within ORIGINAL_DIR
+            file_path = resolve_scanned_path(scanned_path)
             
-            # Security check - ensure file is within ORIGINAL_DIR
-            if not file_path.is_absolute():
-                raise HTTPException(status_code=400, detail="Invalid file path")
-            
-            try:
-                file_path = file_path.resolve()
-                file_path.relative_to(settings.ORIGINAL_DIR.resolve())
-            except (ValueError, FileNotFoundError):
-                raise HTTPException(status_code=403, detail="Access denied")
-            
-            if not file_path.exists() or not file_path.is_file():
-                raise HTTPException(status_code=404, detail="File not found")
-            
-            # Calculate hash from existing file
-            file_hash = calculate_file_hash(file_path)
-            unique_filename = file_path.name  # Keep original name
+            # Calculate hash from existing file (original name is kept)
+            file_hash = await media_processing.run(calculate_file_hash, file_path)
             
         else:
             # REGULAR UPLOAD
             if not file:
                 raise HTTPException(status_code=400, detail="Either file or scanned_path is required")
             
-            contents = await file.read()
-            file_hash = hashlib.sha256(contents).hexdigest()
-            media_uuid = str(uuid.uuid4())
-            
-            unique_filename = get_unique_filename(settings.ORIGINAL_DIR, file.filename)
-            file_path = settings.ORIGINAL_DIR / unique_filename
+            print(f"Uploading file: {file.filename}")
             
-            print(f"Uploading file: {file.filename} -> {unique_filename}")
-            
-            with open(file_path, 'wb') as buffer:
-                buffer.write(contents)
-            
-            print(f"File saved to: {file_path}")
+            # Stream to a temp file next to its final location, hashing in the same pass
+            temp_path, file_hash, _ = await run_in_threadpool(stage_stream, file.file)
         
-        # Check for duplicates AFTER we have the hash
+        # Check for duplicates before the upload is moved into place
         existing = db.query(Media).filter(Media.hash == file_hash).first()
         if existing:
             print(f"Duplicate file detected: {file_hash}")
-            # Only delete uploaded file if it was a new upload (not scanned)
-            if not scanned_path and file_path.exists():
-                file_path.unlink(missing_ok=True)
+            if temp_path is not None:
+                temp_path.unlink(missing_ok=True)
             raise HTTPException(
                 status_code=409, 
                 detail=f"Media already exists (duplicate of {existing.filename})"
             )
         
-        metadata = process_media_file(file_path)
-        print(f"Media processed: {metadata}")
-
-        thumbnail_name = Path(unique_filename).stem
-        thumbnail_filename = f"{thumbnail_name}.jpg"
-        thumbnail_path = settings.THUMBNAIL_DIR / thumbnail_filename
+        if temp_path is not None:
+            file_path = place_staged_file(temp_path, file.filename)
+            temp_path = None
+            
+            print(f"File saved to: {file_path}")
+        
+        thumbnail_path = thumbnail_path_for(file_path)
 
-        print(f"Generating thumbnail: {thumbnail_filename}")
+        print(f"Processing media and generating thumbnail: {thumbnail_path.name}")
 
-        thumbnail_generated = generate_thumbnail(
-            file_path,
-            thumbnail_path,
-            metadata['file_type']
-        )
+        # Probing and thumbnailing run in the media processing pool
+        metadata = await media_processing.process_media_async(file_path, thumbnail_path, file_hash)
+        thumbnail_generated = metadata.pop('thumbnail_generated')
+        print(f"Media processed: {metadata}")
 
         if thumbnail_generated:
             print(f"Thumbnail generated: {thumbnail_path}")
         else:
             print(f"Warning: Thumbnail generation failed")
         
-        relative_path = file_path.relative_to(settings.BASE_DIR)
-        relative_thumb = thumbnail_path.relative_to(settings.BASE_DIR) if thumbnail_generated else None
+        media = build_media(file_path, file_hash, metadata, thumbnail_generated, rating, source)
         
-        media = Media(
-            filename=unique_filename,
-            path=str(relative_path),
-            thumbnail_path=str(relative_thumb) if relative_thumb else None,
-            hash=file_hash,
-            file_type=metadata['file_type'],
-            mime_type=metadata['mime_type'],
-            file_size=metadata['file_size'],
-            width=metadata['width'],
-            height=metadata['height'],
-            duration=metadata['duration'],
-            rating=rating,
-            source=source if source else None,
-        )
-        
-        tag_ids_to_update = []
         if tags:
-            tag_list = [t.strip() for t in tags.split() if t.strip()]
+            tag_list = parse_tag_names(tags)
             media.tags = get_or_create_tags(db, tag_list)
-            tag_ids_to_update = [tag.id for tag in media.tags]
+            apply_tag_count_deltas(db, tag_count_deltas([], [tag.id for tag in media.tags]))
             print(f"Tags added: {tag_list}")
             
         # Handle Album IDs
         affected_album_ids = []
         if album_ids:
             try:
-                a_ids = [int(id_str.strip()) for id_str in album_ids.split(",") if id_str.strip().isdigit()]
+                a_ids = parse_album_ids(album_ids)
                 if a_ids:
                     albums = db.query(Album).filter(Album.id.in_(a_ids)).all()
                     media.albums = albums
@@ -328,25 +270,25 @@ async def upload_media(
         db.add(media)
         db.commit()
         db.refresh(media)
-        
-        if tag_ids_to_update:
-            update_tag_counts(db, tag_ids_to_update)
-            db.commit()
             
         if affected_album_ids:
-            for a_id in affected_album_ids:
-                update_album_last_modified(a_id, db)
-            db.commit()
+            album_media_added(db, [(a_id, media.id) for a_id in affected_album_ids])
+            update_albums_last_modified(affected_album_ids, db)
             invalidate_album_cache()
             
         db.refresh(media)
         
-        print(f"Media uploaded successfully: ID={media.id}, Filename={unique_filename}")
+        print(f"Media uploaded successfully: ID={media.id}, Filename={media.filename}")
         
         invalidate_media_cache()
         invalidate_tag_cache()
         
-        return MediaResponse.model_validate(media)
+        # Warn about re-encoded or resized copies that the exact hash misses
+        near_duplicates = find_near_duplicates(db, media.perceptual_hash, exclude_id=media.id)
+        
+        response = MediaUploadResponse.model_validate(media)
+        response.near_duplicates = near_duplicates
+        return response
         
     except HTTPException:
         raise
@@ -356,6 +298,14 @@ async def upload_media(
         traceback.print_exc()
         
         # Clean up files on error (only if it was a new upload, not scanned)
+        if temp_path is not None:
+            temp_path.unlink(missing_ok=True)
+        
+        # Leave the files alone if another writer already imported this path
+        db.rollback()
+        if 'file_path' in locals() and is_tracked_path(db, file_path):
+            raise HTTPException(status_code=409, detail="Media already exists")
+        
         if not scanned_path:
             if 'file_path' in locals() and file_path.exists():
                 file_path.unlink(missing_ok=True)
@@ -365,6 +315,133 @@ async def upload_media(
             
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+@router.post("/bulk")
+async def bulk_ingest_media(
+    files: List[UploadFile] = File(None),
+    scanned_paths: Optional[str] = Form(None, description="JSON list of paths inside ORIGINAL_DIR"),
+    rating: RatingEnum = Form(RatingEnum.safe),
+    tags: str = Form(""),
+    album_ids: Optional[str] = Form(None),
+    source: Optional[str] = Form(None),
+    current_user: User = Depends(require_admin_mode),
+    db: Session = Depends(get_db)
+):
+    """Ingest many files and/or scanned paths with shared rating, tags and albums"""
+    files = [f for f in (files or []) if f and f.filename]
+    try:
+        paths = json.loads(scanned_paths) if scanned_paths else []
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="scanned_paths must be a JSON list")
+    
+    if not files and not paths:
+        raise HTTPException(status_code=400, detail="Either files or scanned_paths is required")
+    
+    results = []
+    candidates = []  # dicts with name, file_path/temp_path, file_hash, scanned
+    
+    async def stage_upload(upload: UploadFile):
+        try:
+            temp_path, file_hash, _ = await run_in_threadpool(stage_stream, upload.file)
+            return {'name': upload.filename, 'temp_path': temp_path, 'file_hash': file_hash, 'scanned': False}
+        except Exception as e:
+            return {'name': upload.filename, 'error': str(e)}
+    
+    async def hash_scanned(path: str):
+        try:
+            file_path = resolve_scanned_path(path)
+            file_hash = await media_processing.run(calculate_file_hash, file_path)
+            return {'name': path, 'file_path': file_path, 'file_hash': file_hash, 'scanned': True}
+        except HTTPException as e:
+            return {'name': path, 'error': e.detail}
+        except Exception as e:
+            return {'name': path, 'error': str(e)}
+    
+    staged = await asyncio.gather(
+        *[stage_upload(f) for f in files],
+        *[hash_scanned(p) for p in paths]
+    )
+    
+    # Duplicate check for the whole batch in one query
+    hashes = {c['file_hash'] for c in staged if 'file_hash' in c}
+    existing_hashes = {h for (h,) in db.query(Media.hash).filter(Media.hash.in_(hashes)).all()} if hashes else set()
+    seen_hashes = set()
+    
+    for candidate in staged:
+        if 'error' in candidate:
+            results.append({'name': candidate['name'], 'status': 'failed', 'error': candidate['error']})
+            continue
+        
+        if candidate['file_hash'] in existing_hashes or candidate['file_hash'] in seen_hashes:
+            if not candidate['scanned']:
+                candidate['temp_path'].unlink(missing_ok=True)
+            results.append({'name': candidate['name'], 'status': 'duplicate'})
+            continue
+        seen_hashes.add(candidate['file_hash'])
+        
+        if not candidate['scanned']:
+            candidate['file_path'] = place_staged_file(candidate.pop('temp_path'), candidate['name'])
+        candidates.append(candidate)
+    
+    # Process everything in parallel in the media processing pool
+    processed = await asyncio.gather(
+        *[
+            media_processing.process_media_async(c['file_path'], thumbnail_path_for(c['file_path']), c['file_hash'])
+            for c in candidates
+        ],
+        return_exceptions=True
+    )
+    
+    ready = []
+    for candidate, metadata in zip(candidates, processed):
+        if isinstance(metadata, BaseException):
+            print(f"Processing {candidate['name']} failed: {metadata}")
+            discard_processed_files([candidate])
+            results.append({'name': candidate['name'], 'status': 'failed', 'error': str(metadata)})
+            continue
+        candidate['thumbnail_generated'] = metadata.pop('thumbnail_generated')
+        candidate['metadata'] = metadata
+        ready.append(candidate)
+    
+    tag_names = parse_tag_names(tags)
+    parsed_album_ids = parse_album_ids(album_ids)
+    
+    try:
+        inserted = write_processed_media(db, ready, rating, tag_names, parsed_album_ids, source)
+    except Exception as e:
+        db.rollback()
+        print(f"Error writing bulk ingest: {e}")
+        import traceback
+        traceback.print_exc()
+        discard_processed_files(ready, db)
+        raise HTTPException(status_code=500, detail=f"Bulk ingest failed: {str(e)}")
+    
+    for candidate in ready:
+        media_id = inserted.get(candidate['file_hash'])
+        if media_id is None:
+            discard_processed_files([candidate], db)
+            results.append({'name': candidate['name'], 'status': 'duplicate'})
+        else:
+            result = {'name': candidate['name'], 'status': 'imported', 'media_id': media_id}
+            near_duplicates = find_near_duplicates(db, candidate['metadata'].get('perceptual_hash'), exclude_id=media_id)
+            if near_duplicates:
+                result['near_duplicates'] = near_duplicates
+            results.append(result)
+    
+    # One round of cache invalidation for the whole batch
+    if inserted:
+        invalidate_media_cache()
+        invalidate_tag_cache()
+        if parsed_album_ids:
+            invalidate_album_cache()
+    
+    return {
+        "imported": sum(1 for r in results if r['status'] == 'imported'),
+        "duplicates": sum(1 for r in results if r['status'] == 'duplicate'),
+        "failed": sum(1 for r in results if r['status'] == 'failed'),
+        "near_duplicates": sum(1 for r in results if r.get('near_duplicates')),
+        "results": results
+    }
+
 @router.patch("/{media_id}", response_model=MediaResponse)
 async def update_media(
     media_id: int,
@@ -377,18 +454,19 @@ async def update_media(
     if not media:
         raise HTTPException(status_code=404, detail="Media not found")
     
+    old_rating = media.rating
+    rating_changed = bool(updates.rating) and updates.rating != media.rating
     if updates.rating:
         media.rating = updates.rating
     
     if 'source' in updates.model_fields_set:
         media.source = updates.source if updates.source else None
     
-    affected_tag_ids = []
     if updates.tags is not None:
         old_tag_ids = [tag.id for tag in media.tags]
         media.tags = get_or_create_tags(db, updates.tags)
         new_tag_ids = [tag.id for tag in media.tags]
-        affected_tag_ids = list(set(old_tag_ids + new_tag_ids))
+        apply_tag_count_deltas(db, tag_count_deltas(old_tag_ids, new_tag_ids))
 
     parent_id_changed = False
     old_parent_id = media.parent_id
@@ -416,14 +494,21 @@ async def update_media(
                 parent_id_changed = True
             media.parent_id = None
     
-    db.commit()
-    
-    if affected_tag_ids:
-        update_tag_counts(db, affected_tag_ids)
-        db.commit()
+    album_ids = []
+    if rating_changed:
+        db.flush()
+        album_ids = [a_id for (a_id,) in db.query(blombooru_album_media.c.album_id).filter(
+            blombooru_album_media.c.media_id == media_id
+        ).all()]
+        if album_ids:
+            album_media_rating_changed(db, media_id, old_rating)
     
+    db.commit()
     db.refresh(media)
     
+    if album_ids:
+        invalidate_album_cache()
+    
     if parent_id_changed:
         invalidate_media_item_cache(media_id)
 
@@ -459,15 +544,17 @@ async def delete_media(
         thumb_path = settings.BASE_DIR / media.thumbnail_path
         thumb_path.unlink(missing_ok=True)
     
+    # Unlinked first so the album aggregates can still read the media row
+    album_ids = unlink_media_from_all_albums(db, media_id)
     db.delete(media)
+    apply_tag_count_deltas(db, tag_count_deltas(tag_ids, []))
     db.commit()
-    
-    if tag_ids:
-        update_tag_counts(db, tag_ids)
-        db.commit()
+    phash_index.remove(media_id)
 
     invalidate_media_cache()
     invalidate_tag_cache()
+    if album_ids:
+        invalidate_album_cache()
     
     return {"message": "Media deleted successfully"}
 
@@ -573,110 +660,73 @@ async def get_media_albums(
     ).all()
     
     result = []
+    thumbnails = get_cover_thumbnail_map(db, albums)
     for album in albums:
-        thumbnails = get_random_thumbnails(album.id, db, count=4)
-        album_rating = get_album_rating(album.id, db)
-        media_count = get_media_count(album.id, db)
-        
         result.append(AlbumListResponse(
             id=album.id,
             name=album.name,
             last_modified=album.last_modified,
-            thumbnail_paths=thumbnails,
-            rating=album_rating,
-            media_count=media_count
+            thumbnail_paths=thumbnails.get(album.id, []),
+            rating=album.max_rating,
+            media_count=album.media_count
         ))
     
     return {"albums": result}
 
-@router.post("/extract-archive")
-async def extract_archive(
+@router.post("/import-archive")
+async def import_archive(
     file: UploadFile = File(...),
+    rating: RatingEnum = Form(RatingEnum.safe),
+    tags: str = Form(""),
+    album_ids: Optional[str] = Form(None),
+    source: Optional[str] = Form(None),
     current_user: User = Depends(require_admin_mode)
 ):
-    """Extract files from zip or tar.gz archive"""
+    """Import every media file in a zip or tar.gz archive as a background job"""
     import zipfile
     import tarfile
     import tempfile
-    import base64
-    from pathlib import Path
     
-    # Security: limit file size (100MB max for archives)
-    MAX_ARCHIVE_SIZE = 100 * 1024 * 1024
-    MAX_EXTRACTED_SIZE = 500 * 1024 * 1024
+    if not file.filename or not is_archive_filename(file.filename):
+        raise HTTPException(status_code=400, detail="Unsupported archive format")
+    
+    # Keep the archive on disk for the job; members are streamed out of it one by one
+    fd, temp_name = tempfile.mkstemp(dir=settings.CACHE_DIR, suffix=Path(file.filename).suffix)
+    archive_path = Path(temp_name)
     
-    contents = await file.read()
-    if len(contents) > MAX_ARCHIVE_SIZE:
-        raise HTTPException(status_code=400, detail="Archive too large (max 100MB)")
+    max_size_mb = settings.ARCHIVE_MAX_SIZE_MB
     
-    extracted_files = []
-    total_size = 0
+    def save_archive():
+        size = 0
+        with open(fd, 'wb') as target:
+            while chunk := file.file.read(1024 * 1024):
+                size += len(chunk)
+                if size > max_size_mb * 1024 * 1024:
+                    raise HTTPException(status_code=400, detail=f"Archive too large (max {max_size_mb}MB)")
+                target.write(chunk)
     
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            archive_path = temp_path / file.filename
-            
-            # Write archive to temp file
-            with open(archive_path, 'wb') as f:
-                f.write(contents)
-            
-            # Extract based on file type
-            if file.filename.endswith('.zip'):
-                with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-                    # Security: check for path traversal
-                    for member in zip_ref.namelist():
-                        if member.startswith('/') or '..' in member:
-                            raise HTTPException(status_code=400, detail="Invalid file path in archive")
-                    
-                    zip_ref.extractall(temp_path)
-                    
-            elif file.filename.endswith(('.tar.gz', '.tgz')):
-                with tarfile.open(archive_path, 'r:gz') as tar_ref:
-                    # Security: check for path traversal
-                    for member in tar_ref.getmembers():
-                        if member.name.startswith('/') or '..' in member.name:
-                            raise HTTPException(status_code=400, detail="Invalid file path in archive")
-                    
-                    tar_ref.extractall(temp_path)
-            else:
-                raise HTTPException(status_code=400, detail="Unsupported archive format")
-            
-            # Process extracted files
-            for extracted_file in temp_path.rglob('*'):
-                if extracted_file.is_symlink():
-                    continue
-                    
-                if extracted_file.is_file() and extracted_file != archive_path:
-                    # Security: check total extracted size
-                    file_size = extracted_file.stat().st_size
-                    total_size += file_size
-                    
-                    if total_size > MAX_EXTRACTED_SIZE:
-                        raise HTTPException(status_code=400, detail="Extracted files too large (max 500MB)")
-                    
-                    with open(extracted_file, 'rb') as f:
-                        file_content = f.read()
-                    
-                    import mimetypes
-                    mime_type, _ = mimetypes.guess_type(extracted_file.name)
-                    
-                    valid_types = ['image/jpeg', 'image/png', 'image/gif', 'image/webp', 'video/mp4', 'video/webm']
-                    if mime_type in valid_types:
-                        extracted_files.append({
-                            'filename': extracted_file.name,
-                            'mime_type': mime_type,
-                            'content': base64.b64encode(file_content).decode('utf-8')
-                        })
-            
-            return {
-                'files': extracted_files,
-                'count': len(extracted_files)
-            }
-            
-    except zipfile.BadZipFile:
-        raise HTTPException(status_code=400, detail="Invalid or corrupted zip file")
-    except tarfile.TarError:
-        raise HTTPException(status_code=400, detail="Invalid or corrupted tar.gz file")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error extracting archive: {str(e)}")
+        await run_in_threadpool(save_archive)
+        
+        if file.filename.lower().endswith('.zip'):
+            valid = zipfile.is_zipfile(archive_path)
+        else:
+            valid = tarfile.is_tarfile(archive_path)
+        if not valid:
+            raise HTTPException(status_code=400, detail="Invalid or corrupted archive")
+    except Exception:
+        archive_path.unlink(missing_ok=True)
+        raise
+    
+    job = job_manager.start(
+        "archive_import",
+        run_archive_import,
+        archive_path,
+        file.filename,
+        rating,
+        parse_tag_names(tags),
+        parse_album_ids(album_ids),
+        source
+    )
+    
+    return {"job_id": job.id}
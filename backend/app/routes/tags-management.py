@@ -1,123 +1,33 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from typing import List, Dict
-import csv
-import io
 from ..database import get_db
 from ..auth import require_admin_mode
-from ..models import User, Tag, TagAlias, TagCategoryEnum
-from ..schemas import TagResponse
-from ..utils.cache import cache_response, invalidate_tag_cache
+from ..models import User, Tag, TagAlias
+from ..utils.cache import cache_response
+from ..services.jobs import job_manager
+from ..services.tag_import import run_tags_csv_import
 from fastapi import Request
+import tempfile
+import shutil
 
 router = APIRouter(prefix="/api/tags-management", tags=["tag-management"])
 
-def parse_tag_category(category_num: str) -> TagCategoryEnum:
-    """Convert numeric category to enum"""
-    mapping = {
-        "0": TagCategoryEnum.general,
-        "1": TagCategoryEnum.artist,
-        "3": TagCategoryEnum.copyright,
-        "4": TagCategoryEnum.character,
-        "5": TagCategoryEnum.meta
-    }
-    return mapping.get(category_num, TagCategoryEnum.general)
-
-def parse_aliases(aliases_str: str) -> List[str]:
-    """Parse comma-separated aliases"""
-    if not aliases_str or aliases_str.strip() == '':
-        return []
-    
-    aliases_str = aliases_str.strip('"\'')
-    
-    return [tag.strip() for tag in aliases_str.split(',') if tag.strip()]
-
 @router.post("/import-csv")
 async def import_tags_csv(
     file: UploadFile = File(...),
-    current_user: User = Depends(require_admin_mode),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(require_admin_mode)
 ):
-    """Import tags from CSV file"""
+    """Stage an uploaded tag CSV and import it in a background job"""
     
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
     
-    try:
-        content = await file.read()
-        csv_text = content.decode('utf-8')
-        csv_reader = csv.reader(io.StringIO(csv_text))
-        
-        stats = {
-            "tags_created": 0,
-            "tags_updated": 0,
-            "aliases_created": 0,
-            "errors": []
-        }
-        
-        for row_num, row in enumerate(csv_reader, 1):
-            try:
-                if len(row) < 4:
-                    stats["errors"].append(f"Row {row_num}: Invalid format (expected 4 columns)")
-                    continue
-                
-                tag_name = row[0].strip().lower()
-                category = parse_tag_category(row[1].strip())
-                # Skip row[2] (usage count)
-                aliases_str = row[3].strip()
-                
-                if not tag_name:
-                    continue
-                
-                tag = db.query(Tag).filter(Tag.name == tag_name).first()
-                
-                if tag:
-                    if tag.category != category:
-                        tag.category = category
-                        stats["tags_updated"] += 1
-                else:
-                    tag = Tag(
-                        name=tag_name,
-                        category=category,
-                        post_count=0
-                    )
-                    db.add(tag)
-                    db.flush()  # Get the ID
-                    stats["tags_created"] += 1
-                
-                alias_names = parse_aliases(aliases_str)
-                
-                for alias_name in alias_names:
-                    alias_name = alias_name.lower()
-                    
-                    existing_alias = db.query(TagAlias).filter(
-                        TagAlias.alias_name == alias_name
-                    ).first()
-                    
-                    if not existing_alias:
-                        alias = TagAlias(
-                            alias_name=alias_name,
-                            target_tag_id=tag.id
-                        )
-                        db.add(alias)
-                        stats["aliases_created"] += 1
-                
-            except Exception as e:
-                stats["errors"].append(f"Row {row_num}: {str(e)}")
-                continue
-        
-        db.commit()
-        invalidate_tag_cache()
-        
-        return {
-            "success": True,
-            "stats": stats
-        }
-        
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to import CSV: {str(e)}")
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp:
+        shutil.copyfileobj(file.file, tmp)
+    
+    job = job_manager.start("tags_csv_import", run_tags_csv_import, tmp.name)
+    return {"job_id": job.id}
 
 @router.get("/stats")
 @cache_response(expire=3600, key_prefix="tags")
@@ -162,7 +72,7 @@ async def clear_all_tags(
         db.query(TagAlias).delete()
         db.query(Tag).delete()
         db.commit()
-        invalidate_tag_cache()
+        invalidate_tag_cache(rebuild_index=True)
         
         return {"success": True, "message": "All tags cleared"}
     except Exception as e:
@@ -219,7 +129,7 @@ async def delete_tag(
     try:
         db.delete(tag)
         db.commit()
-        invalidate_tag_cache()
+        invalidate_tag_cache(rebuild_index=True)
         
         return {"success": True, "message": f"Tag '{tag.name}' deleted"}
     except Exception as e:
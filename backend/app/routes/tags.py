@@ -1,16 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, case, func, or_, and_
+from sqlalchemy import desc, func, or_, and_
 from typing import List, Optional
 from ..database import get_db
 from ..auth import require_admin_mode, get_current_user
 from ..models import Tag, Media, User, blombooru_media_tags
 from ..schemas import TagResponse, TagCreate, TagCategoryEnum
 from ..utils.cache import cache_response, invalidate_tag_cache
+from ..services.tag_autocomplete import tag_autocomplete, suggest_tags
+from ..services.tag_cooccurrence import get_related_counts
 from fastapi import Request
 
 router = APIRouter(prefix="/api/tags", tags=["tags"])
 
+AUTOCOMPLETE_LIMIT = 50
+
 @router.get("/", response_model=List[TagResponse])
 @cache_response(expire=3600, key_prefix="tags")
 async def get_tags(
@@ -52,31 +56,19 @@ async def autocomplete_tags(
     db: Session = Depends(get_db)
 ):
     """Autocomplete tag suggestions"""
-    from ..models import TagAlias
-    
-    alias = db.query(TagAlias).filter(TagAlias.alias_name.ilike(q)).first()
-    
-    if alias:
-        target_tag = db.query(Tag).filter(Tag.id == alias.target_tag_id).first()
-        if target_tag:
-            return [{
-                "name": target_tag.name,
-                "category": target_tag.category,
-                "count": target_tag.post_count,
-                "is_alias": True,
-                "alias_name": q.lower()
-            }]
-    
-    priority = case(
-        (Tag.name.ilike(f"{q}%"), 1),
-        else_=2
-    )
-    
-    tags = db.query(Tag).filter(
-        Tag.name.ilike(f"%{q}%")
-    ).order_by(priority, desc(Tag.post_count)).limit(50).all()
-    
-    return [{"name": tag.name, "category": tag.category, "count": tag.post_count} for tag in tags]
+    alias_match = tag_autocomplete.resolve_alias(db, q)
+    if alias_match:
+        _, (name, category, post_count) = alias_match
+        return [{
+            "name": name,
+            "category": category,
+            "count": post_count,
+            "is_alias": True,
+            "alias_name": q.lower()
+        }]
+    
+    tags = suggest_tags(db, q, AUTOCOMPLETE_LIMIT)
+    return [{"name": tag["name"], "category": tag["category"], "count": tag["count"]} for tag in tags]
 
 @router.get("/{tag_name}", response_model=TagResponse)
 @cache_response(expire=3600, key_prefix="tag_detail")
@@ -123,7 +115,7 @@ async def update_tag(
     
     tag.category = category
     db.commit()
-    invalidate_tag_cache()
+    invalidate_tag_cache(rebuild_index=True)
     
     return {"message": "Tag updated successfully"}
 
@@ -140,7 +132,7 @@ async def delete_tag(
     
     db.delete(tag)
     db.commit()
-    invalidate_tag_cache()
+    invalidate_tag_cache(rebuild_index=True)
     
     return {"message": "Tag deleted successfully"}
 
@@ -157,17 +149,20 @@ async def get_related_tags(
     if not tag:
         raise HTTPException(status_code=404, detail="Tag not found")
     
-    media_with_tag = db.query(Media.id).join(blombooru_media_tags).filter(
-        blombooru_media_tags.c.tag_id == tag.id
-    ).subquery()
-    
-    related = db.query(
-        Tag,
-        func.count(blombooru_media_tags.c.media_id).label('cooccurrence')
-    ).join(blombooru_media_tags).filter(
-        blombooru_media_tags.c.media_id.in_(media_with_tag),
-        Tag.id != tag.id
-    ).group_by(Tag.id).order_by(desc('cooccurrence')).limit(limit).all()
+    # Precomputed co-occurrence counts; tags not computed yet use a live query
+    related = get_related_counts(db, tag.id, limit=limit, exclude_self=True)
+    if related is None:
+        media_with_tag = db.query(Media.id).join(blombooru_media_tags).filter(
+            blombooru_media_tags.c.tag_id == tag.id
+        ).subquery()
+        
+        related = db.query(
+            Tag,
+            func.count(blombooru_media_tags.c.media_id).label('cooccurrence')
+        ).join(blombooru_media_tags).filter(
+            blombooru_media_tags.c.media_id.in_(media_with_tag),
+            Tag.id != tag.id
+        ).group_by(Tag.id).order_by(desc('cooccurrence')).limit(limit).all()
     
     return [
         {
@@ -190,6 +185,21 @@ async def related_tags(
     if not tag_list:
         return []
 
+    # A single tag is served from the precomputed counts when available
+    related = None
+    if len(tag_list) == 1:
+        tag = db.query(Tag).filter(Tag.name == tag_list[0]).first()
+        if not tag:
+            return []
+        related = get_related_counts(db, tag.id, limit=20, exclude_self=True)
+    if related is not None:
+        return [{
+            "id": tag.id,
+            "name": tag.name,
+            "category": tag.category,
+            "frequency": freq
+        } for tag, freq in related]
+
     subquery = db.query(
         Media.id
     ).join(
@@ -70,6 +70,13 @@ class MediaResponse(MediaBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class NearDuplicate(BaseModel):
+    id: int
+    distance: int
+
+class MediaUploadResponse(MediaResponse):
+    near_duplicates: List[NearDuplicate] = []
+
 class SharedTagResponse(TagBase):
     model_config = ConfigDict(from_attributes=True)
 
@@ -178,6 +185,15 @@ class AlbumListResponse(AlbumBase):
 class MediaIds(BaseModel):
     media_ids: List[int]
 
+class AlbumMediaBulk(BaseModel):
+    album_ids: List[int]
+    media_ids: List[int]
+
+class AlbumMediaMove(BaseModel):
+    source_album_id: int
+    target_album_id: int
+    media_ids: List[int]
+
 class ApiKeyCreate(BaseModel):
     name: Optional[str] = None
 
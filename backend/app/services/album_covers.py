@@ -0,0 +1,101 @@
+"""
+Random album cover selection for album lists.
+
+Covers for every album on a page are sampled in one statement: the media of
+each album and its sub-albums (through the closure table) is numbered with
+row_number() over a random key per album, and the first few rows of each
+album are kept, so only the chosen IDs leave the database. Picks are cached
+per album for COVER_ROTATION_SECONDS, after which the album shows a new set,
+and dropped whenever album caches are invalidated.
+Albums with no more media than covers use the covers stored on the album row
+and need no sampling at all.
+"""
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..models import Album
+from ..utils.album_utils import ALBUM_COVER_COUNT
+
+# Seconds before an album's covers are sampled again
+COVER_ROTATION_SECONDS = 300
+# Cached albums before expired entries are swept
+MAX_CACHED_ALBUMS = 10000
+
+
+class AlbumCoverPicker:
+    """Process-wide cache of randomly sampled album covers"""
+
+    def __init__(self):
+        self._cache: Dict[int, Tuple[float, List[int]]] = {}
+        self._lock = threading.Lock()
+
+    def _sample(self, db: Session, album_ids: List[int], count: int) -> Dict[int, List[int]]:
+        covers = {album_id: [] for album_id in album_ids}
+        rows = db.execute(text("""
+            SELECT album_id, media_id
+            FROM (
+                SELECT album_id, media_id,
+                       row_number() OVER (PARTITION BY album_id ORDER BY random()) AS rn
+                FROM (
+                    SELECT DISTINCT c.ancestor_id AS album_id, am.media_id
+                    FROM blombooru_album_closure AS c
+                    JOIN blombooru_album_media AS am ON am.album_id = c.descendant_id
+                    JOIN blombooru_media AS m ON m.id = am.media_id
+                    WHERE c.ancestor_id = ANY(CAST(:album_ids AS integer[]))
+                      AND m.thumbnail_path IS NOT NULL
+                ) AS members
+            ) AS ranked
+            WHERE rn <= :count
+        """), {"album_ids": album_ids, "count": count})
+        for album_id, media_id in rows:
+            covers[album_id].append(media_id)
+        return covers
+
+    def get_covers(self, db: Session, albums: Iterable[Album], count: int = ALBUM_COVER_COUNT) -> Dict[int, List[int]]:
+        """Cover media IDs for each album, sampling all uncached albums in one query"""
+        now = time.monotonic()
+        covers = {}
+        missing = []
+
+        with self._lock:
+            for album in albums:
+                if (album.media_count or 0) <= count:
+                    covers[album.id] = list(album.cover_media_ids or [])[:count]
+                    continue
+                cached = self._cache.get(album.id)
+                if cached and cached[0] > now:
+                    covers[album.id] = cached[1]
+                else:
+                    missing.append(album.id)
+
+        if missing:
+            sampled = self._sample(db, missing, count)
+            expires = now + COVER_ROTATION_SECONDS
+            with self._lock:
+                if len(self._cache) > MAX_CACHED_ALBUMS:
+                    self._cache = {aid: entry for aid, entry in self._cache.items() if entry[0] > now}
+                for album_id, media_ids in sampled.items():
+                    self._cache[album_id] = (expires, media_ids)
+            covers.update(sampled)
+
+        return covers
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+album_covers = AlbumCoverPicker()
+
+
+def get_cover_thumbnail_map(db: Session, albums: Iterable[Album]) -> Dict[int, List[str]]:
+    """Thumbnail URLs of sampled covers, keyed by album ID"""
+    covers = album_covers.get_covers(db, albums)
+    return {
+        album_id: [f"/api/media/{mid}/thumbnail" for mid in media_ids]
+        for album_id, media_ids in covers.items()
+    }
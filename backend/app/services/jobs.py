@@ -0,0 +1,179 @@
+"""
+In-process registry for long-running background jobs.
+
+Jobs run in their own thread and publish progress that clients read either
+by polling /api/jobs/{id} or by following /api/jobs/{id}/events (SSE).
+The registry lives in the worker process that started the job, so job
+endpoints only work reliably with a single uvicorn worker (UVICORN_WORKERS=1,
+the default).
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How long finished jobs stay queryable
+FINISHED_JOB_TTL = 3600
+# Per-item events kept for late subscribers
+MAX_JOB_EVENTS = 5000
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation was requested"""
+
+
+class Job:
+    """State of a single background job"""
+
+    def __init__(self, kind: str, total: Optional[int] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "pending"
+        self.progress = 0
+        self.total = total
+        self.message: Optional[str] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.events: List[dict] = []
+        self.events_dropped = 0
+        self.version = 0
+        self._cancel_requested = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_requested.is_set()
+
+    def cancel(self):
+        self._cancel_requested.set()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if the job should stop"""
+        if self._cancel_requested.is_set():
+            raise JobCancelled()
+
+    def update(self, progress: Optional[int] = None, total: Optional[int] = None,
+               message: Optional[str] = None, advance: int = 0):
+        with self._lock:
+            if progress is not None:
+                self.progress = progress
+            self.progress += advance
+            if total is not None:
+                self.total = total
+            if message is not None:
+                self.message = message
+            self.version += 1
+
+    def add_event(self, **event):
+        """Record a per-item event (e.g. one imported file)"""
+        with self._lock:
+            self.events.append(event)
+            if len(self.events) > MAX_JOB_EVENTS:
+                del self.events[0]
+                self.events_dropped += 1
+            self.version += 1
+
+    def events_since(self, index: int) -> Tuple[List[dict], int]:
+        """Return events after an absolute index, plus the index to resume from"""
+        with self._lock:
+            start = max(0, index - self.events_dropped)
+            return list(self.events[start:]), self.events_dropped + len(self.events)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "progress": self.progress,
+                "total": self.total,
+                "message": self.message,
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at
+            }
+
+
+class JobManager:
+    """Starts jobs in background threads and keeps track of them"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        cutoff = time.time() - FINISHED_JOB_TTL
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def start(self, kind: str, target: Callable[..., Any], *args, total: Optional[int] = None) -> Job:
+        """Run target(job, *args) in a background thread; its return value becomes the result"""
+        job = Job(kind, total=total)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+
+        def runner():
+            job.status = "running"
+            job.update()
+            try:
+                job.result = target(job, *args)
+                job.status = "completed"
+            except JobCancelled:
+                job.status = "cancelled"
+            except Exception as e:
+                logger.error(f"Job {job.kind} ({job.id}) failed: {e}")
+                traceback.print_exc()
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                job.update()
+
+        threading.Thread(target=runner, name=f"job-{kind}", daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find_running(self, kind: str) -> Optional[Job]:
+        """Return an unfinished job of the given kind, if any"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.kind == kind and not job.finished:
+                    return job
+        return None
+
+    async def stream(self, job: Job, poll_interval: float = 0.5) -> AsyncGenerator[str, None]:
+        """Yield SSE messages for a job until it finishes"""
+        last_version = -1
+        event_index = 0
+        while True:
+            finished = job.finished
+            if job.version != last_version:
+                last_version = job.version
+                events, event_index = job.events_since(event_index)
+                for event in events:
+                    yield f"data: {json.dumps({'type': 'item', **event}, default=str)}\n\n"
+                yield f"data: {json.dumps({'type': 'progress', **job.to_dict()}, default=str)}\n\n"
+            if finished:
+                yield f"data: {json.dumps({'type': 'done', **job.to_dict()}, default=str)}\n\n"
+                return
+            await asyncio.sleep(poll_interval)
+
+
+job_manager = JobManager()
@@ -0,0 +1,522 @@
+"""
+Shared media ingest pipeline: dedup -> process -> thumbnail -> insert.
+
+Single uploads, bulk ingest and archive imports go through the same staging,
+duplicate handling, processing and tagging steps so the resulting rows
+look the same regardless of how a file arrived.
+"""
+import logging
+import tarfile
+import uuid
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import Media, Album, blombooru_media_tags, blombooru_album_media
+from ..schemas import RatingEnum
+from ..utils.album_utils import album_media_added
+from ..utils.file_scanner import is_supported_file
+from ..utils.media_helpers import get_unique_filename
+from ..utils.media_processor import stream_to_file
+from ..utils.tag_utils import get_or_create_tags, apply_tag_count_deltas
+from .jobs import Job
+from .media_processing import media_processing
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_TEMP_PREFIX = ".upload-"
+UPLOAD_TEMP_SUFFIX = ".part"
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar.gz', '.tgz')
+# Processed files written to the database per commit
+INGEST_BATCH_SIZE = 50
+# Larger batches for server-side imports keep the whole media pool busy
+UNTRACKED_IMPORT_BATCH_SIZE = 200
+
+
+def is_archive_filename(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def stage_stream(source: BinaryIO) -> Tuple[Path, str, int]:
+    """Copy a stream into a temp file in ORIGINAL_DIR. Returns (temp_path, hash, size)"""
+    temp_path = settings.ORIGINAL_DIR / f"{UPLOAD_TEMP_PREFIX}{uuid.uuid4().hex}{UPLOAD_TEMP_SUFFIX}"
+    try:
+        file_hash, size = stream_to_file(source, temp_path)
+    except Exception:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return temp_path, file_hash, size
+
+
+def place_staged_file(temp_path: Path, filename: str) -> Path:
+    """Move a staged upload to its final, unique location"""
+    unique_filename = get_unique_filename(settings.ORIGINAL_DIR, filename)
+    file_path = settings.ORIGINAL_DIR / unique_filename
+    temp_path.replace(file_path)
+    return file_path
+
+
+def thumbnail_path_for(file_path: Path) -> Path:
+    return settings.THUMBNAIL_DIR / f"{file_path.stem}.jpg"
+
+
+def parse_tag_names(tags: Optional[str]) -> List[str]:
+    return [t.strip() for t in (tags or "").split() if t.strip()]
+
+
+def parse_album_ids(album_ids: Optional[str]) -> List[int]:
+    if not album_ids:
+        return []
+    return [int(id_str.strip()) for id_str in album_ids.split(",") if id_str.strip().isdigit()]
+
+
+def resolve_scanned_path(scanned_path: str) -> Path:
+    """Validate a path to an existing file inside ORIGINAL_DIR"""
+    file_path = Path(scanned_path)
+    
+    if not file_path.is_absolute():
+        raise HTTPException(status_code=400, detail="Invalid file path")
+    
+    try:
+        file_path = file_path.resolve()
+        file_path.relative_to(settings.ORIGINAL_DIR.resolve())
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    if not file_path.exists() or not file_path.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    return file_path
+
+
+def media_row_values(
+    file_path: Path,
+    file_hash: str,
+    metadata: dict,
+    thumbnail_generated: bool,
+    rating: RatingEnum,
+    source: Optional[str] = None
+) -> dict:
+    """Column values of the Media row for a processed file"""
+    thumbnail_path = thumbnail_path_for(file_path)
+    relative_thumb = thumbnail_path.relative_to(settings.BASE_DIR) if thumbnail_generated else None
+
+    return {
+        'filename': file_path.name,
+        'path': str(file_path.relative_to(settings.BASE_DIR)),
+        'thumbnail_path': str(relative_thumb) if relative_thumb else None,
+        'hash': file_hash,
+        'perceptual_hash': metadata.get('perceptual_hash'),
+        'file_type': metadata['file_type'],
+        'mime_type': metadata['mime_type'],
+        'file_size': metadata['file_size'],
+        'width': metadata['width'],
+        'height': metadata['height'],
+        'duration': metadata['duration'],
+        'rating': rating,
+        'source': source if source else None,
+    }
+
+
+def build_media(
+    file_path: Path,
+    file_hash: str,
+    metadata: dict,
+    thumbnail_generated: bool,
+    rating: RatingEnum,
+    source: Optional[str] = None
+) -> Media:
+    """Create (but do not add) a Media row for a processed file"""
+    return Media(**media_row_values(file_path, file_hash, metadata, thumbnail_generated, rating, source))
+
+
+def iter_archive_members(archive_path: Path, archive_name: str) -> Iterator[Tuple[str, BinaryIO]]:
+    """Yield (filename, stream) for each supported media file in a zip or tar.gz archive"""
+    # Guards against archive bombs (ARCHIVE_MAX_EXTRACTED_SIZE_MB); contents are streamed to disk, not memory
+    max_extracted_mb = settings.ARCHIVE_MAX_EXTRACTED_SIZE_MB
+    total_size = 0
+
+    def check_size(size: int):
+        nonlocal total_size
+        total_size += size
+        if total_size > max_extracted_mb * 1024 * 1024:
+            raise ValueError(f"Extracted files too large (max {max_extracted_mb}MB)")
+
+    # Members are flattened to their base name and never extracted by
+    # path, so traversal entries cannot escape ORIGINAL_DIR
+    if archive_name.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path, 'r') as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                name = Path(info.filename).name
+                if not name or not is_supported_file(name):
+                    continue
+                check_size(info.file_size)
+                with zf.open(info) as stream:
+                    yield name, stream
+    else:
+        with tarfile.open(archive_path, 'r:gz') as tf:
+            for member in tf:
+                # Skips directories, symlinks and device entries
+                if not member.isfile():
+                    continue
+                name = Path(member.name).name
+                if not name or not is_supported_file(name):
+                    continue
+                check_size(member.size)
+                stream = tf.extractfile(member)
+                if stream is None:
+                    continue
+                with stream:
+                    yield name, stream
+
+
+def count_archive_members(archive_path: Path, archive_name: str) -> Optional[int]:
+    """Number of supported files in a zip (None for tar, which has no index)"""
+    if not archive_name.lower().endswith('.zip'):
+        return None
+    with zipfile.ZipFile(archive_path, 'r') as zf:
+        return sum(1 for info in zf.infolist() if not info.is_dir() and is_supported_file(Path(info.filename).name))
+
+
+def write_processed_media(
+    db: Session,
+    items: List[dict],
+    rating: RatingEnum,
+    tag_names: List[str],
+    album_ids: List[int],
+    source: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    Insert processed files with their tags and albums using bulk statements
+    and a single commit. Each item holds file_path, file_hash, metadata and
+    thumbnail_generated. Returns hash -> new media ID; items missing from the
+    result collided with an existing row (e.g. a concurrent upload).
+    """
+    if not items:
+        return {}
+
+    tag_ids = [tag.id for tag in get_or_create_tags(db, tag_names)] if tag_names else []
+    if album_ids:
+        album_ids = [a_id for (a_id,) in db.query(Album.id).filter(Album.id.in_(album_ids)).all()]
+
+    rows = [
+        media_row_values(
+            item['file_path'],
+            item['file_hash'],
+            item['metadata'],
+            item['thumbnail_generated'],
+            rating,
+            source
+        )
+        for item in items
+    ]
+    result = db.execute(
+        pg_insert(Media).on_conflict_do_nothing().returning(Media.id, Media.hash),
+        rows
+    )
+    inserted = {row.hash: row.id for row in result}
+    media_ids = list(inserted.values())
+
+    if media_ids and tag_ids:
+        db.execute(
+            blombooru_media_tags.insert(),
+            [{'media_id': m_id, 'tag_id': t_id} for m_id in media_ids for t_id in tag_ids]
+        )
+        apply_tag_count_deltas(db, {tag_id: len(media_ids) for tag_id in tag_ids})
+
+    if media_ids and album_ids:
+        links = [(a_id, m_id) for a_id in album_ids for m_id in media_ids]
+        db.execute(
+            blombooru_album_media.insert(),
+            [{'album_id': a_id, 'media_id': m_id} for a_id, m_id in links]
+        )
+        album_media_added(db, links)
+        db.query(Album).filter(Album.id.in_(album_ids)).update(
+            {"last_modified": datetime.now()},
+            synchronize_session=False
+        )
+
+    db.commit()
+    return inserted
+
+
+def is_tracked_path(db: Session, file_path: Path) -> bool:
+    """Whether a Media row already points at this file"""
+    relative_path = str(file_path.relative_to(settings.BASE_DIR))
+    return db.query(Media.id).filter(Media.path == relative_path).first() is not None
+
+
+def tracked_paths(db: Session, relative_paths: List[str]) -> set:
+    """The subset of relative paths that Media rows already point at"""
+    if not relative_paths:
+        return set()
+    return {path for (path,) in db.query(Media.path).filter(Media.path.in_(relative_paths)).all()}
+
+
+def discard_processed_files(items: List[dict], db: Optional[Session] = None):
+    """Remove files (and thumbnails) of items that could not be written"""
+    for item in items:
+        # Another writer (e.g. the folder watcher) may have imported this very
+        # file first - its row now owns the file and thumbnail
+        if db is not None and is_tracked_path(db, item['file_path']):
+            continue
+        # Scanned files already lived in ORIGINAL_DIR - only drop what we created
+        if not item.get('scanned'):
+            item['file_path'].unlink(missing_ok=True)
+        thumbnail_path_for(item['file_path']).unlink(missing_ok=True)
+
+
+def ingest_existing_files(
+    db: Session,
+    paths: List[Path],
+    rating: RatingEnum = RatingEnum.safe,
+    tag_names: Optional[List[str]] = None,
+    album_ids: Optional[List[int]] = None,
+    source: Optional[str] = None,
+    hashes: Optional[Dict[Path, str]] = None,
+    job: Optional[Job] = None
+) -> Dict[str, int]:
+    """
+    Ingest files that already live in ORIGINAL_DIR (kept in place, like
+    scanned uploads). Hashes already known from a scan can be passed in.
+    Submitting to the media pool blocks while its queue is full, which
+    throttles callers feeding large folders. Caches are left to the caller.
+    """
+    from ..utils.media_processor import calculate_file_hash
+
+    stats = {"imported": 0, "duplicates": 0, "failed": 0}
+
+    def report(file_path: Path, status: str, **extra):
+        stats[status if status != "duplicate" else "duplicates"] += 1
+        if job:
+            job.add_event(filename=file_path.name, status=status, **extra)
+            job.update(advance=1)
+
+    relative_paths = {}
+    for file_path in paths:
+        try:
+            relative_paths[file_path] = str(file_path.relative_to(settings.BASE_DIR))
+        except ValueError as e:
+            report(file_path, "failed", error=str(e))
+    tracked = tracked_paths(db, list(relative_paths.values()))
+
+    candidates = []
+    for file_path, relative_path in relative_paths.items():
+        try:
+            if relative_path in tracked:
+                report(file_path, "duplicate")
+                continue
+            if not file_path.is_file():
+                # Moved or deleted between the scan and the import
+                report(file_path, "failed", error="File no longer exists")
+                continue
+            file_hash = (hashes or {}).get(file_path) or calculate_file_hash(file_path)
+            candidates.append((file_path, file_hash))
+        except Exception as e:
+            logger.error(f"Hashing {file_path} failed: {e}")
+            report(file_path, "failed", error=str(e))
+
+    candidate_hashes = [file_hash for _, file_hash in candidates]
+    existing = set()
+    if candidate_hashes:
+        existing = {h for (h,) in db.query(Media.hash).filter(Media.hash.in_(candidate_hashes)).all()}
+
+    pending = []
+    for file_path, file_hash in candidates:
+        if file_hash in existing:
+            report(file_path, "duplicate")
+            continue
+        existing.add(file_hash)
+        pending.append((file_path, file_hash, media_processing.process_media(file_path, thumbnail_path_for(file_path), file_hash)))
+
+    ready = []
+    for file_path, file_hash, future in pending:
+        try:
+            metadata = future.result()
+        except Exception as e:
+            logger.error(f"Processing {file_path.name} failed: {e}")
+            report(file_path, "failed", error=str(e))
+            continue
+        ready.append({
+            'file_path': file_path,
+            'file_hash': file_hash,
+            'thumbnail_generated': metadata.pop('thumbnail_generated'),
+            'metadata': metadata,
+            'scanned': True
+        })
+
+    try:
+        inserted = write_processed_media(db, ready, rating, tag_names or [], album_ids or [], source)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Writing ingested files failed: {e}")
+        discard_processed_files(ready, db)
+        for item in ready:
+            report(item['file_path'], "failed", error=str(e))
+        return stats
+
+    for item in ready:
+        media_id = inserted.get(item['file_hash'])
+        if media_id is None:
+            discard_processed_files([item], db)
+            report(item['file_path'], "duplicate")
+        else:
+            report(item['file_path'], "imported", media_id=media_id)
+    return stats
+
+
+def run_untracked_import(
+    job: Job,
+    rating: RatingEnum,
+    tag_names: List[str],
+    album_ids: List[int],
+    source: Optional[str] = None
+) -> dict:
+    """Background job: import every untracked file in ORIGINAL_DIR"""
+    from ..database import SessionLocal
+    from ..utils.cache import invalidate_media_cache, invalidate_tag_cache, invalidate_album_cache
+    from ..utils.file_scanner import find_untracked_media
+
+    db = SessionLocal()
+    stats = {"imported": 0, "duplicates": 0, "failed": 0}
+    try:
+        # Unchanged files reuse the hashes stored by the last scan
+        job.update(message="scanning")
+        files = find_untracked_media(db, job)['files']
+        hashes = {Path(f['path']): f['hash'] for f in files}
+        paths = list(hashes.keys())
+
+        job.update(progress=0, total=len(paths), message="importing")
+        for i in range(0, len(paths), UNTRACKED_IMPORT_BATCH_SIZE):
+            if job.cancel_requested:
+                break
+            batch_stats = ingest_existing_files(
+                db, paths[i:i + UNTRACKED_IMPORT_BATCH_SIZE], rating, tag_names, album_ids, source, hashes, job
+            )
+            for key, value in batch_stats.items():
+                stats[key] += value
+    finally:
+        db.close()
+        if stats["imported"]:
+            invalidate_media_cache()
+            invalidate_tag_cache()
+            if album_ids:
+                invalidate_album_cache()
+
+    job.result = stats
+    job.check_cancelled()
+    return stats
+
+
+def run_archive_import(
+    job: Job,
+    archive_path: Path,
+    archive_name: str,
+    rating: RatingEnum,
+    tag_names: List[str],
+    album_ids: List[int],
+    source: Optional[str] = None
+) -> dict:
+    """Background job: ingest every supported file of an uploaded archive"""
+    from ..database import SessionLocal
+    from ..utils.cache import invalidate_media_cache, invalidate_tag_cache, invalidate_album_cache
+
+    db = SessionLocal()
+    stats = {"imported": 0, "duplicates": 0, "failed": 0}
+    seen_hashes = set()
+    pending = []
+
+    def flush():
+        """Wait for queued processing and write the finished files in one commit"""
+        ready = []
+        for name, file_path, file_hash, future in pending:
+            try:
+                metadata = future.result()
+            except Exception as e:
+                logger.error(f"Processing {name} from archive failed: {e}")
+                file_path.unlink(missing_ok=True)
+                stats["failed"] += 1
+                job.add_event(filename=name, status="failed", error=str(e))
+                job.update(advance=1)
+                continue
+            ready.append({
+                'name': name,
+                'file_path': file_path,
+                'file_hash': file_hash,
+                'thumbnail_generated': metadata.pop('thumbnail_generated'),
+                'metadata': metadata
+            })
+        pending.clear()
+
+        try:
+            inserted = write_processed_media(db, ready, rating, tag_names, album_ids, source)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Writing archive batch failed: {e}")
+            discard_processed_files(ready, db)
+            for item in ready:
+                stats["failed"] += 1
+                job.add_event(filename=item['name'], status="failed", error=str(e))
+            job.update(advance=len(ready))
+            return
+
+        for item in ready:
+            media_id = inserted.get(item['file_hash'])
+            if media_id is None:
+                discard_processed_files([item], db)
+                stats["duplicates"] += 1
+                job.add_event(filename=item['name'], status="duplicate")
+            else:
+                stats["imported"] += 1
+                job.add_event(filename=item['name'], status="imported", media_id=media_id)
+        job.update(advance=len(ready))
+
+    try:
+        job.update(total=count_archive_members(archive_path, archive_name))
+
+        for name, stream in iter_archive_members(archive_path, archive_name):
+            if job.cancel_requested:
+                break
+
+            temp_path, file_hash, _ = stage_stream(stream)
+
+            if file_hash in seen_hashes or db.query(Media.id).filter(Media.hash == file_hash).first():
+                temp_path.unlink(missing_ok=True)
+                stats["duplicates"] += 1
+                job.add_event(filename=name, status="duplicate")
+                job.update(advance=1)
+                continue
+            seen_hashes.add(file_hash)
+
+            file_path = place_staged_file(temp_path, name)
+            future = media_processing.process_media(file_path, thumbnail_path_for(file_path), file_hash)
+            pending.append((name, file_path, file_hash, future))
+
+            if len(pending) >= INGEST_BATCH_SIZE:
+                flush()
+    finally:
+        # Write whatever was already queued, even when stopping early
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"Writing final archive batch failed: {e}")
+        db.close()
+        archive_path.unlink(missing_ok=True)
+        if stats["imported"]:
+            invalidate_media_cache()
+            invalidate_tag_cache()
+            if album_ids:
+                invalidate_album_cache()
+
+    job.result = stats
+    job.check_cancelled()
+    return stats
@@ -0,0 +1,150 @@
+"""
+Process pool for CPU-heavy media work.
+
+Probing (libmagic, cv2), decoding and thumbnail generation run in separate
+worker processes so they neither block the event loop nor serialize behind
+the GIL. Submissions go through a bounded queue: once every worker is busy
+and the queue is full, callers wait for a free slot instead of piling up
+work in memory.
+"""
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from ..config import settings
+from ..schemas import FileTypeEnum
+
+logger = logging.getLogger(__name__)
+
+
+def process_and_thumbnail(file_path: str, thumbnail_path: str, file_hash: Optional[str] = None) -> dict:
+    """Extract metadata and generate the thumbnail for one file (runs in a worker)"""
+    from ..utils.media_processor import process_media_file
+    from ..utils.thumbnail_generator import generate_thumbnail
+
+    source = Path(file_path)
+    metadata = process_media_file(source, file_hash)
+    metadata['thumbnail_generated'] = generate_thumbnail(source, Path(thumbnail_path), metadata['file_type'])
+    return metadata
+
+
+def thumbnail_only(file_path: str, thumbnail_path: str, file_type: FileTypeEnum) -> bool:
+    """Generate a thumbnail for a file whose type is already known (runs in a worker)"""
+    from ..utils.thumbnail_generator import generate_thumbnail
+
+    return generate_thumbnail(Path(file_path), Path(thumbnail_path), file_type)
+
+
+def perceptual_hash_only(file_path: str, file_type: FileTypeEnum) -> Optional[str]:
+    """Calculate the perceptual hash of an existing file (runs in a worker)"""
+    from ..utils.media_processor import calculate_perceptual_hash
+
+    return calculate_perceptual_hash(Path(file_path), file_type)
+
+
+class MediaProcessingService:
+    """Bounded process pool shared by upload, import and thumbnail regeneration"""
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[threading.BoundedSemaphore] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    workers = settings.MEDIA_PROCESSING_WORKERS
+                    queue_size = settings.MEDIA_PROCESSING_QUEUE_SIZE
+                    if self._slots is None:
+                        self._slots = threading.BoundedSemaphore(workers + queue_size)
+                    # spawn: forking a threaded server process is not safe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+                    logger.info(f"Media processing pool started ({workers} workers, queue {queue_size})")
+        return self._executor
+
+    def _discard_broken(self, executor: ProcessPoolExecutor):
+        """Drop a pool whose worker died so the next submission starts a fresh one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _submit_with_slot(self, fn: Callable, *args) -> Future:
+        slots = self._slots
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                self._discard_broken(executor)
+                executor = self._get_executor()
+                future = executor.submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+
+        def on_done(done: Future):
+            slots.release()
+            if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+                logger.error("Media processing worker died, restarting pool")
+                self._discard_broken(executor)
+
+        future.add_done_callback(on_done)
+        return future
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue a job from synchronous code, blocking while the queue is full"""
+        self._get_executor()
+        self._slots.acquire()
+        return self._submit_with_slot(fn, *args)
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Queue a job from async code and await its result without blocking the loop"""
+        self._get_executor()
+        if not self._slots.acquire(blocking=False):
+            loop = asyncio.get_running_loop()
+            acquire = loop.run_in_executor(None, self._slots.acquire)
+            try:
+                # Shielded so the executor thread's acquire is always observed
+                await asyncio.shield(acquire)
+            except asyncio.CancelledError:
+                # The thread still takes the slot; hand it back once it does
+                slots = self._slots
+                acquire.add_done_callback(lambda done: done.cancelled() or slots.release())
+                raise
+        return await asyncio.wrap_future(self._submit_with_slot(fn, *args))
+
+    def process_media(self, file_path: Path, thumbnail_path: Path, file_hash: Optional[str] = None) -> Future:
+        """Queue metadata extraction plus thumbnail generation"""
+        return self.submit(process_and_thumbnail, str(file_path), str(thumbnail_path), file_hash)
+
+    async def process_media_async(self, file_path: Path, thumbnail_path: Path, file_hash: Optional[str] = None) -> dict:
+        """Await metadata extraction plus thumbnail generation"""
+        return await self.run(process_and_thumbnail, str(file_path), str(thumbnail_path), file_hash)
+
+    def generate_thumbnail(self, file_path: Path, thumbnail_path: Path, file_type: FileTypeEnum) -> Future:
+        """Queue thumbnail generation for a file of known type"""
+        return self.submit(thumbnail_only, str(file_path), str(thumbnail_path), file_type)
+
+    def perceptual_hash(self, file_path: Path, file_type: FileTypeEnum) -> Future:
+        """Queue perceptual hashing for a file of known type"""
+        return self.submit(perceptual_hash_only, str(file_path), file_type)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            logger.info("Shutting down media processing pool...")
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+media_processing = MediaProcessingService()
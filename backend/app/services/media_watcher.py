@@ -0,0 +1,221 @@
+"""
+Optional filesystem watcher that auto-ingests files dropped into ORIGINAL_DIR.
+
+Uses watchdog (inotify on Linux). Events only mark a path as dirty; a file is
+ingested once no event arrived for AUTO_INGEST_DEBOUNCE_SECONDS and its
+size/mtime stayed the same across two checks, so files still being copied
+are not picked up half-written. Settled files are handed to a single ingest
+thread through a bounded queue in batches: when ingest falls behind, the
+debouncer blocks and further events simply accumulate as dirty paths.
+
+With several uvicorn workers only the process holding the lock file watches.
+"""
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..utils.file_scanner import is_supported_file
+from .media_ingest import INGEST_BATCH_SIZE, UPLOAD_TEMP_PREFIX, ingest_existing_files
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Batches waiting for the ingest thread before the debouncer blocks
+MAX_QUEUED_BATCHES = 4
+CHECK_INTERVAL = 0.5
+LOCK_FILENAME = "media_watcher.lock"
+
+
+class MediaWatcher:
+    """Watches ORIGINAL_DIR and feeds settled files to the ingest pipeline"""
+
+    def __init__(self):
+        self._observer = None
+        self._lock_file = None
+        self._dirty: Dict[str, float] = {}
+        self._settling: Dict[str, Tuple[float, int, int]] = {}
+        self._dirty_lock = threading.Lock()
+        self._batches: "queue.Queue[Optional[List[Path]]]" = queue.Queue(maxsize=MAX_QUEUED_BATCHES)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def running(self) -> bool:
+        return self._observer is not None
+
+    def _acquire_lock(self) -> bool:
+        if fcntl is None:
+            return True
+        lock_file = open(settings.DATA_DIR / LOCK_FILENAME, "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _release_lock(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def mark_dirty(self, path: str):
+        name = Path(path).name
+        if name.startswith(UPLOAD_TEMP_PREFIX) or not is_supported_file(name):
+            return
+        with self._dirty_lock:
+            self._dirty[path] = time.monotonic()
+
+    def start(self) -> bool:
+        if self.running or not settings.AUTO_INGEST_ENABLED:
+            return False
+
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logger.warning("Auto-ingest is enabled but watchdog is not installed")
+            return False
+
+        if not self._acquire_lock():
+            logger.info("Auto-ingest watcher already running in another worker")
+            return False
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    watcher.mark_dirty(event.src_path)
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    watcher.mark_dirty(event.src_path)
+
+            def on_closed(self, event):
+                if not event.is_directory:
+                    watcher.mark_dirty(event.src_path)
+
+            def on_moved(self, event):
+                # Staged uploads, archive and backup imports are renamed into
+                # place by the app itself, which also writes their rows
+                if not event.is_directory and not Path(event.src_path).name.startswith(UPLOAD_TEMP_PREFIX):
+                    watcher.mark_dirty(event.dest_path)
+
+        self._stop.clear()
+        observer = Observer()
+        observer.schedule(Handler(), str(settings.ORIGINAL_DIR), recursive=True)
+        observer.daemon = True
+        observer.start()
+        self._observer = observer
+
+        self._threads = [
+            threading.Thread(target=self._debounce_loop, name="auto-ingest-debounce", daemon=True),
+            threading.Thread(target=self._ingest_loop, name="auto-ingest", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return True
+
+    def _collect_settled(self) -> List[Path]:
+        """Paths that saw no event for the debounce period and kept their size/mtime"""
+        now = time.monotonic()
+        debounce = settings.AUTO_INGEST_DEBOUNCE_SECONDS
+        with self._dirty_lock:
+            quiet = [path for path, last_event in self._dirty.items() if now - last_event >= debounce]
+
+        settled = []
+        for path in quiet:
+            try:
+                stat = Path(path).stat()
+            except OSError:
+                # Deleted or moved away before it settled
+                with self._dirty_lock:
+                    self._dirty.pop(path, None)
+                self._settling.pop(path, None)
+                continue
+
+            signature = (stat.st_size, stat.st_mtime_ns)
+            previous = self._settling.get(path)
+            if previous is None or previous[1:] != signature:
+                self._settling[path] = (now, *signature)
+                continue
+
+            with self._dirty_lock:
+                # A new event arrived meanwhile - wait for the next quiet period
+                if self._dirty.get(path, now) > previous[0]:
+                    self._settling[path] = (now, *signature)
+                    continue
+                self._dirty.pop(path, None)
+            self._settling.pop(path, None)
+            settled.append(Path(path))
+        return settled
+
+    def _debounce_loop(self):
+        while not self._stop.wait(CHECK_INTERVAL):
+            settled = self._collect_settled()
+            for i in range(0, len(settled), INGEST_BATCH_SIZE):
+                batch = settled[i:i + INGEST_BATCH_SIZE]
+                # Back-pressure: wait while the ingest thread is busy
+                while not self._stop.is_set():
+                    try:
+                        self._batches.put(batch, timeout=1)
+                        break
+                    except queue.Full:
+                        continue
+
+    def _ingest_loop(self):
+        from ..database import SessionLocal
+        from ..utils.cache import invalidate_media_cache, invalidate_tag_cache
+
+        while True:
+            batch = self._batches.get()
+            if batch is None:
+                return
+
+            db = SessionLocal()
+            try:
+                stats = ingest_existing_files(db, batch)
+                if any(stats.values()):
+                    logger.info(f"Auto-ingest: {stats}")
+                if stats["imported"]:
+                    invalidate_media_cache()
+                    invalidate_tag_cache()
+            except Exception as e:
+                logger.error(f"Auto-ingest batch failed: {e}")
+            finally:
+                db.close()
+
+    def stop(self):
+        if not self.running:
+            return
+
+        self._stop.set()
+        self._observer.stop()
+        self._observer.join(timeout=5)
+        self._observer = None
+
+        # Let the ingest thread finish its current batch and exit
+        while True:
+            try:
+                self._batches.get_nowait()
+            except queue.Empty:
+                break
+        self._batches.put(None)
+        for thread in self._threads:
+            thread.join(timeout=10)
+        self._threads = []
+        self._release_lock()
+        logger.info("Auto-ingest watcher stopped")
+
+
+media_watcher = MediaWatcher()
@@ -0,0 +1,329 @@
+"""
+In-memory near-duplicate index over media perceptual hashes.
+
+A BK-tree keyed on Hamming distance answers "media within distance d of
+this hash" by descending only into subtrees whose edge distance lies in
+[dist - d, dist + d]. The tree is built in a background thread at startup
+(lookups find no matches until it is ready) and kept current
+incrementally: rows with a higher ID are picked up on every lookup, and the
+whole tree is rebuilt periodically in the background, the old tree serving
+until the new one is swapped in, so changes made in other worker processes
+(deletions, backfilled hashes) are not missed.
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..models import Media
+from .jobs import Job
+
+logger = logging.getLogger(__name__)
+
+# Bits (out of 64) that may differ for two files to count as near duplicates
+DEFAULT_NEAR_DUPLICATE_DISTANCE = 6
+MAX_NEAR_DUPLICATE_DISTANCE = 16
+# Seconds before the index is rebuilt from the database
+INDEX_REBUILD_INTERVAL = 600
+# Hashes written to the database per commit while backfilling
+BACKFILL_BATCH_SIZE = 500
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class _Node:
+    __slots__ = ('value', 'media_ids', 'children')
+
+    def __init__(self, value: int):
+        self.value = value
+        self.media_ids = set()
+        self.children: Dict[int, '_Node'] = {}
+
+
+class BKTree:
+    """BK-tree of 64-bit hashes; identical hashes share a node"""
+
+    def __init__(self):
+        self.root: Optional[_Node] = None
+
+    def _find_or_create(self, value: int) -> _Node:
+        if self.root is None:
+            self.root = _Node(value)
+            return self.root
+
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node.value)
+            if distance == 0:
+                return node
+            child = node.children.get(distance)
+            if child is None:
+                child = _Node(value)
+                node.children[distance] = child
+                return child
+            node = child
+
+    def add(self, value: int, media_id: int):
+        self._find_or_create(value).media_ids.add(media_id)
+
+    def remove(self, value: int, media_id: int):
+        # Emptied nodes stay in place to keep the tree valid
+        node = self.root
+        while node is not None:
+            distance = hamming_distance(value, node.value)
+            if distance == 0:
+                node.media_ids.discard(media_id)
+                return
+            node = node.children.get(distance)
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """Return (media_id, distance) for every entry within max_distance"""
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node.value)
+            if distance <= max_distance:
+                results.extend((media_id, distance) for media_id in node.media_ids)
+            low, high = distance - max_distance, distance + max_distance
+            for edge, child in node.children.items():
+                if low <= edge <= high:
+                    stack.append(child)
+        return results
+
+
+class PerceptualHashIndex:
+    """Process-wide BK-tree over Media.perceptual_hash"""
+
+    def __init__(self):
+        self._tree = BKTree()
+        self._hashes: Dict[int, int] = {}
+        self._max_id = 0
+        self._built_at: Optional[float] = None
+        self._rebuilding = False
+        self._lock = threading.Lock()
+        # Serializes full builds
+        self._build_lock = threading.Lock()
+
+    def _build(self, db: Session):
+        """Build a new tree and swap it in; caller holds _build_lock"""
+        tree = BKTree()
+        hashes = {}
+        rows = db.query(Media.id, Media.perceptual_hash).filter(
+            Media.perceptual_hash.isnot(None)
+        ).yield_per(10000)
+        for media_id, perceptual_hash in rows:
+            value = int(perceptual_hash, 16)
+            tree.add(value, media_id)
+            hashes[media_id] = value
+
+        # Rows added meanwhile have higher IDs and are loaded by the next refresh
+        with self._lock:
+            self._tree = tree
+            self._hashes = hashes
+            self._max_id = max(hashes, default=0)
+            self._built_at = time.time()
+        logger.info(f"Perceptual hash index built ({len(hashes)} media)")
+
+    def rebuild(self, db: Session):
+        with self._build_lock:
+            self._build(db)
+
+    def _rebuild_in_background(self):
+        from ..database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            self.rebuild(db)
+        except Exception as e:
+            logger.error(f"Perceptual hash index rebuild failed: {e}")
+        finally:
+            db.close()
+            with self._lock:
+                self._rebuilding = False
+
+    def schedule_rebuild(self):
+        """Rebuild in a background thread unless a rebuild is already running"""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, name="phash-index-rebuild", daemon=True).start()
+
+    def refresh(self, db: Session) -> bool:
+        """
+        Load rows added since the last refresh and schedule background
+        rebuilds. Returns False while the first build has not finished.
+        """
+        if self._built_at is None:
+            self.schedule_rebuild()
+            return False
+
+        if time.time() - self._built_at > INDEX_REBUILD_INTERVAL:
+            self.schedule_rebuild()
+
+        rows = db.query(Media.id, Media.perceptual_hash).filter(
+            Media.id > self._max_id,
+            Media.perceptual_hash.isnot(None)
+        ).all()
+        for media_id, perceptual_hash in rows:
+            self.add(media_id, perceptual_hash)
+        return True
+
+    def add(self, media_id: int, perceptual_hash: str):
+        value = int(perceptual_hash, 16)
+        with self._lock:
+            previous = self._hashes.get(media_id)
+            if previous is not None:
+                self._tree.remove(previous, media_id)
+            self._tree.add(value, media_id)
+            self._hashes[media_id] = value
+            self._max_id = max(self._max_id, media_id)
+
+    def remove(self, media_id: int):
+        with self._lock:
+            value = self._hashes.pop(media_id, None)
+            if value is not None:
+                self._tree.remove(value, media_id)
+
+    def search(self, db: Session, perceptual_hash: str, max_distance: int = DEFAULT_NEAR_DUPLICATE_DISTANCE,
+               exclude_id: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Return (media_id, distance) pairs near a hash, closest first"""
+        if not self.refresh(db):
+            return []
+        with self._lock:
+            matches = self._tree.search(int(perceptual_hash, 16), max_distance)
+        matches = [(media_id, distance) for media_id, distance in matches if media_id != exclude_id]
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
+
+    def clusters(self, db: Session, max_distance: int = DEFAULT_NEAR_DUPLICATE_DISTANCE) -> List[List[int]]:
+        """
+        Group media into near-duplicate clusters (single linkage: every item
+        is within max_distance of at least one other item of its cluster).
+        Builds the index first if needed, so call it from a background job.
+        """
+        if not self.refresh(db):
+            self.rebuild(db)
+        with self._lock:
+            hashes = dict(self._hashes)
+
+        # Searched without the lock, so it gets its own tree that add() and
+        # remove() do not touch
+        tree = BKTree()
+        for media_id, value in hashes.items():
+            tree.add(value, media_id)
+
+        parent = {media_id: media_id for media_id in hashes}
+
+        def find(media_id: int) -> int:
+            while parent[media_id] != media_id:
+                parent[media_id] = parent[parent[media_id]]
+                media_id = parent[media_id]
+            return media_id
+
+        for media_id, value in hashes.items():
+            root = find(media_id)
+            for other_id, _ in tree.search(value, max_distance):
+                if other_id in parent:
+                    other_root = find(other_id)
+                    if other_root != root:
+                        parent[other_root] = root
+
+        groups: Dict[int, List[int]] = {}
+        for media_id in hashes:
+            groups.setdefault(find(media_id), []).append(media_id)
+
+        clusters = [sorted(group) for group in groups.values() if len(group) > 1]
+        clusters.sort(key=lambda group: (-len(group), group[0]))
+        return clusters
+
+
+phash_index = PerceptualHashIndex()
+
+
+def find_near_duplicates(db: Session, perceptual_hash: Optional[str], exclude_id: Optional[int] = None,
+                         max_distance: int = DEFAULT_NEAR_DUPLICATE_DISTANCE) -> List[dict]:
+    """Existing media that look like the given hash, closest first"""
+    if not perceptual_hash:
+        return []
+
+    matches = phash_index.search(db, perceptual_hash, max_distance, exclude_id)
+    if not matches:
+        return []
+
+    # The index may still hold media deleted by another worker
+    existing = {media_id for (media_id,) in db.query(Media.id).filter(
+        Media.id.in_([media_id for media_id, _ in matches])
+    ).all()}
+    return [
+        {"id": media_id, "distance": distance}
+        for media_id, distance in matches if media_id in existing
+    ]
+
+
+def run_near_duplicate_report(job: Job, max_distance: int) -> dict:
+    """Background job: hash media that has no perceptual hash yet, then cluster the library"""
+    from ..config import settings
+    from ..database import SessionLocal
+    from .media_processing import media_processing
+
+    db = SessionLocal()
+    try:
+        rows = db.query(Media.id, Media.path, Media.file_type).filter(
+            Media.perceptual_hash.is_(None)
+        ).all()
+
+        hashed = 0
+        if rows:
+            job.update(progress=0, total=len(rows), message="hashing")
+            futures = []
+            for media_id, path, file_type in rows:
+                if job.cancel_requested:
+                    break
+                file_path = settings.BASE_DIR / path
+                if file_path.is_file():
+                    futures.append((media_id, media_processing.perceptual_hash(file_path, file_type)))
+                else:
+                    job.update(advance=1)
+
+            updates = []
+            for media_id, future in futures:
+                try:
+                    perceptual_hash = future.result()
+                except Exception as e:
+                    logger.error(f"Perceptual hashing failed for media {media_id}: {e}")
+                    perceptual_hash = None
+                if perceptual_hash:
+                    updates.append({'id': media_id, 'perceptual_hash': perceptual_hash})
+                job.update(advance=1)
+
+                if len(updates) >= BACKFILL_BATCH_SIZE:
+                    db.bulk_update_mappings(Media, updates)
+                    db.commit()
+                    hashed += len(updates)
+                    updates = []
+
+            if updates:
+                db.bulk_update_mappings(Media, updates)
+                db.commit()
+                hashed += len(updates)
+
+        job.check_cancelled()
+        job.update(message="clustering")
+        phash_index.rebuild(db)
+        clusters = phash_index.clusters(db, max_distance)
+
+        return {
+            "hashed": hashed,
+            "max_distance": max_distance,
+            "cluster_count": len(clusters),
+            "media_count": sum(len(cluster) for cluster in clusters),
+            "clusters": clusters
+        }
+    finally:
+        db.close()
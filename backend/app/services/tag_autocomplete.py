@@ -0,0 +1,282 @@
+"""
+In-memory prefix index for tag autocomplete.
+
+Tag names and alias names are kept in one sorted array, so the entries that
+start with a prefix form a contiguous range found with two binary searches.
+For prefixes of up to PREFIX_BUCKET_LENGTH characters, whose ranges cover a
+large part of the vocabulary, the best TOP_K tags by post count are
+precomputed; longer prefixes rank their (small) range on demand.
+
+The index is built in the background at startup; until it is ready,
+lookups go to the database. Tags created in this process are inserted on
+the next lookup after tag caches are invalidated, and post count changes
+are applied as they are written. Deletions, category and alias changes
+request a full rebuild, which runs in the background (the old index keeps
+serving), as does the rebuild at least every INDEX_REBUILD_INTERVAL
+seconds that picks up edits made by other workers.
+"""
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import desc
+from sqlalchemy.orm import Session
+
+from ..models import Tag, TagAlias
+
+logger = logging.getLogger(__name__)
+
+# Prefix lengths with precomputed suggestions
+PREFIX_BUCKET_LENGTH = 2
+# Suggestions kept per precomputed prefix
+TOP_K = 100
+# Seconds before the index is rebuilt from the database
+INDEX_REBUILD_INTERVAL = 300
+
+# name, category, post_count
+TagInfo = Tuple[str, str, int]
+
+
+class _Snapshot:
+    __slots__ = ('names', 'targets', 'tags', 'aliases', 'buckets', 'max_id')
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.targets: List[int] = []
+        self.tags: Dict[int, TagInfo] = {}
+        self.aliases: Dict[str, int] = {}
+        self.buckets: Dict[str, List[int]] = {}
+        self.max_id = 0
+
+
+def _rank_key(tags: Dict[int, TagInfo]):
+    """Most used first, then alphabetical"""
+    return lambda tag_id: (-tags[tag_id][2], tags[tag_id][0])
+
+
+class TagAutocompleteIndex:
+    """Process-wide sorted-array index over tag and alias names"""
+
+    def __init__(self):
+        self._snapshot: Optional[_Snapshot] = None
+        self._built_at: Optional[float] = None
+        self._dirty = False
+        self._stale = False
+        self._rebuilding = False
+        self._rebuild_again = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prefix_range(names: List[str], prefix: str) -> Tuple[int, int]:
+        return bisect_left(names, prefix), bisect_left(names, prefix + '\uffff')
+
+    def _top_ids(self, snapshot: _Snapshot, start: int, end: int, limit: int) -> List[int]:
+        tag_ids = {snapshot.targets[i] for i in range(start, end) if snapshot.targets[i] in snapshot.tags}
+        return heapq.nsmallest(limit, tag_ids, key=_rank_key(snapshot.tags))
+
+    def _build(self, db: Session) -> _Snapshot:
+        snapshot = _Snapshot()
+        rows = db.query(Tag.id, Tag.name, Tag.category, Tag.post_count).yield_per(10000)
+        for tag_id, name, category, post_count in rows:
+            category = category.value if hasattr(category, 'value') else str(category)
+            snapshot.tags[tag_id] = (name, category, post_count or 0)
+            snapshot.max_id = max(snapshot.max_id, tag_id)
+
+        entries = [(name, tag_id) for tag_id, (name, _, _) in snapshot.tags.items()]
+        for alias_name, target_id in db.query(TagAlias.alias_name, TagAlias.target_tag_id).yield_per(10000):
+            alias_name = alias_name.lower()
+            snapshot.aliases[alias_name] = target_id
+            entries.append((alias_name, target_id))
+
+        entries.sort()
+        snapshot.names = [name for name, _ in entries]
+        snapshot.targets = [tag_id for _, tag_id in entries]
+
+        prefixes = {name[:length] for name in snapshot.names for length in range(1, PREFIX_BUCKET_LENGTH + 1)}
+        for prefix in prefixes:
+            start, end = self._prefix_range(snapshot.names, prefix)
+            snapshot.buckets[prefix] = self._top_ids(snapshot, start, end, TOP_K)
+        return snapshot
+
+    def rebuild(self, db: Session):
+        snapshot = self._build(db)
+        with self._lock:
+            self._snapshot = snapshot
+            self._built_at = time.time()
+        logger.info(f"Tag autocomplete index built ({len(snapshot.tags)} tags, {len(snapshot.aliases)} aliases)")
+
+    def _rebuild_in_background(self):
+        from ..database import SessionLocal
+
+        while True:
+            db = SessionLocal()
+            try:
+                self.rebuild(db)
+            except Exception as e:
+                logger.error(f"Tag autocomplete rebuild failed: {e}")
+            finally:
+                db.close()
+
+            with self._lock:
+                if not self._rebuild_again:
+                    self._rebuilding = False
+                    return
+                self._rebuild_again = False
+
+    def schedule_rebuild(self):
+        """Rebuild in a background thread; coalesces with a rebuild already running"""
+        with self._lock:
+            if self._rebuilding:
+                self._rebuild_again = True
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, name="tag-autocomplete-rebuild", daemon=True).start()
+
+    def _load_new_tags(self, db: Session):
+        """Insert tags created since the last build without rebuilding"""
+        snapshot = self._snapshot
+        rows = db.query(Tag.id, Tag.name, Tag.category, Tag.post_count).filter(Tag.id > snapshot.max_id).all()
+        with self._lock:
+            for tag_id, name, category, post_count in rows:
+                category = category.value if hasattr(category, 'value') else str(category)
+                snapshot.tags[tag_id] = (name, category, post_count or 0)
+                snapshot.max_id = max(snapshot.max_id, tag_id)
+                position = bisect_left(snapshot.names, name)
+                snapshot.names.insert(position, name)
+                snapshot.targets.insert(position, tag_id)
+                self._update_buckets(snapshot, tag_id)
+
+    @staticmethod
+    def _update_buckets(snapshot: _Snapshot, tag_id: int):
+        """Let a new or more used tag into the precomputed buckets of its prefixes"""
+        name = snapshot.tags[tag_id][0]
+        rank = _rank_key(snapshot.tags)
+        for length in range(1, min(len(name), PREFIX_BUCKET_LENGTH) + 1):
+            bucket = snapshot.buckets.setdefault(name[:length], [])
+            if tag_id in bucket:
+                continue
+            if len(bucket) < TOP_K:
+                bucket.append(tag_id)
+                continue
+            # Buckets are unordered; swap out the weakest entry if the tag outranks it
+            weakest = max(range(len(bucket)), key=lambda i: rank(bucket[i]) if bucket[i] in snapshot.tags else (1, ''))
+            if bucket[weakest] not in snapshot.tags or rank(tag_id) < rank(bucket[weakest]):
+                bucket[weakest] = tag_id
+
+    def apply_count_deltas(self, deltas: Dict[int, int]):
+        """
+        Apply post count changes without a rebuild. A tag whose count drops
+        stays in its buckets until the next rebuild, which may briefly hide a
+        tag that now outranks it in two-character prefixes.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return
+        with self._lock:
+            for tag_id, delta in deltas.items():
+                info = snapshot.tags.get(tag_id)
+                if info is None:
+                    # Created in this transaction; loaded with its count on the next lookup
+                    continue
+                name, category, post_count = info
+                snapshot.tags[tag_id] = (name, category, max(post_count + delta, 0))
+                if delta > 0:
+                    self._update_buckets(snapshot, tag_id)
+
+    def refresh(self, db: Session) -> bool:
+        """
+        Apply pending changes and schedule background rebuilds. Returns
+        False while the first build has not finished.
+        """
+        if self._snapshot is None:
+            self.schedule_rebuild()
+            return False
+
+        if self._dirty:
+            self._dirty = False
+            self._load_new_tags(db)
+        if self._stale or time.time() - self._built_at > INDEX_REBUILD_INTERVAL:
+            self._stale = False
+            self.schedule_rebuild()
+        return True
+
+    def invalidate(self, rebuild: bool = False):
+        """
+        Mark the index as changed; new tags are loaded on the next lookup.
+        rebuild requests a full background rebuild, needed after tags or
+        aliases were deleted, recategorized or aliased.
+        """
+        self._dirty = True
+        if rebuild:
+            self._stale = True
+
+    def resolve_alias(self, db: Session, name: str) -> Optional[Tuple[int, TagInfo]]:
+        if not self.refresh(db):
+            row = db.query(Tag.id, Tag.name, Tag.category, Tag.post_count).join(
+                TagAlias, TagAlias.target_tag_id == Tag.id
+            ).filter(TagAlias.alias_name == name.lower()).first()
+            if row is None:
+                return None
+            tag_id, tag_name, category, post_count = row
+            category = category.value if hasattr(category, 'value') else str(category)
+            return tag_id, (tag_name, category, post_count or 0)
+
+        snapshot = self._snapshot
+        tag_id = snapshot.aliases.get(name.lower())
+        if tag_id is None or tag_id not in snapshot.tags:
+            return None
+        return tag_id, snapshot.tags[tag_id]
+
+    def search_prefix(self, db: Session, prefix: str, limit: int) -> List[Tuple[int, TagInfo]]:
+        """Tags whose name or alias starts with prefix, most used first"""
+        prefix = prefix.lower()
+        if not self.refresh(db):
+            rows = db.query(Tag.id, Tag.name, Tag.category, Tag.post_count).filter(
+                Tag.name.like(f"{prefix}%")
+            ).order_by(desc(Tag.post_count), Tag.name).limit(limit).all()
+            return [
+                (tag_id, (name, category.value if hasattr(category, 'value') else str(category), post_count or 0))
+                for tag_id, name, category, post_count in rows
+            ]
+
+        with self._lock:
+            snapshot = self._snapshot
+            bucket = snapshot.buckets.get(prefix) if len(prefix) <= PREFIX_BUCKET_LENGTH else None
+            if bucket is not None and limit <= TOP_K:
+                tag_ids = sorted(
+                    (tag_id for tag_id in bucket if tag_id in snapshot.tags),
+                    key=_rank_key(snapshot.tags)
+                )[:limit]
+            else:
+                start, end = self._prefix_range(snapshot.names, prefix)
+                tag_ids = self._top_ids(snapshot, start, end, limit)
+            return [(tag_id, snapshot.tags[tag_id]) for tag_id in tag_ids]
+
+
+tag_autocomplete = TagAutocompleteIndex()
+
+
+def suggest_tags(db: Session, query: str, limit: int) -> List[dict]:
+    """
+    Prefix matches from the in-memory index. Only when there are none, the
+    database is searched for substring matches: a leading-wildcard ILIKE
+    cannot use an index, so it must not run on every keystroke.
+    """
+    matches = tag_autocomplete.search_prefix(db, query, limit)
+    results = [
+        {"id": tag_id, "name": name, "category": category, "count": post_count}
+        for tag_id, (name, category, post_count) in matches
+    ]
+
+    if not results:
+        fallback = db.query(Tag.id, Tag.name, Tag.category, Tag.post_count).filter(
+            Tag.name.ilike(f"%{query}%")
+        ).order_by(desc(Tag.post_count)).limit(limit).all()
+        for tag_id, name, category, post_count in fallback:
+            category = category.value if hasattr(category, 'value') else str(category)
+            results.append({"id": tag_id, "name": name, "category": category, "count": post_count or 0})
+
+    return results
@@ -0,0 +1,393 @@
+"""
+Precomputed tag co-occurrence for related-tag lookups.
+
+Co-occurrence counts are the tag x tag product A^T A of the sparse media x tag
+incidence matrix A, computed with SciPy CSR matrices in blocks of tag rows so
+memory stays bounded. For every tag the TOP_RELATED strongest related tags
+of each category are stored in blombooru_tag_cooccurrence, together with the
+tag paired with itself (its diagonal entry), which marks the tag as computed.
+Related-tag endpoints then read counts with one indexed lookup.
+
+Whenever tags are added to or removed from media, the touched tags are
+queued and refreshed in the background after REFRESH_DELAY seconds: their
+rows are recomputed from the media carrying them, and the symmetric entries
+in other tags' rows are updated and trimmed. A row that loses an entry is
+not backfilled from below its cut-off until the next full rebuild, which
+admins can start as a background job.
+
+Refreshes are bounded by the media they read: tags on more than
+MAX_REFRESH_POST_COUNT media (generic tags that sit on most posts) are
+skipped, as are the largest remaining tags once MAX_REFRESH_MEDIA is used
+up. Their own rows stay as they are (their entries in refreshed tags' rows
+are still updated) until a full rebuild, which the refresher runs at most
+every FULL_REBUILD_INTERVAL seconds while skipped tags are waiting.
+"""
+import logging
+import threading
+import time
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from ..models import Tag, blombooru_media_tags, blombooru_tag_cooccurrence
+from .jobs import Job
+
+logger = logging.getLogger(__name__)
+
+# Related tags stored per tag and related tag category
+TOP_RELATED = 100
+# Tag rows multiplied at once
+BLOCK_SIZE = 1024
+# Seconds to collect changed tags before refreshing them
+REFRESH_DELAY = 30
+# Above this many changed tags a full rebuild is cheaper than a refresh
+MAX_REFRESH_TAGS = 5000
+# Tags on more media than this are left to the full rebuild
+MAX_REFRESH_POST_COUNT = 5000
+# Media (summed post counts of the refreshed tags) read per refresh
+MAX_REFRESH_MEDIA = 20000
+# Hard cap on (media, tag) pairs read per refresh, in case post counts drifted
+MAX_REFRESH_PAIRS = 1000000
+# Minimum seconds between full rebuilds started by the refresher for skipped tags
+FULL_REBUILD_INTERVAL = 6 * 3600
+# Rows inserted per statement
+INSERT_BATCH_SIZE = 10000
+# (media, tag) rows fetched per round trip by a full rebuild
+READ_BATCH_SIZE = 100000
+
+
+def _incidence_matrix(pairs):
+    """
+    CSR media x tag matrix from (media_id, tag_id) pairs (rows or an n x 2
+    array), with the tag ID of every column
+    """
+    import numpy as np
+    from scipy import sparse
+
+    pair_array = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    media_ids, media_index = np.unique(pair_array[:, 0], return_inverse=True)
+    tag_ids, tag_index = np.unique(pair_array[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pair_array), dtype=np.int32), (media_index, tag_index)),
+        shape=(len(media_ids), len(tag_ids))
+    )
+    return matrix, tag_ids
+
+
+def _co_counts(matrix, columns):
+    """
+    Yield (column, related_columns, counts) for each requested column of the
+    incidence matrix, multiplying BLOCK_SIZE tag rows at a time.
+    """
+    import numpy as np
+
+    transposed = matrix.T.tocsr()
+    columns = np.asarray(columns)
+    for start in range(0, len(columns), BLOCK_SIZE):
+        block_columns = columns[start:start + BLOCK_SIZE]
+        product = (transposed[block_columns] @ matrix).tocsr()
+        for row, column in enumerate(block_columns):
+            begin, end = product.indptr[row], product.indptr[row + 1]
+            yield int(column), product.indices[begin:end], product.data[begin:end]
+
+
+def _top_per_category(related, counts, categories, top_n: int):
+    """Indices into related of the top_n highest counts within each category"""
+    import numpy as np
+
+    keep = []
+    related_categories = categories[related]
+    for category in np.unique(related_categories):
+        in_category = np.flatnonzero(related_categories == category)
+        if len(in_category) > top_n:
+            best = np.argpartition(-counts[in_category], top_n - 1)[:top_n]
+            in_category = in_category[best]
+        keep.append(in_category)
+    return np.concatenate(keep) if keep else np.array([], dtype=np.int64)
+
+
+def _category_codes(db: Session, tag_ids, load_all: bool):
+    """Integer category code for every tag ID, for grouping related tags by category"""
+    import numpy as np
+
+    query = db.query(Tag.id, Tag.category)
+    if not load_all:
+        query = query.filter(Tag.id.in_([int(t) for t in tag_ids]))
+    categories = {tag_id: str(category) for tag_id, category in query.all()}
+    codes = {name: i for i, name in enumerate(sorted(set(categories.values())))}
+    return np.array([codes.get(categories.get(int(t)), -1) for t in tag_ids], dtype=np.int32)
+
+
+def _insert_rows(db: Session, rows: List[dict]):
+    for i in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.execute(blombooru_tag_cooccurrence.insert(), rows[i:i + INSERT_BATCH_SIZE])
+
+
+def _compute_rows(db: Session, pairs, tag_ids: Optional[Iterable[int]] = None,
+                  job: Optional[Job] = None):
+    """
+    Stored rows for the given tags (all tags in pairs when None), plus every
+    nonzero (related, tag, count) entry for updating the other side.
+    """
+    import numpy as np
+
+    matrix, column_tag_ids = _incidence_matrix(pairs)
+    categories = _category_codes(db, column_tag_ids, load_all=tag_ids is None)
+
+    if tag_ids is None:
+        columns = np.arange(len(column_tag_ids))
+    else:
+        columns = np.flatnonzero(np.isin(column_tag_ids, list(tag_ids)))
+
+    if job:
+        job.update(progress=0, total=len(columns), message="computing")
+
+    rows = []
+    symmetric = []
+    for column, related, counts in _co_counts(matrix, columns):
+        tag_id = int(column_tag_ids[column])
+        for i in _top_per_category(related, counts, categories, TOP_RELATED):
+            rows.append({'tag_id': tag_id, 'related_tag_id': int(column_tag_ids[related[i]]), 'count': int(counts[i])})
+        if tag_ids is not None:
+            symmetric.extend(
+                (int(column_tag_ids[r]), tag_id, int(c)) for r, c in zip(related, counts) if r != column
+            )
+        if job:
+            job.update(advance=1)
+            job.check_cancelled()
+    return rows, symmetric
+
+
+def _read_all_pairs(db: Session):
+    """
+    Every (media_id, tag_id) link as an n x 2 array, streamed in batches into
+    an array sized from a count, so no list of row objects is held.
+    """
+    import numpy as np
+
+    capacity = db.query(func.count()).select_from(blombooru_media_tags).scalar() or 0
+    pairs = np.empty((capacity, 2), dtype=np.int64)
+    size = 0
+    result = db.execute(
+        select(blombooru_media_tags.c.media_id, blombooru_media_tags.c.tag_id).execution_options(
+            yield_per=READ_BATCH_SIZE
+        )
+    )
+    for batch in result.partitions():
+        batch = np.array(batch, dtype=np.int64).reshape(-1, 2)
+        if size + len(batch) > len(pairs):
+            # Links added since the count
+            pairs = np.resize(pairs, (max(size + len(batch), 2 * len(pairs)), 2))
+        pairs[size:size + len(batch)] = batch
+        size += len(batch)
+    return pairs[:size]
+
+
+def rebuild_cooccurrence(db: Session, job: Optional[Job] = None) -> int:
+    """Recompute the whole co-occurrence table in one transaction. Returns the number of rows"""
+    if job:
+        job.update(message="reading")
+    pairs = _read_all_pairs(db)
+    rows, _ = _compute_rows(db, pairs, job=job) if len(pairs) else ([], [])
+
+    if job:
+        job.update(message="saving")
+    db.execute(blombooru_tag_cooccurrence.delete())
+    _insert_rows(db, rows)
+    db.commit()
+    return len(rows)
+
+
+def refresh_cooccurrence(db: Session, tag_ids: Iterable[int]) -> Set[int]:
+    """
+    Recompute the rows of some tags and their entries in other tags' rows.
+    Returns the tags skipped to keep the refresh bounded.
+    """
+    requested = set(tag_ids)
+    if not requested:
+        return set()
+
+    post_counts = {
+        tag_id: post_count or 0
+        for tag_id, post_count in db.query(Tag.id, Tag.post_count).filter(Tag.id.in_(requested)).all()
+    }
+    # Smallest first, so the budget covers as many tags as possible; deleted tags cost nothing
+    tag_ids, skipped = [], set()
+    media_budget = MAX_REFRESH_MEDIA
+    for tag_id in sorted(requested, key=lambda t: post_counts.get(t, 0)):
+        post_count = post_counts.get(tag_id, 0)
+        if post_count > MAX_REFRESH_POST_COUNT or post_count > media_budget:
+            skipped.add(tag_id)
+        else:
+            tag_ids.append(tag_id)
+            media_budget -= post_count
+    tag_ids.sort()
+    if not tag_ids:
+        return skipped
+
+    pairs = db.execute(text("""
+        SELECT mt.media_id, mt.tag_id
+        FROM blombooru_media_tags AS mt
+        WHERE mt.media_id IN (
+            SELECT media_id FROM blombooru_media_tags WHERE tag_id = ANY(CAST(:tag_ids AS integer[]))
+        )
+        LIMIT :limit
+    """), {"tag_ids": tag_ids, "limit": MAX_REFRESH_PAIRS + 1}).fetchall()
+    if len(pairs) > MAX_REFRESH_PAIRS:
+        logger.warning(f"Tag co-occurrence refresh of {len(tag_ids)} tags exceeds {MAX_REFRESH_PAIRS} pairs, deferring")
+        return skipped | set(tag_ids)
+    rows, symmetric = _compute_rows(db, pairs, tag_ids) if pairs else ([], [])
+
+    params = {"tag_ids": tag_ids}
+    db.execute(text("""
+        DELETE FROM blombooru_tag_cooccurrence
+        WHERE tag_id = ANY(CAST(:tag_ids AS integer[]))
+           OR related_tag_id = ANY(CAST(:tag_ids AS integer[]))
+    """), params)
+    _insert_rows(db, rows)
+
+    changed = set(tag_ids)
+    symmetric = [entry for entry in symmetric if entry[0] not in changed]
+    if symmetric:
+        # Only tags that were computed already get the entries, so a tag
+        # without its own row is still recognised as missing
+        db.execute(text("""
+            INSERT INTO blombooru_tag_cooccurrence (tag_id, related_tag_id, count)
+            SELECT s.tag_id, s.related_tag_id, s.count
+            FROM unnest(CAST(:tag_ids AS integer[]), CAST(:related_ids AS integer[]), CAST(:counts AS integer[]))
+                 AS s(tag_id, related_tag_id, count)
+            WHERE EXISTS (
+                SELECT 1 FROM blombooru_tag_cooccurrence AS c
+                WHERE c.tag_id = s.tag_id AND c.related_tag_id = s.tag_id
+            )
+            ON CONFLICT (tag_id, related_tag_id) DO UPDATE SET count = EXCLUDED.count
+        """), {
+            "tag_ids": [entry[0] for entry in symmetric],
+            "related_ids": [entry[1] for entry in symmetric],
+            "counts": [entry[2] for entry in symmetric]
+        })
+
+        db.execute(text("""
+            DELETE FROM blombooru_tag_cooccurrence AS c
+            USING (
+                SELECT co.tag_id, co.related_tag_id,
+                       row_number() OVER (
+                           PARTITION BY co.tag_id, t.category
+                           ORDER BY co.count DESC, co.related_tag_id
+                       ) AS rn
+                FROM blombooru_tag_cooccurrence AS co
+                JOIN blombooru_tags AS t ON t.id = co.related_tag_id
+                WHERE co.tag_id = ANY(CAST(:tag_ids AS integer[]))
+            ) AS ranked
+            WHERE c.tag_id = ranked.tag_id
+              AND c.related_tag_id = ranked.related_tag_id
+              AND ranked.rn > :top_n
+        """), {"tag_ids": sorted({entry[0] for entry in symmetric}), "top_n": TOP_RELATED})
+
+    db.commit()
+    return skipped
+
+
+class CooccurrenceRefresher:
+    """Collects tags whose media changed and refreshes them in a background thread"""
+
+    def __init__(self):
+        self._pending: Set[int] = set()
+        # Tags skipped by bounded refreshes, waiting for a full rebuild
+        self._skipped: Set[int] = set()
+        self._rebuilt_at = time.time()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def mark_rebuilt(self):
+        """Record a full rebuild, which covers every skipped tag"""
+        with self._lock:
+            self._skipped = set()
+            self._rebuilt_at = time.time()
+
+    def mark_changed(self, tag_ids: Iterable[int]):
+        with self._lock:
+            self._pending.update(tag_ids)
+            if self._pending and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="tag-cooccurrence-refresh", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        from ..database import SessionLocal
+
+        while True:
+            time.sleep(REFRESH_DELAY)
+            with self._lock:
+                tag_ids = self._pending
+                self._pending = set()
+                if not tag_ids:
+                    self._thread = None
+                    return
+
+            db = SessionLocal()
+            try:
+                if len(tag_ids) > MAX_REFRESH_TAGS:
+                    rebuild_cooccurrence(db)
+                    self.mark_rebuilt()
+                    continue
+
+                skipped = refresh_cooccurrence(db, tag_ids)
+                with self._lock:
+                    self._skipped.update(skipped)
+                    rebuild_due = bool(self._skipped) and time.time() - self._rebuilt_at > FULL_REBUILD_INTERVAL
+                if rebuild_due:
+                    rebuild_cooccurrence(db)
+                    self.mark_rebuilt()
+            except ImportError as e:
+                logger.warning(f"Tag co-occurrence needs numpy and scipy: {e}")
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Tag co-occurrence refresh failed: {e}")
+            finally:
+                db.close()
+
+
+cooccurrence_refresher = CooccurrenceRefresher()
+
+
+def get_related_counts(db: Session, tag_id: int, category=None, limit: int = 25,
+                       exclude_self: bool = False) -> Optional[List[Tuple[Tag, int]]]:
+    """
+    (tag, co-occurrence count) pairs for a tag, most frequent first, or None
+    when the tag has not been computed yet or limit exceeds what is stored.
+    The tag itself is included (with its post count) unless exclude_self.
+    """
+    if limit > TOP_RELATED:
+        return None
+
+    computed = db.query(blombooru_tag_cooccurrence.c.count).filter(
+        blombooru_tag_cooccurrence.c.tag_id == tag_id,
+        blombooru_tag_cooccurrence.c.related_tag_id == tag_id
+    ).first()
+    if computed is None:
+        cooccurrence_refresher.mark_changed([tag_id])
+        return None
+
+    query = db.query(Tag, blombooru_tag_cooccurrence.c.count).join(
+        blombooru_tag_cooccurrence, Tag.id == blombooru_tag_cooccurrence.c.related_tag_id
+    ).filter(blombooru_tag_cooccurrence.c.tag_id == tag_id)
+    if category is not None:
+        query = query.filter(Tag.category == category)
+    if exclude_self:
+        query = query.filter(Tag.id != tag_id)
+    return query.order_by(blombooru_tag_cooccurrence.c.count.desc(), Tag.id).limit(limit).all()
+
+
+def run_cooccurrence_rebuild(job: Job) -> dict:
+    """Background job: recompute co-occurrence for every tag"""
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        started = time.time()
+        rows = rebuild_cooccurrence(db, job)
+        cooccurrence_refresher.mark_rebuilt()
+        return {"rows": rows, "seconds": round(time.time() - started, 1)}
+    finally:
+        db.close()
@@ -0,0 +1,210 @@
+"""
+Bulk tag import from Danbooru-style tag CSVs (name, category, post count, aliases).
+
+The file is parsed as a stream and valid rows are loaded with COPY into a
+temporary table in batches of COPY_BATCH_ROWS, so neither the file nor the
+existing tags are ever held in memory. Tags and aliases are then merged in a
+few set-based statements: new tags are inserted, existing tags get the
+category of their last row, and aliases are added unless the alias name
+already exists. Everything runs in one transaction.
+"""
+import csv
+import io
+import logging
+import os
+from typing import BinaryIO, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..models import Tag
+from .jobs import Job
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_MAP = {
+    0: 'general',
+    1: 'artist',
+    3: 'copyright',
+    4: 'character',
+    5: 'meta'
+}
+
+MAX_TAG_LENGTH = 255
+MAX_ALIAS_LENGTH = 255
+# Rows sent per COPY
+COPY_BATCH_ROWS = 50000
+# Errors kept in the result
+MAX_REPORTED_ERRORS = 20
+
+
+def _copy_rows(db: Session, rows: list):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY tag_import_rows (row_num, name, category, aliases) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+def import_tags_csv_stream(db: Session, stream: BinaryIO, job: Optional[Job] = None) -> dict:
+    """
+    Import tags and aliases from a binary CSV stream and commit.
+    Returns a dict with import statistics.
+    """
+    enum_type = Tag.__table__.c.category.type.name
+    errors = []
+    total_errors = 0
+    skipped_long_tags = 0
+    rows_processed = 0
+
+    def add_error(**error):
+        nonlocal total_errors
+        total_errors += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(error)
+
+    db.execute(text("""
+        CREATE TEMP TABLE tag_import_rows (
+            row_num integer NOT NULL,
+            name text NOT NULL,
+            category text NOT NULL,
+            aliases text
+        ) ON COMMIT DROP
+    """))
+
+    if job:
+        job.update(message="reading")
+
+    wrapper = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    reader = csv.reader(wrapper)
+    batch = []
+    for row_num, row in enumerate(reader, 1):
+        if len(row) < 2:
+            continue
+
+        tag_name = row[0].strip().lower().replace('\x00', '')
+        if not tag_name:
+            continue
+
+        if len(tag_name) > MAX_TAG_LENGTH:
+            skipped_long_tags += 1
+            add_error(key="notifications.admin.error_tag_too_long", row=row_num, tag=tag_name[:50], length=len(tag_name))
+            continue
+
+        try:
+            category_num = int(row[1])
+        except ValueError:
+            add_error(key="notifications.admin.error_invalid_category", row=row_num)
+            continue
+
+        aliases = row[3].replace('\x00', '') if len(row) > 3 else ''
+        batch.append((row_num, tag_name, CATEGORY_MAP.get(category_num, 'general'), aliases))
+        rows_processed += 1
+
+        if len(batch) >= COPY_BATCH_ROWS:
+            _copy_rows(db, batch)
+            batch = []
+            logger.info(f"Tag import: read {rows_processed} rows")
+            if job:
+                job.update(progress=stream.tell())
+                job.check_cancelled()
+
+    if batch:
+        _copy_rows(db, batch)
+    # Leave the caller's stream open
+    wrapper.detach()
+
+    if job:
+        job.update(message="merging")
+    db.execute(text("CREATE INDEX ON tag_import_rows (name)"))
+    db.execute(text("ANALYZE tag_import_rows"))
+
+    # Last row of a tag wins, like repeated rows updating the category
+    tags_created, tags_updated = db.execute(text(f"""
+        WITH merged AS (
+            INSERT INTO blombooru_tags (name, category, post_count)
+            SELECT name, CAST(category AS {enum_type}), 0
+            FROM (
+                SELECT DISTINCT ON (name) name, category
+                FROM tag_import_rows
+                ORDER BY name, row_num DESC
+            ) AS latest
+            ON CONFLICT (name) DO UPDATE SET category = EXCLUDED.category
+            WHERE blombooru_tags.category IS DISTINCT FROM EXCLUDED.category
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted)
+        FROM merged
+    """)).one()
+
+    db.execute(text("""
+        CREATE TEMP TABLE tag_import_aliases ON COMMIT DROP AS
+        SELECT r.row_num, r.name, lower(btrim(a.alias)) AS alias_name
+        FROM tag_import_rows AS r
+        CROSS JOIN LATERAL unnest(string_to_array(r.aliases, ',')) AS a(alias)
+        WHERE r.aliases <> ''
+    """))
+    skipped_long_aliases = db.execute(text("""
+        SELECT count(*) FROM tag_import_aliases WHERE length(alias_name) > :max_length
+    """), {"max_length": MAX_ALIAS_LENGTH}).scalar()
+
+    # The first tag listing an alias gets it; existing aliases are kept
+    aliases_created = db.execute(text("""
+        INSERT INTO blombooru_tag_aliases (alias_name, target_tag_id)
+        SELECT DISTINCT ON (a.alias_name) a.alias_name, t.id
+        FROM tag_import_aliases AS a
+        JOIN blombooru_tags AS t ON t.name = a.name
+        WHERE a.alias_name <> ''
+          AND a.alias_name <> a.name
+          AND length(a.alias_name) <= :max_length
+        ORDER BY a.alias_name, a.row_num
+        ON CONFLICT (alias_name) DO NOTHING
+    """), {"max_length": MAX_ALIAS_LENGTH}).rowcount
+
+    db.commit()
+    logger.info(
+        f"Tag import: {rows_processed} rows, {tags_created} tags created, {tags_updated} updated, "
+        f"{aliases_created} aliases created"
+    )
+
+    return {
+        "message_key": "notifications.admin.tags_imported",
+        "tags_created": tags_created,
+        "tags_updated": tags_updated,
+        "aliases_created": aliases_created,
+        "rows_processed": rows_processed,
+        "skipped_long_tags": skipped_long_tags,
+        "skipped_long_aliases": skipped_long_aliases,
+        "errors": errors,
+        "total_errors": total_errors
+    }
+
+
+def run_tags_csv_import(job: Job, path: str) -> dict:
+    """Background job: import a staged tag CSV, then delete it"""
+    from ..database import SessionLocal
+    from ..utils.cache import invalidate_tag_cache
+
+    db = SessionLocal()
+    try:
+        job.update(progress=0, total=os.path.getsize(path))
+        with open(path, 'rb') as f:
+            result = import_tags_csv_stream(db, f, job)
+        # Imports update categories and add aliases
+        invalidate_tag_cache(rebuild_index=True)
+        return result
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
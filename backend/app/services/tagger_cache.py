@@ -0,0 +1,131 @@
+"""
+Persistent cache of raw WD tagger scores.
+
+The model output for a file never depends on the thresholds, so the full
+score vector is stored per (Media.hash, model name and variant) as
+zlib-compressed float16 and thresholds are applied when reading. Re-running the tagger on the
+same media, or only changing thresholds, skips inference entirely. Entries
+are keyed by content hash, so a file deleted and imported again reuses them.
+"""
+import logging
+import zlib
+from typing import Dict, Generator, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ..models import TaggerScoreEntry
+from .wd_tagger import get_wd_tagger
+
+logger = logging.getLogger(__name__)
+
+# Scored files written to the cache per statement
+STORE_BATCH_SIZE = 32
+
+# media_id, media hash (may be None), file path
+ScoreItem = Tuple[int, Optional[str], str]
+
+
+def encode_scores(scores: np.ndarray) -> bytes:
+    return zlib.compress(np.asarray(scores, dtype=np.float16).tobytes())
+
+
+def decode_scores(data: bytes) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(data), dtype=np.float16).astype(np.float32)
+
+
+def get_cached_scores(db: Session, model_name: str, hashes: Iterable[str], label_count: int) -> Dict[str, np.ndarray]:
+    """Cached score vectors by media hash; entries from a different label set are ignored"""
+    hashes = list({h for h in hashes if h})
+    if not hashes:
+        return {}
+
+    rows = db.query(TaggerScoreEntry.media_hash, TaggerScoreEntry.scores).filter(
+        TaggerScoreEntry.model_name == model_name,
+        TaggerScoreEntry.media_hash.in_(hashes)
+    ).all()
+
+    cached = {}
+    for media_hash, data in rows:
+        scores = decode_scores(data)
+        if len(scores) == label_count:
+            cached[media_hash] = scores
+    return cached
+
+
+def store_scores(db: Session, model_name: str, scores_by_hash: Dict[str, np.ndarray]):
+    if not scores_by_hash:
+        return
+    stmt = pg_insert(TaggerScoreEntry).values([
+        {"media_hash": media_hash, "model_name": model_name, "scores": encode_scores(scores)}
+        for media_hash, scores in scores_by_hash.items()
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=['media_hash', 'model_name'],
+        set_={"scores": stmt.excluded.scores}
+    ))
+    db.commit()
+
+
+def predict_scores(
+    items: List[ScoreItem],
+    model_name: str,
+    stop_event=None
+) -> Generator[Tuple[int, Optional[np.ndarray]], None, None]:
+    """
+    Yield (media_id, scores) for every item: cached scores first, then the
+    rest as the model produces them, storing each new vector in the cache.
+    Scores are None for files that could not be read.
+    """
+    from ..database import SessionLocal
+
+    tagger = get_wd_tagger()
+    tagger.ensure_loaded(model_name)
+    # Quantized variants produce slightly different scores
+    cache_key = model_name if tagger.current_variant == "fp32" else f"{model_name}-{tagger.current_variant}"
+
+    db = SessionLocal()
+    try:
+        try:
+            cached = get_cached_scores(db, cache_key, (h for _, h, _ in items), tagger.label_count)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Could not read tagger score cache: {e}")
+            cached = {}
+
+        missing = []
+        for media_id, media_hash, file_path in items:
+            if media_hash in cached:
+                yield media_id, cached[media_hash]
+            else:
+                missing.append((media_id, media_hash, file_path))
+
+        if not missing:
+            return
+
+        path_to_item = {file_path: (media_id, media_hash) for media_id, media_hash, file_path in missing}
+        to_store = {}
+
+        def flush():
+            try:
+                store_scores(db, cache_key, to_store)
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Could not store tagger scores: {e}")
+            to_store.clear()
+
+        try:
+            for file_path, scores in tagger.score_files_streaming(
+                list(path_to_item), model_name=model_name, stop_event=stop_event
+            ):
+                media_id, media_hash = path_to_item[file_path]
+                if scores is not None and media_hash:
+                    to_store[media_hash] = scores
+                    if len(to_store) >= STORE_BATCH_SIZE:
+                        flush()
+                yield media_id, scores
+        finally:
+            flush()
+    finally:
+        db.close()
@@ -0,0 +1,282 @@
+"""
+Batch size and thread calibration for the WD tagger.
+
+The hard-coded batch sizes assume a ~16GB machine and os.cpu_count()
+ignores container CPU quotas. Calibration runs the loaded model on
+synthetic batches for each candidate thread count and batch size, and
+measures images/sec and the peak RSS of the process. Only one session is
+alive at a time. Batch sizes are tried in increasing order. Before each
+trial, its peak RSS is projected from the per-image increase of the last
+two trials (or from the session's RSS for the first), and its duration from
+the last measured rate; the sweep stops before a trial projected past
+MEMORY_BUDGET_FRACTION of the cgroup (or physical) memory limit or past
+CALIBRATION_TIME_BUDGET, and when throughput clearly falls off. A larger
+batch size must be noticeably faster to be preferred, since it also costs
+memory and latency.
+
+The best configuration is stored per model variant in
+DATA_DIR/wd_tagger/calibration.json under a host key made of the machine
+type, CPU model and effective CPU and memory limits. The hostname is left
+out because containers get a new one on every recreate. A changed key
+replaces the stored entries, so a changed container quota triggers a new
+calibration.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import platform
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+CANDIDATE_BATCH_SIZES = [1, 2, 4, 8, 16, 32]
+# Share of the memory limit the tagger process may reach
+MEMORY_BUDGET_FRACTION = 0.6
+# Seconds of measuring before the sweep stops early
+CALIBRATION_TIME_BUDGET = 60.0
+# Each trial runs at least this long and this many times, after one warm-up run
+MIN_TRIAL_SECONDS = 1.0
+MIN_TRIAL_RUNS = 2
+# A larger batch must be this much faster to replace a smaller one
+MIN_SPEEDUP = 1.03
+# Stop growing the batch once throughput drops below this share of the best
+FALLOFF_RATIO = 0.9
+RSS_SAMPLE_INTERVAL = 0.02
+CALIBRATION_FILENAME = "calibration.json"
+
+_file_lock = threading.Lock()
+
+
+def _read_file(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def effective_cpu_count() -> int:
+    """CPUs usable by this process: affinity mask capped by the cgroup CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    cpu_max = _read_file("/sys/fs/cgroup/cpu.max")  # cgroup v2: "<quota> <period>" or "max <period>"
+    if cpu_max:
+        parts = cpu_max.split()
+        if len(parts) == 2 and parts[0] != "max":
+            quota = int(parts[0]) / int(parts[1])
+    else:
+        quota_us = _read_file("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")  # cgroup v1
+        period_us = _read_file("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if quota_us and period_us and int(quota_us) > 0:
+            quota = int(quota_us) / int(period_us)
+
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+def memory_limit_bytes() -> Optional[int]:
+    """cgroup memory limit, or physical memory when unlimited"""
+    physical = None
+    try:
+        physical = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        pass
+
+    limit = _read_file("/sys/fs/cgroup/memory.max") or _read_file("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    if limit and limit.isdigit():
+        limit = int(limit)
+        # cgroup v1 reports a huge number when unlimited
+        if physical is None or limit < physical:
+            return limit
+    return physical
+
+
+def current_rss_bytes() -> Optional[int]:
+    statm = _read_file("/proc/self/statm")
+    if not statm:
+        return None
+    return int(statm.split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class _RssSampler:
+    """Samples the process RSS in a background thread and keeps the peak"""
+
+    def __init__(self):
+        self.peak = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="wd-calibration-rss", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            rss = current_rss_bytes()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def __enter__(self):
+        if self.peak is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+def host_key() -> str:
+    cpu_model = ""
+    cpuinfo = _read_file("/proc/cpuinfo") or ""
+    for line in cpuinfo.splitlines():
+        if line.startswith("model name"):
+            cpu_model = line.split(":", 1)[1].strip()
+            break
+    identity = f"{platform.machine()}|{cpu_model}|{effective_cpu_count()}|{memory_limit_bytes()}"
+    return hashlib.sha1(identity.encode()).hexdigest()[:16]
+
+
+def _calibration_path():
+    return settings.DATA_DIR / "wd_tagger" / CALIBRATION_FILENAME
+
+
+def _read_calibrations() -> Dict[str, Any]:
+    path = _calibration_path()
+    if not path.exists():
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable tagger calibration file: {e}")
+        return {}
+
+
+def load_calibration(model_name: str, variant: str) -> Optional[Dict[str, Any]]:
+    """Stored configuration for this host and model variant, if any"""
+    with _file_lock:
+        return _read_calibrations().get(host_key(), {}).get(f"{model_name}:{variant}")
+
+
+def save_calibration(model_name: str, variant: str, config: Dict[str, Any]):
+    path = _calibration_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    key = host_key()
+    with _file_lock:
+        # Entries of a previous host (or quota) no longer apply
+        calibrations = {key: _read_calibrations().get(key, {})}
+        calibrations[key][f"{model_name}:{variant}"] = config
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(calibrations, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+def _measure(session, input_name: str, batch: np.ndarray) -> Dict[str, Any]:
+    with _RssSampler() as sampler:
+        session.run(None, {input_name: batch})
+        runs = 0
+        started = time.perf_counter()
+        while runs < MIN_TRIAL_RUNS or time.perf_counter() - started < MIN_TRIAL_SECONDS:
+            session.run(None, {input_name: batch})
+            runs += 1
+        elapsed = time.perf_counter() - started
+    return {
+        "images_per_sec": round(runs * len(batch) / elapsed, 2),
+        "peak_rss_mb": round(sampler.peak / 2**20) if sampler.peak is not None else None
+    }
+
+
+def _projected_rss(previous: List[Tuple[int, int]], batch_size: int) -> Optional[int]:
+    """
+    Peak RSS expected for batch_size, extrapolated from (batch_size, peak)
+    points measured with the same session: the session alone counts as
+    batch size 0.
+    """
+    if len(previous) < 2:
+        return None
+    (size_a, rss_a), (size_b, rss_b) = previous[-2:]
+    per_image = max(0, rss_b - rss_a) / (size_b - size_a)
+    return int(rss_b + per_image * (batch_size - size_b))
+
+
+def calibrate(create_session, target_size: int) -> Dict[str, Any]:
+    """
+    Sweep thread counts and batch sizes. create_session(intra_threads,
+    inter_threads) must return an inference session of the model to
+    calibrate; each session is released before the next is created.
+    Returns the best configuration plus every trial.
+    """
+    cpus = effective_cpu_count()
+    memory_limit = memory_limit_bytes()
+    budget = memory_limit * MEMORY_BUDGET_FRACTION if memory_limit else None
+    deadline = time.monotonic() + CALIBRATION_TIME_BUDGET
+    rng = np.random.default_rng(0)
+
+    trials: List[Dict[str, Any]] = []
+    best: Optional[Dict[str, Any]] = None
+
+    for intra_threads in sorted({cpus, max(1, cpus // 2)}, reverse=True):
+        inter_threads = max(1, intra_threads // 2)
+        session = create_session(intra_threads, inter_threads)
+        input_name = session.get_inputs()[0].name
+        best_for_threads = None
+        session_rss = current_rss_bytes()
+        # (batch size, peak RSS) measured with this session
+        rss_points = [(0, session_rss)] if session_rss is not None else []
+
+        for batch_size in CANDIDATE_BATCH_SIZES:
+            projected_rss = _projected_rss(rss_points, batch_size)
+            if budget and projected_rss is not None and projected_rss > budget:
+                logger.info(f"Tagger calibration: batch size {batch_size} projected over the memory budget")
+                break
+            if best_for_threads is not None:
+                run_seconds = batch_size / trials[-1]["images_per_sec"]
+                trial_seconds = max(MIN_TRIAL_SECONDS, MIN_TRIAL_RUNS * run_seconds) + run_seconds
+                if time.monotonic() + trial_seconds > deadline:
+                    break
+            elif time.monotonic() > deadline:
+                break
+
+            batch = rng.uniform(0, 255, (batch_size, target_size, target_size, 3)).astype(np.float32)
+            trial = {"batch_size": batch_size, "intra_op_threads": intra_threads, "inter_op_threads": inter_threads}
+            trial.update(_measure(session, input_name, batch))
+            del batch
+            trials.append(trial)
+            logger.info(f"Tagger calibration: {trial}")
+
+            if trial["peak_rss_mb"] is not None:
+                rss_points.append((batch_size, trial["peak_rss_mb"] * 2**20))
+                if budget and trial["peak_rss_mb"] * 2**20 > budget:
+                    break
+            if best_for_threads is None or trial["images_per_sec"] > best_for_threads["images_per_sec"] * MIN_SPEEDUP:
+                best_for_threads = trial
+            elif trial["images_per_sec"] < best_for_threads["images_per_sec"] * FALLOFF_RATIO:
+                break
+
+        session = None
+        if best_for_threads and (best is None or best_for_threads["images_per_sec"] > best["images_per_sec"]):
+            best = best_for_threads
+
+    if best is None:
+        raise RuntimeError("Tagger calibration could not complete a single trial")
+
+    return {
+        **best,
+        "effective_cpus": cpus,
+        "memory_limit_mb": round(memory_limit / 2**20) if memory_limit else None,
+        "calibrated_at": datetime.now(timezone.utc).isoformat(),
+        "trials": trials
+    }
@@ -0,0 +1,172 @@
+"""
+Image preprocessing for the WD tagger.
+
+Images are decoded at reduced scale where the format allows it (JPEG draft
+mode picks a DCT scale just above the model input size), shrunk with
+Pillow's integer reduce followed by a bicubic resize, and only then padded
+to a white square, so no full-resolution canvas is ever allocated. The
+result is written as BGR float32 straight into a slot of a preallocated
+batch array. Videos are read in-process with OpenCV; several frames spread
+over the duration are scored and the tagger keeps the highest score of each
+tag across them.
+
+This module only depends on numpy and Pillow (OpenCV is imported for the
+first video) so it can be imported cheaply by process pool workers, which write into a shared-memory batch buffer
+instead of pickling arrays back.
+"""
+import logging
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = ['.mp4', '.webm', '.mov', '.avi', '.mkv']
+# Frames sampled across a video's duration; their scores are max-pooled
+VIDEO_SAMPLE_FRAMES = 4
+# Shrink by an integer factor first while the image stays this many times larger than the target
+REDUCING_GAP = 3.0
+
+
+def extract_gif_frame(file_path: str, frame_index: int = 0) -> Image.Image:
+    """Extract a frame from a GIF."""
+    with Image.open(file_path) as gif:
+        gif.seek(frame_index)
+        return gif.convert('RGB')
+
+
+def extract_video_frame(file_path: str, frame_index: int = 0, position: Optional[float] = None) -> Image.Image:
+    """
+    Extract a frame from a video file with OpenCV, either by index or at a
+    relative position (0-1) of its duration. Falls back to the first frame
+    when seeking fails.
+    """
+    import cv2
+
+    cap = cv2.VideoCapture(file_path)
+    try:
+        if position is not None:
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+            frame_index = int(position * frame_count) if frame_count > 1 else 0
+        if frame_index:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+
+        ret, frame = cap.read()
+        if not ret and frame_index:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = cap.read()
+        if not ret:
+            raise ValueError("Could not read a video frame")
+    finally:
+        cap.release()
+
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+def video_frame_count(file_path: str) -> int:
+    """Frame count from the container metadata; 0 when unknown (common for webm/mkv)"""
+    import cv2
+
+    cap = cv2.VideoCapture(file_path)
+    try:
+        return max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0))
+    finally:
+        cap.release()
+
+
+def frame_positions(file_path: str) -> List[Optional[float]]:
+    """Relative positions of the frames to score for a file; None for a single image"""
+    if Path(file_path).suffix.lower() in VIDEO_EXTENSIONS:
+        # Without a usable frame count every position would decode the same frames
+        samples = min(VIDEO_SAMPLE_FRAMES, video_frame_count(file_path))
+        if samples <= 1:
+            return [0.0]
+        return [(i + 0.5) / samples for i in range(samples)]
+    return [None]
+
+
+def open_source_image(file_path: str, target_size: int, position: Optional[float] = None) -> Image.Image:
+    """Open an image, GIF or video frame, decoding JPEGs at reduced scale."""
+    ext = Path(file_path).suffix.lower()
+
+    if ext == '.gif':
+        return extract_gif_frame(file_path)
+    if ext in VIDEO_EXTENSIONS:
+        return extract_video_frame(file_path, position=position or 0.0)
+
+    image = Image.open(file_path)
+    # No-op for formats without reduced-scale decoding
+    image.draft('RGB', (target_size, target_size))
+    return image
+
+
+def prepare_image(image: Image.Image, target_size: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Resize so the longer side is target_size, pad to a white square and
+    write BGR float32 pixels into out (allocated when not given).
+    """
+    if image.mode in ('LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+
+    width, height = image.size
+    scale = target_size / max(width, height)
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if image.size != new_size:
+        image = image.resize(new_size, Image.BICUBIC, reducing_gap=REDUCING_GAP)
+
+    offset = ((target_size - new_size[0]) // 2, (target_size - new_size[1]) // 2)
+    canvas = Image.new('RGB', (target_size, target_size), (255, 255, 255))
+    if image.mode == 'RGBA':
+        canvas.paste(image, offset, mask=image.getchannel('A'))
+    else:
+        canvas.paste(image, offset)
+
+    if out is None:
+        out = np.empty((target_size, target_size, 3), dtype=np.float32)
+    # RGB to BGR and uint8 to float32 in a single pass
+    out[...] = np.asarray(canvas)[:, :, ::-1]
+    return out
+
+
+def prepare_file(file_path: str, target_size: int, out: Optional[np.ndarray] = None,
+                 position: Optional[float] = None) -> np.ndarray:
+    """Load and prepare an image (or the video frame at position) from file path."""
+    image = open_source_image(file_path, target_size, position)
+    try:
+        return prepare_image(image, target_size, out)
+    finally:
+        image.close()
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: stop the worker's resource tracker from unlinking the parent's block
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def prepare_into_shared(file_path: str, position: Optional[float], shm_name: str,
+                        batch_shape: Tuple[int, ...], index: int) -> bool:
+    """Prepare one file or video frame into slot index of a shared-memory batch (runs in a worker)"""
+    shm = _attach_shared_memory(shm_name)
+    try:
+        batch = np.ndarray(batch_shape, dtype=np.float32, buffer=shm.buf)
+        try:
+            prepare_file(file_path, batch_shape[1], batch[index], position)
+        finally:
+            del batch
+        return True
+    except Exception as e:
+        logger.warning(f"Error preparing image {file_path}: {e}")
+        return False
+    finally:
+        shm.close()
@@ -6,13 +6,67 @@ from PIL import Image
 from pathlib import Path
 from typing import Optional, List, Dict, Any, Tuple, Generator
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 import threading
-import queue
+from multiprocessing import shared_memory
+
+from ..config import settings
+from .tagger_calibration import calibrate, effective_cpu_count, load_calibration, save_calibration
+from .tagger_preprocess import (
+    extract_gif_frame, extract_video_frame, frame_positions, prepare_file, prepare_image, prepare_into_shared
+)
 
 logger = logging.getLogger(__name__)
 
 
+class _PendingBatch:
+    """A batch being prepared in a thread or process pool"""
+    
+    def __init__(self, slots: List[Tuple[str, Optional[float]]], futures: list, images: Optional[np.ndarray] = None,
+                 shape: Optional[Tuple[int, ...]] = None, shm: Optional[shared_memory.SharedMemory] = None):
+        self.slots = slots
+        self.futures = futures
+        self.images = images
+        self.shape = shape
+        self.shm = shm
+    
+    def result(self) -> Tuple[np.ndarray, List[bool]]:
+        """Wait for every image; returns the batch array and which slots were prepared"""
+        ok = []
+        for (fp, _), future in zip(self.slots, self.futures):
+            try:
+                ok.append(bool(future.result()))
+            except Exception as e:
+                logger.warning(f"Error preparing image {fp}: {e}")
+                ok.append(False)
+        
+        if self.shm is not None:
+            # Copy out so the shared block can be released right away
+            shared = np.ndarray(self.shape, dtype=np.float32, buffer=self.shm.buf)
+            self.images = shared.copy()
+            del shared
+            self._release()
+        return self.images, ok
+    
+    def cancel(self):
+        for future in self.futures:
+            future.cancel()
+        if self.shm is not None:
+            # Workers already running still need the block; wait for them
+            for future in self.futures:
+                if not future.cancelled():
+                    try:
+                        future.result()
+                    except Exception:
+                        pass
+            self._release()
+    
+    def _release(self):
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+
 class WDTagger:
     """
     WD Tagger using ONNX models from SmilingWolf's collection.
@@ -41,8 +95,12 @@ class WDTagger:
     
     MODEL_FILENAME = "model.onnx"
     LABEL_FILENAME = "selected_tags.csv"
+    # Quantized and ORT-optimized models, under DATA_DIR
+    MODEL_CACHE_DIRNAME = "wd_tagger"
+    MODEL_VARIANTS = ["fp32", "int8"]
     
-    # Optimal batch sizes per model (tuned for ~16GB RAM systems)
+    # Fallback batch sizes per model (tuned for ~16GB RAM systems), used
+    # until the model is calibrated on this host
     OPTIMAL_BATCH_SIZES = {
         "wd-eva02-large-tagger-v3": 4,
         "wd-vit-tagger-v3": 16,
@@ -64,31 +122,41 @@ class WDTagger:
             self._tag_data = None
             self._target_size = None
             self._current_model_name = None
+            # Configured variant at load time, and the one actually loaded
+            self._current_variant = None
+            self._loaded_variant = None
+            # Why the configured variant could not be used, if it fell back
+            self._variant_error = None
             self._input_name = None
+            self._source_path = None
+            # Calibrated batch size and thread counts for the loaded model
+            self._calibration = None
+            self._session_threads = None
             self._inference_lock = threading.Lock()
             # Preprocessing can be parallelized
-            self._num_preprocess_workers = min(4, (os.cpu_count() or 4))
+            self._num_preprocess_workers = min(4, effective_cpu_count())
             self._preprocess_executor = ThreadPoolExecutor(
                 max_workers=self._num_preprocess_workers,
                 thread_name_prefix="wd_preprocess"
             )
             WDTagger._initialized = True
     
-    def _get_session_options(self) -> rt.SessionOptions:
+    def _get_session_options(self, intra_threads: Optional[int] = None,
+                             inter_threads: Optional[int] = None) -> rt.SessionOptions:
         """Create optimized session options for CPU execution."""
         sess_options = rt.SessionOptions()
         
         # Enable all graph optimizations
         sess_options.graph_optimization_level = rt.GraphOptimizationLevel.ORT_ENABLE_ALL
         
-        # Determine optimal thread counts
-        cpu_count = os.cpu_count() or 4
+        # Default to the CPUs actually available (affinity and cgroup quota)
+        cpu_count = effective_cpu_count()
         
         # intra_op: threads for parallelism within a single operator (e.g., matrix multiply)
         # inter_op: threads for parallelism across operators
         # For batch processing, we want more intra-op parallelism
-        sess_options.intra_op_num_threads = cpu_count
-        sess_options.inter_op_num_threads = max(1, cpu_count // 2)
+        sess_options.intra_op_num_threads = intra_threads or cpu_count
+        sess_options.inter_op_num_threads = inter_threads or max(1, cpu_count // 2)
         
         # Enable parallel execution mode
         sess_options.execution_mode = rt.ExecutionMode.ORT_PARALLEL
@@ -101,12 +169,72 @@ class WDTagger:
         
         return sess_options
     
-    def _load_model(self, model_name: str = "wd-eva02-large-tagger-v3"):
+    def _variant_dir(self, model_name: str) -> Path:
+        path = settings.DATA_DIR / self.MODEL_CACHE_DIRNAME / model_name
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+    
+    def _quantized_model_path(self, model_name: str, model_path: str) -> str:
+        """INT8 dynamic-quantized copy of the downloaded model, produced on first use."""
+        quantized_path = self._variant_dir(model_name) / "model.int8.onnx"
+        if quantized_path.exists() and quantized_path.stat().st_mtime >= os.path.getmtime(model_path):
+            return str(quantized_path)
+        
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        
+        logger.info(f"Quantizing {model_name} to INT8 (one-time)...")
+        tmp_path = quantized_path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            quantize_dynamic(model_path, str(tmp_path), weight_type=QuantType.QUInt8)
+            os.replace(tmp_path, quantized_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        return str(quantized_path)
+    
+    def _create_session(self, model_name: str, source_path: str, variant: str,
+                        intra_threads: Optional[int] = None,
+                        inter_threads: Optional[int] = None) -> rt.InferenceSession:
+        """
+        Create an inference session, reusing the graph ORT optimized on a
+        previous load. The optimized graph is specific to this ORT version
+        and machine, so it is cached per ORT version under DATA_DIR.
+        """
+        optimized_path = self._variant_dir(model_name) / f"model.{variant}.ort-{rt.__version__}.optimized.onnx"
+        sess_options = self._get_session_options(intra_threads, inter_threads)
+        
+        if optimized_path.exists() and optimized_path.stat().st_mtime >= os.path.getmtime(source_path):
+            sess_options.graph_optimization_level = rt.GraphOptimizationLevel.ORT_DISABLE_ALL
+            try:
+                return rt.InferenceSession(
+                    str(optimized_path),
+                    sess_options=sess_options,
+                    providers=['CPUExecutionProvider']
+                )
+            except Exception as e:
+                logger.warning(f"Cached optimized model unusable, rebuilding: {e}")
+                sess_options = self._get_session_options(intra_threads, inter_threads)
+        
+        tmp_path = optimized_path.with_suffix(f".{os.getpid()}.tmp")
+        sess_options.optimized_model_filepath = str(tmp_path)
+        session = rt.InferenceSession(
+            source_path,
+            sess_options=sess_options,
+            providers=['CPUExecutionProvider']
+        )
+        try:
+            os.replace(tmp_path, optimized_path)
+        except OSError as e:
+            logger.warning(f"Could not cache optimized model: {e}")
+        return session
+    
+    def _load_model(self, model_name: str = "wd-eva02-large-tagger-v3", auto_calibrate: bool = True):
         """Load the specified model with CPU optimizations."""
         if model_name not in self.AVAILABLE_MODELS:
             raise ValueError(f"Unknown model: {model_name}. Available: {list(self.AVAILABLE_MODELS.keys())}")
         
-        if self._current_model_name == model_name and self._model is not None:
+        variant = settings.AI_TAGGER_MODEL_VARIANT
+        if self._current_model_name == model_name and self._current_variant == variant and self._model is not None:
             return
         
         try:
@@ -132,15 +260,26 @@ class WDTagger:
             'character': np.where(df["category"] == 4)[0],
         }
         
-        # Create optimized session
-        sess_options = self._get_session_options()
+        source_path = model_path
+        variant_error = None
+        if variant == "int8":
+            try:
+                source_path = self._quantized_model_path(model_name, model_path)
+            except Exception as e:
+                logger.warning(f"INT8 quantization failed, using fp32: {e}")
+                variant_error = f"INT8 quantization failed: {e}"
+                variant = "fp32"
+        
+        calibration = load_calibration(model_name, variant)
+        if calibration:
+            threads = (calibration["intra_op_threads"], calibration["inter_op_threads"])
+        else:
+            cpu_count = effective_cpu_count()
+            threads = (cpu_count, max(1, cpu_count // 2))
         
+        # Create optimized session
         try:
-            self._model = rt.InferenceSession(
-                model_path, 
-                sess_options=sess_options,
-                providers=['CPUExecutionProvider']
-            )
+            self._model = self._create_session(model_name, source_path, variant, *threads)
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             raise
@@ -148,110 +287,100 @@ class WDTagger:
         input_info = self._model.get_inputs()[0]
         self._target_size = input_info.shape[2]
         self._input_name = input_info.name
+        self._source_path = source_path
+        self._session_threads = threads
+        self._calibration = calibration
         self._current_model_name = model_name
+        self._current_variant = settings.AI_TAGGER_MODEL_VARIANT
+        self._loaded_variant = variant
+        self._variant_error = variant_error
+        
+        if calibration is None and auto_calibrate and settings.AI_TAGGER_AUTO_CALIBRATE:
+            try:
+                self._calibrate_loaded()
+            except Exception as e:
+                logger.warning(f"Tagger calibration failed, using default batch size: {e}")
         
         logger.info(
             f"WD Tagger loaded successfully. "
-            f"Model: {model_name}, Target size: {self._target_size}, "
-            f"Optimal batch size: {self.OPTIMAL_BATCH_SIZES.get(model_name, 4)}"
+            f"Model: {model_name} ({variant}), Target size: {self._target_size}, "
+            f"Optimal batch size: {self.get_optimal_batch_size(model_name)}"
         )
     
-    def ensure_loaded(self, model_name: str = "wd-eva02-large-tagger-v3"):
-        """Ensure the model is loaded."""
-        if self._model is None or self._current_model_name != model_name:
-            with self._lock:
-                if self._model is None or self._current_model_name != model_name:
-                    self._load_model(model_name)
-    
-    def _prepare_image(self, image: Image.Image) -> np.ndarray:
+    def _calibrate_loaded(self) -> Dict[str, Any]:
         """
-        Preprocess a single image for the model.
-        Optimized version with minimal allocations.
+        Calibrate the loaded model, store the result for this host and
+        recreate the session with the winning thread counts. Caller holds _lock.
         """
-        width, height = image.size
-        
-        # Handle transparency
-        if image.mode == 'RGBA':
-            # Create white background and composite
-            background = Image.new("RGB", image.size, (255, 255, 255))
-            background.paste(image, mask=image.split()[3])
-            image = background
-        elif image.mode != 'RGB':
-            image = image.convert("RGB")
-        
-        # Pad to square
-        max_dim = max(width, height)
-        if width != height:
-            pad_left = (max_dim - width) // 2
-            pad_top = (max_dim - height) // 2
-            padded_image = Image.new("RGB", (max_dim, max_dim), (255, 255, 255))
-            padded_image.paste(image, (pad_left, pad_top))
-            image = padded_image
-        
-        # Resize to target size
-        if image.size[0] != self._target_size:
-            image = image.resize(
-                (self._target_size, self._target_size), 
-                Image.BICUBIC
-            )
+        model_name, variant = self._current_model_name, self._loaded_variant
+        logger.info(f"Calibrating {model_name} ({variant}) batch size and threads...")
         
-        # Convert to numpy array in BGR format (model expects BGR)
-        # Using np.asarray is faster than np.array as it doesn't copy if not needed
-        image_array = np.asarray(image, dtype=np.float32)
+        def create_session(intra_threads: int, inter_threads: int) -> rt.InferenceSession:
+            return self._create_session(model_name, self._source_path, variant, intra_threads, inter_threads)
+        
+        with self._inference_lock:
+            # Only one session may hold the model weights at a time; loads
+            # wait on _lock and inference on _inference_lock meanwhile
+            self._model = None
+            try:
+                config = calibrate(create_session, self._target_size)
+                self._session_threads = (config["intra_op_threads"], config["inter_op_threads"])
+                self._calibration = config
+            finally:
+                self._model = self._create_session(model_name, self._source_path, variant, *self._session_threads)
         
-        # RGB to BGR conversion using fancy indexing
-        image_array = image_array[:, :, ::-1].copy()
+        try:
+            save_calibration(model_name, variant, config)
+        except OSError as e:
+            logger.warning(f"Could not store tagger calibration: {e}")
         
-        return image_array
+        logger.info(
+            f"Calibrated {model_name} ({variant}): batch size {config['batch_size']}, "
+            f"{config['intra_op_threads']} threads, {config['images_per_sec']} images/sec"
+        )
+        return config
+    
+    def calibrate(self, model_name: str = "wd-eva02-large-tagger-v3") -> Dict[str, Any]:
+        """Measure and store the best batch size and thread counts for a model in the configured variant."""
+        with self._lock:
+            if self._needs_load(model_name):
+                self._load_model(model_name, auto_calibrate=False)
+            return self._calibrate_loaded()
+    
+    def _needs_load(self, model_name: str) -> bool:
+        return (
+            self._model is None
+            or self._current_model_name != model_name
+            or self._current_variant != settings.AI_TAGGER_MODEL_VARIANT
+        )
+    
+    def ensure_loaded(self, model_name: str = "wd-eva02-large-tagger-v3"):
+        """Ensure the model is loaded in the configured variant."""
+        if self._needs_load(model_name):
+            with self._lock:
+                if self._needs_load(model_name):
+                    self._load_model(model_name)
+    
+    def _prepare_image(self, image: Image.Image) -> np.ndarray:
+        """Preprocess a single image for the model."""
+        return prepare_image(image, self._target_size)
     
     def _prepare_image_from_path(self, file_path: str) -> Tuple[str, Optional[np.ndarray]]:
         """Load and prepare an image from file path."""
         try:
-            ext = Path(file_path).suffix.lower()
-            
-            if ext == '.gif':
-                image = self._extract_gif_frame(file_path)
-            elif ext in ['.mp4', '.webm', '.mov', '.avi', '.mkv']:
-                image = self._extract_video_frame(file_path)
-            else:
-                image = Image.open(file_path)
-            
-            prepared = self._prepare_image(image)
-            
-            # Close image to free memory
-            if hasattr(image, 'close'):
-                image.close()
-            
-            return (file_path, prepared)
+            return (file_path, prepare_file(file_path, self._target_size))
         except Exception as e:
             logger.warning(f"Error preparing image {file_path}: {e}")
             return (file_path, None)
     
-    def _prepare_images_parallel(
-        self, 
-        file_paths: List[str],
-        max_workers: Optional[int] = None
-    ) -> List[Tuple[str, Optional[np.ndarray]]]:
-        """Prepare multiple images in parallel."""
-        if max_workers is None:
-            max_workers = self._num_preprocess_workers
-        
-        results = []
-        
-        # Submit all tasks
-        futures = {
-            self._preprocess_executor.submit(self._prepare_image_from_path, fp): fp 
-            for fp in file_paths
-        }
-        
-        # Collect results in submission order
-        path_to_result = {}
-        for future in as_completed(futures):
-            file_path, prepared = future.result()
-            path_to_result[file_path] = prepared
-        
-        # Return in original order
-        return [(fp, path_to_result.get(fp)) for fp in file_paths]
+    def _prepare_into(self, file_path: str, position: Optional[float], out: np.ndarray) -> bool:
+        """Prepare an image or video frame from file path into a slot of a batch array."""
+        try:
+            prepare_file(file_path, self._target_size, out, position)
+            return True
+        except Exception as e:
+            logger.warning(f"Error preparing image {file_path}: {e}")
+            return False
     
     def _extract_tags_from_scores(
         self,
@@ -440,47 +569,16 @@ class WDTagger:
         if not file_paths:
             return []
         
-        self.ensure_loaded(model_name)
-        
-        if batch_size is None:
-            batch_size = self.OPTIMAL_BATCH_SIZES.get(model_name, 4)
-        
         total = len(file_paths)
         results = {}
-        processed_count = 0
         
-        # Process in batches
-        for i in range(0, total, batch_size):
-            batch_paths = file_paths[i:i + batch_size]
-            
-            # Parallel preprocessing
-            prepared = self._prepare_images_parallel(batch_paths)
-            
-            # Filter out failed preparations
-            valid_items = [(fp, img) for fp, img in prepared if img is not None]
-            failed_paths = [fp for fp, img in prepared if img is None]
-            
-            # Mark failed as empty
-            for fp in failed_paths:
-                results[fp] = []
-            
-            if valid_items:
-                # Stack valid images
-                batch_images = np.stack([img for _, img in valid_items], axis=0)
-                
-                # Run inference
-                with self._inference_lock:
-                    preds = self._model.run(None, {self._input_name: batch_images})[0]
-                
-                # Extract tags
-                for (fp, _), scores in zip(valid_items, preds):
-                    tags = self._extract_tags_from_scores(
-                        scores, general_threshold, character_threshold,
-                        hide_rating_tags, character_tags_first
-                    )
-                    results[fp] = tags
-            
-            processed_count += len(batch_paths)
+        for processed_count, (fp, scores) in enumerate(
+            self.score_files_streaming(file_paths, model_name, batch_size), 1
+        ):
+            results[fp] = [] if scores is None else self._extract_tags_from_scores(
+                scores, general_threshold, character_threshold,
+                hide_rating_tags, character_tags_first
+            )
             
             if progress_callback:
                 progress_callback(processed_count, total)
@@ -488,6 +586,101 @@ class WDTagger:
         # Return in original order
         return [(fp, results.get(fp, [])) for fp in file_paths]
     
+    def _start_batch(self, slots: List[Tuple[str, Optional[float]]]) -> "_PendingBatch":
+        """
+        Start preparing a batch of (file_path, frame position) slots in the
+        background; images are written straight into one batch array.
+        """
+        shape = (len(slots), self._target_size, self._target_size, 3)
+        
+        if settings.AI_TAGGER_PREPROCESS_PROCESSES:
+            from .media_processing import media_processing
+            
+            shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 4)
+            try:
+                futures = [
+                    media_processing.submit(prepare_into_shared, fp, position, shm.name, shape, i)
+                    for i, (fp, position) in enumerate(slots)
+                ]
+            except Exception:
+                shm.close()
+                shm.unlink()
+                raise
+            return _PendingBatch(slots, futures, shape=shape, shm=shm)
+        
+        images = np.empty(shape, dtype=np.float32)
+        futures = [
+            self._preprocess_executor.submit(self._prepare_into, fp, position, images[i])
+            for i, (fp, position) in enumerate(slots)
+        ]
+        return _PendingBatch(slots, futures, images=images)
+    
+    def score_files_streaming(
+        self,
+        file_paths: List[str],
+        model_name: str = "wd-eva02-large-tagger-v3",
+        batch_size: Optional[int] = None,
+        stop_event: Optional[threading.Event] = None
+    ) -> Generator[Tuple[str, Optional[np.ndarray]], None, None]:
+        """
+        Stream raw model scores as each batch completes.
+        
+        Yields (file_path, scores) tuples, with None for files that could not
+        be prepared. Videos take several batch slots, one per sampled frame,
+        and yield the element-wise maximum of their frames' scores.
+        Preprocessing of the next batch runs in the preprocessing pool while
+        the current batch is in inference. Stops before the next batch once
+        stop_event is set.
+        """
+        if not file_paths:
+            return
+        
+        self.ensure_loaded(model_name)
+        
+        if batch_size is None:
+            batch_size = self.get_optimal_batch_size(model_name)
+        
+        slots = [(fp, position) for fp in file_paths for position in frame_positions(fp)]
+        frames_left: Dict[str, int] = {}
+        for fp, _ in slots:
+            frames_left[fp] = frames_left.get(fp, 0) + 1
+        merged: Dict[str, np.ndarray] = {}
+        
+        batches = [slots[i:i + batch_size] for i in range(0, len(slots), batch_size)]
+        pending = self._start_batch(batches[0])
+        
+        try:
+            for index, batch_slots in enumerate(batches):
+                images, ok = pending.result()
+                pending = None
+                
+                if stop_event is not None and stop_event.is_set():
+                    return
+                
+                # Prefetch: prepare the next batch during inference
+                if index + 1 < len(batches):
+                    pending = self._start_batch(batches[index + 1])
+                
+                valid_paths = [fp for (fp, _), prepared in zip(batch_slots, ok) if prepared]
+                if valid_paths:
+                    if len(valid_paths) < len(batch_slots):
+                        images = images[np.flatnonzero(ok)]
+                    
+                    with self._inference_lock:
+                        preds = self._model.run(None, {self._input_name: images})[0]
+                    
+                    for fp, scores in zip(valid_paths, preds):
+                        merged[fp] = np.maximum(merged[fp], scores) if fp in merged else scores
+                
+                # Files whose frames are all scored (or failed)
+                for fp, _ in batch_slots:
+                    frames_left[fp] -= 1
+                    if frames_left[fp] == 0:
+                        yield (fp, merged.pop(fp, None))
+        finally:
+            if pending is not None:
+                pending.cancel()
+    
     def predict_from_files_streaming(
         self,
         file_paths: List[str],
@@ -496,80 +689,49 @@ class WDTagger:
         hide_rating_tags: bool = True,
         character_tags_first: bool = True,
         model_name: str = "wd-eva02-large-tagger-v3",
-        batch_size: Optional[int] = None
+        batch_size: Optional[int] = None,
+        stop_event: Optional[threading.Event] = None
     ) -> Generator[Tuple[str, List[Dict[str, Any]]], None, None]:
         """
         Stream prediction results as they complete.
         
         Yields (file_path, tags) tuples as each batch completes.
         """
-        if not file_paths:
-            return
-        
-        self.ensure_loaded(model_name)
-        
-        if batch_size is None:
-            batch_size = self.OPTIMAL_BATCH_SIZES.get(model_name, 4)
-        
-        for i in range(0, len(file_paths), batch_size):
-            batch_paths = file_paths[i:i + batch_size]
-            
-            # Parallel preprocessing
-            prepared = self._prepare_images_parallel(batch_paths)
-            
-            # Separate valid and failed
-            valid_items = [(fp, img) for fp, img in prepared if img is not None]
-            failed_paths = [fp for fp, img in prepared if img is None]
-            
-            # Yield failed immediately
-            for fp in failed_paths:
+        for fp, scores in self.score_files_streaming(file_paths, model_name, batch_size, stop_event):
+            if scores is None:
                 yield (fp, [])
-            
-            if valid_items:
-                batch_images = np.stack([img for _, img in valid_items], axis=0)
-                
-                with self._inference_lock:
-                    preds = self._model.run(None, {self._input_name: batch_images})[0]
-                
-                for (fp, _), scores in zip(valid_items, preds):
-                    tags = self._extract_tags_from_scores(
-                        scores, general_threshold, character_threshold,
-                        hide_rating_tags, character_tags_first
-                    )
-                    yield (fp, tags)
+            else:
+                yield (fp, self.tags_from_scores(
+                    scores, general_threshold, character_threshold,
+                    hide_rating_tags, character_tags_first
+                ))
+    
+    def tags_from_scores(
+        self,
+        scores: np.ndarray,
+        general_threshold: float = 0.35,
+        character_threshold: float = 0.85,
+        hide_rating_tags: bool = True,
+        character_tags_first: bool = True
+    ) -> List[Dict[str, Any]]:
+        """Apply thresholds to a score vector of the loaded model."""
+        return self._extract_tags_from_scores(
+            scores, general_threshold, character_threshold,
+            hide_rating_tags, character_tags_first
+        )
+    
+    @property
+    def label_count(self) -> Optional[int]:
+        """Number of scores per image for the loaded model."""
+        return len(self._tag_data['names']) if self._tag_data else None
     
     def _extract_gif_frame(self, file_path: str, frame_index: int = 0) -> Image.Image:
         """Extract a frame from a GIF."""
-        with Image.open(file_path) as gif:
-            gif.seek(frame_index)
-            return gif.convert('RGB')
+        return extract_gif_frame(file_path, frame_index)
     
     def _extract_video_frame(self, file_path: str, frame_index: int = 0) -> Image.Image:
-        """Extract a frame from a video file using ffmpeg."""
-        import subprocess
-        import tempfile
-        
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-            tmp_path = tmp.name
-        
-        try:
-            cmd = [
-                'ffmpeg', '-i', file_path,
-                '-vf', f'select=eq(n\\,{frame_index})',
-                '-vframes', '1',
-                '-y', '-loglevel', 'error',
-                tmp_path
-            ]
-            subprocess.run(cmd, capture_output=True, check=True, timeout=30)
-            
-            image = Image.open(tmp_path).convert('RGB')
-            return image
-        finally:
-            if os.path.exists(tmp_path):
-                try:
-                    os.remove(tmp_path)
-                except OSError:
-                    pass
+        """Extract a frame from a video file."""
+        return extract_video_frame(file_path, frame_index)
     
     @property
     def is_loaded(self) -> bool:
@@ -579,9 +741,24 @@ class WDTagger:
     def current_model(self) -> Optional[str]:
         return self._current_model_name
     
+    @property
+    def current_variant(self) -> Optional[str]:
+        return self._loaded_variant
+    
+    @property
+    def variant_error(self) -> Optional[str]:
+        """Set when the configured variant could not be loaded and fp32 is used instead"""
+        return self._variant_error
+    
+    @property
+    def calibration(self) -> Optional[Dict[str, Any]]:
+        return self._calibration
+    
     def get_optimal_batch_size(self, model_name: Optional[str] = None) -> int:
-        """Get optimal batch size for the specified or current model."""
+        """Get the calibrated (or default) batch size for the specified or current model."""
         name = model_name or self._current_model_name or "wd-eva02-large-tagger-v3"
+        if self._calibration and name == self._current_model_name:
+            return self._calibration["batch_size"]
         return self.OPTIMAL_BATCH_SIZES.get(name, 4)
     
     def shutdown(self):
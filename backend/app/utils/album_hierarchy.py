@@ -0,0 +1,144 @@
+"""
+Album hierarchy queries backed by the blombooru_album_closure table.
+
+The closure table stores every (ancestor, descendant) pair, so subtree and
+breadcrumb lookups are single indexed joins instead of walks over
+blombooru_album_hierarchy. Whenever hierarchy edges change, the closure rows
+of the affected albums are recomputed in the same transaction with
+rebuild_album_closure(), which walks the edges with one WITH RECURSIVE query.
+The walk tracks the path it took and never revisits an album on it, so it
+terminates even if the stored hierarchy contains a cycle.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import select, text, literal
+from typing import Dict, Iterable, List, Optional, Union
+
+from ..models import blombooru_album_media, blombooru_album_hierarchy, blombooru_album_closure
+
+closure = blombooru_album_closure
+
+def _album_filter(album_ids):
+    """Accept a single ID, a list of IDs or a SELECT of IDs"""
+    if isinstance(album_ids, int):
+        return [album_ids]
+    if isinstance(album_ids, (list, tuple, set)):
+        return list(album_ids)
+    return album_ids
+
+def rebuild_album_closure(db, album_ids: Optional[Iterable[int]] = None):
+    """
+    Recompute the closure rows whose descendant is one of album_ids, or the
+    whole table when album_ids is None. Runs in the caller's transaction.
+    When an album moves, pass its whole subtree, since every album below it
+    gets new ancestors.
+    """
+    if album_ids is None:
+        where, params = "", {}
+        db.execute(text("DELETE FROM blombooru_album_closure"))
+    else:
+        album_ids = sorted(set(album_ids))
+        if not album_ids:
+            return
+        where, params = "WHERE id = ANY(CAST(:album_ids AS integer[]))", {"album_ids": album_ids}
+        db.execute(
+            text("DELETE FROM blombooru_album_closure WHERE descendant_id = ANY(CAST(:album_ids AS integer[]))"),
+            params
+        )
+
+    db.execute(text(f"""
+        WITH RECURSIVE up(descendant_id, ancestor_id, depth, path) AS (
+            SELECT id, id, 0, ARRAY[id] FROM blombooru_albums {where}
+            UNION ALL
+            SELECT up.descendant_id, h.parent_album_id, up.depth + 1, up.path || h.parent_album_id
+            FROM up
+            JOIN blombooru_album_hierarchy AS h ON h.child_album_id = up.ancestor_id
+            WHERE NOT h.parent_album_id = ANY(up.path)
+        )
+        INSERT INTO blombooru_album_closure (ancestor_id, descendant_id, depth)
+        SELECT ancestor_id, descendant_id, min(depth)
+        FROM up
+        GROUP BY ancestor_id, descendant_id
+    """), params)
+
+def descendants_query(album_ids: Union[int, Iterable[int]], include_self: bool = True):
+    """SELECT of (root_id, album_id) rows: every album below each root"""
+    query = select(
+        closure.c.ancestor_id.label('root_id'),
+        closure.c.descendant_id.label('album_id')
+    ).where(closure.c.ancestor_id.in_(_album_filter(album_ids)))
+    if not include_self:
+        query = query.where(closure.c.depth > 0)
+    return query
+
+def get_descendant_ids(db: Session, album_id: int, include_self: bool = True) -> List[int]:
+    """IDs of every album below album_id"""
+    tree = descendants_query(album_id, include_self).subquery()
+    return sorted(row[0] for row in db.execute(select(tree.c.album_id)))
+
+def get_descendant_map(db: Session, album_ids: Iterable[int], include_self: bool = True) -> Dict[int, List[int]]:
+    """Descendant album IDs for several roots in one query"""
+    album_ids = list(album_ids)
+    result = {album_id: [] for album_id in album_ids}
+    if not album_ids:
+        return result
+
+    for root_id, descendant_id in db.execute(descendants_query(album_ids, include_self)):
+        result[root_id].append(descendant_id)
+    return result
+
+def get_ancestor_ids(db: Session, album_id: int) -> List[int]:
+    """IDs of every album above album_id, through any parent"""
+    rows = db.execute(
+        select(closure.c.ancestor_id).where(
+            closure.c.descendant_id == album_id,
+            closure.c.ancestor_id != album_id
+        )
+    )
+    return sorted(row[0] for row in rows)
+
+def get_breadcrumb_ids(db: Session, album_id: int) -> List[int]:
+    """
+    Parent chain of an album, root first. Albums with several parents follow
+    the lowest parent ID at each level.
+    """
+    hierarchy = blombooru_album_hierarchy
+    edges = db.execute(
+        select(hierarchy.c.child_album_id, hierarchy.c.parent_album_id).join(
+            closure, closure.c.ancestor_id == hierarchy.c.child_album_id
+        ).where(closure.c.descendant_id == album_id)
+    )
+    parents: Dict[int, int] = {}
+    for child_id, parent_id in edges:
+        if child_id not in parents or parent_id < parents[child_id]:
+            parents[child_id] = parent_id
+
+    chain = []
+    visited = {album_id}
+    current_id = parents.get(album_id)
+    while current_id is not None and current_id not in visited:
+        visited.add(current_id)
+        chain.insert(0, current_id)
+        current_id = parents.get(current_id)
+    return chain
+
+def is_descendant(db: Session, album_id: int, ancestor_id: int) -> bool:
+    """Whether album_id is ancestor_id itself or lies anywhere below it"""
+    return db.execute(
+        select(literal(1)).where(
+            closure.c.ancestor_id == ancestor_id,
+            closure.c.descendant_id == album_id
+        ).limit(1)
+    ).first() is not None
+
+def descendant_media_ids_query(album_ids: Union[int, Iterable[int]], include_self: bool = True):
+    """SELECT of the distinct media IDs in the given albums and all of their sub-albums"""
+    query = select(blombooru_album_media.c.media_id).join(
+        closure, blombooru_album_media.c.album_id == closure.c.descendant_id
+    ).where(closure.c.ancestor_id.in_(_album_filter(album_ids)))
+    if not include_self:
+        query = query.where(closure.c.depth > 0)
+    return query.distinct()
+
+def get_descendant_media_ids(db: Session, album_id: int) -> List[int]:
+    """Distinct media IDs in an album and all of its sub-albums"""
+    return sorted(row[0] for row in db.execute(descendant_media_ids_query(album_id)))
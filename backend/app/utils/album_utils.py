@@ -1,240 +1,75 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, text
-from typing import List
-import random
+from sqlalchemy import func, text, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import Iterable, List, Optional, Tuple
 from datetime import datetime
 
-from ..models import Album, Media, RatingEnum, blombooru_album_media, blombooru_album_hierarchy
+from ..models import Album, Media, RatingEnum, Tag, blombooru_album_media, blombooru_media_tags
+from .album_hierarchy import descendant_media_ids_query, get_breadcrumb_ids
 
-def get_album_rating(album_id: int, db: Session, visited: set = None) -> RatingEnum:
-    """Recursively compute the highest rating of all media in album and its children"""
-    if visited is None:
-        visited = set()
-    
-    if album_id in visited:
-        return RatingEnum.safe
-    
-    visited.add(album_id)
-    
-    # Get ratings from direct media in this album
-    media_ratings = db.query(Media.rating).join(
-        blombooru_album_media,
-        Media.id == blombooru_album_media.c.media_id
-    ).filter(
-        blombooru_album_media.c.album_id == album_id
-    ).all()
-    
-    # Get ratings from child albums (recursive)
-    child_album_ids = db.query(blombooru_album_hierarchy.c.child_album_id).filter(
-        blombooru_album_hierarchy.c.parent_album_id == album_id
-    ).all()
-    
-    all_ratings = [r[0] for r in media_ratings]
-    
-    for child_id_tuple in child_album_ids:
-        child_rating = get_album_rating(child_id_tuple[0], db, visited)
-        all_ratings.append(child_rating)
-    
-    if not all_ratings:
-        return RatingEnum.safe
-    
-    # Return highest rating (explicit > questionable > safe)
-    rating_priority = {RatingEnum.explicit: 3, RatingEnum.questionable: 2, RatingEnum.safe: 1}
-    return max(all_ratings, key=lambda r: rating_priority[r])
-
-def get_album_tags(album_id: int, db: Session, visited: set = None) -> List[dict]:
-    """Recursively aggregate all tags from media in album and its children"""
-    if visited is None:
-        visited = set()
-    
-    if album_id in visited:
-        return []
-    
-    visited.add(album_id)
-    
-    # Get tags from direct media in this album
-    from ..models import Tag
-    media_tags = db.query(Tag).join(
-        Media.tags
-    ).join(
-        blombooru_album_media,
-        Media.id == blombooru_album_media.c.media_id
-    ).filter(
-        blombooru_album_media.c.album_id == album_id
-    ).distinct().all()
-    
-    # Get tags from child albums (recursive)
-    child_album_ids = db.query(blombooru_album_hierarchy.c.child_album_id).filter(
-        blombooru_album_hierarchy.c.parent_album_id == album_id
-    ).all()
-    
-    all_tags = {tag.id: tag for tag in media_tags}
-    
-    for child_id_tuple in child_album_ids:
-        child_tags = get_album_tags(child_id_tuple[0], db, visited)
-        for tag_dict in child_tags:
-            all_tags[tag_dict['id']] = tag_dict
-    
-    return [{'id': tag.id if hasattr(tag, 'id') else tag['id'], 
-             'name': tag.name if hasattr(tag, 'name') else tag['name']} 
-            for tag in all_tags.values()]
-
-def get_random_thumbnails(album_id: int, db: Session, count: int = 4, visited: set = None) -> List[str]:
-    """Get random media thumbnails from album and its children"""
-    if visited is None:
-        visited = set()
-    
-    if album_id in visited:
-        return []
-    
-    visited.add(album_id)
-    
-    # Get all media from this album and children (recursive)
-    media_data = db.query(Media.id).join(
-        blombooru_album_media,
-        Media.id == blombooru_album_media.c.media_id
-    ).filter(
-        blombooru_album_media.c.album_id == album_id,
-        Media.thumbnail_path.isnot(None)
-    ).all()
-    
-    # Get media from child albums
-    child_album_ids = db.query(blombooru_album_hierarchy.c.child_album_id).filter(
-        blombooru_album_hierarchy.c.parent_album_id == album_id
-    ).all()
-    
-    all_ids = [m[0] for m in media_data]
-    
-    for child_id_tuple in child_album_ids:
-        child_ids = get_random_thumbnail_ids(child_id_tuple[0], db, count, visited)
-        all_ids.extend(child_ids)
-    
-    # Remove duplicates and shuffle
-    unique_ids = list(set(all_ids))
-    random.shuffle(unique_ids)
-    
-    # Convert to API URLs
-    return [f"/api/media/{mid}/thumbnail" for mid in unique_ids[:count]]
-
-def get_random_thumbnail_ids(album_id: int, db: Session, count: int = 4, visited: set = None) -> List[int]:
-    """Helper to get random media IDs for thumbnails (recursive)"""
-    if visited is None:
-        visited = set()
-    
-    if album_id in visited:
-        return []
-    
-    visited.add(album_id)
-    
-    media_ids = db.query(Media.id).join(
-        blombooru_album_media,
-        Media.id == blombooru_album_media.c.media_id
-    ).filter(
-        blombooru_album_media.c.album_id == album_id,
-        Media.thumbnail_path.isnot(None)
-    ).all()
-    
-    child_album_ids = db.query(blombooru_album_hierarchy.c.child_album_id).filter(
-        blombooru_album_hierarchy.c.parent_album_id == album_id
-    ).all()
-    
-    all_ids = [m[0] for m in media_ids]
-    
-    for child_id_tuple in child_album_ids:
-        child_ids = get_random_thumbnail_ids(child_id_tuple[0], db, count, visited)
-        all_ids.extend(child_ids)
-    
-    return all_ids
+# Cover thumbnails stored per album
+ALBUM_COVER_COUNT = 4
 
 def update_album_last_modified(album_id: int, db: Session):
     """Update last_modified timestamp for album"""
-    db.execute(
-        text("UPDATE blombooru_albums SET last_modified = :now WHERE id = :album_id"),
-        {"now": datetime.now(), "album_id": album_id}
-    )
+    update_albums_last_modified([album_id], db)
+
+def update_albums_last_modified(album_ids: Iterable[int], db: Session):
+    """Update last_modified timestamp for several albums in one statement"""
+    album_ids = sorted(set(album_ids))
+    if album_ids:
+        db.execute(
+            text("UPDATE blombooru_albums SET last_modified = :now WHERE id = ANY(CAST(:album_ids AS integer[]))"),
+            {"now": datetime.now(), "album_ids": album_ids}
+        )
     db.commit()
 
-def get_parent_ids(album_id: int, db: Session) -> List[int]:
-    """Get all parent album IDs (breadcrumb trail)"""
-    parent_ids = []
-    current_id = album_id
-    visited = set()
-    
-    while current_id and current_id not in visited:
-        visited.add(current_id)
-        parent = db.query(blombooru_album_hierarchy.c.parent_album_id).filter(
-            blombooru_album_hierarchy.c.child_album_id == current_id
-        ).first()
-        
-        if parent:
-            parent_ids.insert(0, parent[0])
-            current_id = parent[0]
-        else:
-            break
-    
-    return parent_ids
+def add_media_to_albums(db: Session, album_ids: Iterable[int], media_ids: Iterable[int]) -> int:
+    """
+    Link every existing media item to every existing album with a single
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING and update the album
+    aggregates. Returns the number of new links.
+    """
+    album_ids = sorted(set(album_ids))
+    media_ids = sorted(set(media_ids))
+    if not album_ids or not media_ids:
+        return 0
 
-def get_media_count(album_id: int, db: Session, visited: set = None) -> int:
-    """Get total count of media in album and children (recursive)"""
-    if visited is None:
-        visited = set()
-    
-    if album_id in visited:
+    stmt = pg_insert(blombooru_album_media).from_select(
+        ['album_id', 'media_id'],
+        select(Album.id, Media.id).where(Album.id.in_(album_ids), Media.id.in_(media_ids))
+    ).on_conflict_do_nothing().returning(blombooru_album_media.c.album_id, blombooru_album_media.c.media_id)
+    links = db.execute(stmt).all()
+    album_media_added(db, links)
+    return len(links)
+
+def remove_media_from_albums(db: Session, album_ids: Iterable[int], media_ids: Iterable[int]) -> int:
+    """
+    Unlink media from albums with one DELETE and update the album aggregates.
+    Returns the number of removed links
+    """
+    album_ids = sorted(set(album_ids))
+    media_ids = sorted(set(media_ids))
+    if not album_ids or not media_ids:
         return 0
-    
-    visited.add(album_id)
-    
-    # Count direct media
-    direct_count = db.query(func.count(blombooru_album_media.c.media_id)).filter(
-        blombooru_album_media.c.album_id == album_id
-    ).scalar()
-    
-    # Count media in children
-    child_album_ids = db.query(blombooru_album_hierarchy.c.child_album_id).filter(
-        blombooru_album_hierarchy.c.parent_album_id == album_id
-    ).all()
-    
-    total_count = direct_count
-    for child_id_tuple in child_album_ids:
-        total_count += get_media_count(child_id_tuple[0], db, visited)
-    
-    return total_count
 
-def get_album_popular_tags(album_id: int, db: Session, limit: int = 20, visited: set = None) -> List[dict]:
-    """Recursively aggregate and count tags from media in album and its children"""
-    if visited is None:
-        visited = set()
-    
-    if album_id in visited:
-        return []
-    
-    visited.add(album_id)
-    
-    from ..models import Tag, blombooru_media_tags
-    
-    # Get all media IDs in this album and children
-    def get_all_media_ids(aid: int, v: set) -> List[int]:
-        if aid in v: return []
-        v.add(aid)
-        
-        mids = [m[0] for m in db.query(blombooru_album_media.c.media_id).filter(
-            blombooru_album_media.c.album_id == aid
-        ).all()]
-        
-        child_aids = [c[0] for c in db.query(blombooru_album_hierarchy.c.child_album_id).filter(
-            blombooru_album_hierarchy.c.parent_album_id == aid
-        ).all()]
-        
-        for caid in child_aids:
-            mids.extend(get_all_media_ids(caid, v))
-        return mids
+    links = [(a_id, m_id) for a_id in album_ids for m_id in media_ids]
+    stale_album_ids = _album_media_removing(db, links)
+    removed = db.execute(
+        blombooru_album_media.delete().where(
+            blombooru_album_media.c.album_id.in_(album_ids),
+            blombooru_album_media.c.media_id.in_(media_ids)
+        )
+    ).rowcount
+    _recompute_album_aggregates(db, stale_album_ids)
+    return removed
 
-    all_media_ids = get_all_media_ids(album_id, set())
-    
-    if not all_media_ids:
-        return []
-    
-    # Count tags for these media IDs
+def get_parent_ids(album_id: int, db: Session) -> List[int]:
+    """Get all parent album IDs (breadcrumb trail)"""
+    return get_breadcrumb_ids(db, album_id)
+
+def get_album_popular_tags(album_id: int, db: Session, limit: int = 20) -> List[dict]:
+    """Aggregate and count tags from media in album and its children"""
     tag_counts = db.query(
         Tag.id,
         Tag.name,
@@ -244,7 +79,7 @@ def get_album_popular_tags(album_id: int, db: Session, limit: int = 20, visited:
         blombooru_media_tags,
         Tag.id == blombooru_media_tags.c.tag_id
     ).filter(
-        blombooru_media_tags.c.media_id.in_(all_media_ids)
+        blombooru_media_tags.c.media_id.in_(descendant_media_ids_query(album_id))
     ).group_by(
         Tag.id
     ).order_by(
@@ -260,71 +95,181 @@ def get_album_popular_tags(album_id: int, db: Session, limit: int = 20, visited:
         } for tc in tag_counts
     ]
 
-def get_bulk_album_metrics(album_ids: List[int], db: Session):
+def refresh_album_aggregates(db: Session, album_ids: Optional[Iterable[int]] = None):
     """
-    Efficiently compute recursive ratings and counts for a list of albums.
-    Uses only a few queries regardless of the number of albums.
+    Recompute media_count, max_rating and cover_media_ids for the given albums
+    and every album above them, or for all albums when album_ids is None.
+    Call after the hierarchy changes and for the backfill; membership and
+    rating changes go through the incremental helpers below. Runs in the
+    caller's transaction.
     """
+    if album_ids is None:
+        _update_album_aggregates(db, "SELECT id AS album_id FROM blombooru_albums", {})
+        return
+
+    album_ids = sorted(set(album_ids))
     if not album_ids:
-        return {}
+        return
+    _update_album_aggregates(db, """
+        SELECT DISTINCT ancestor_id AS album_id
+        FROM blombooru_album_closure
+        WHERE descendant_id = ANY(CAST(:album_ids AS integer[]))
+    """, {"album_ids": album_ids})
 
-    # 1. Fetch direct media ratings and counts for ALL albums
-    direct_stats = db.query(
-        blombooru_album_media.c.album_id,
-        Media.rating,
-        func.count(Media.id).label('count')
-    ).join(Media, Media.id == blombooru_album_media.c.media_id).group_by(blombooru_album_media.c.album_id, Media.rating).all()
-    
-    album_data = {}
-    for aid, rating, count in direct_stats:
-        if aid not in album_data:
-            album_data[aid] = {'ratings': set(), 'count': 0}
-        album_data[aid]['ratings'].add(rating)
-        album_data[aid]['count'] += count
-    
-    # 2. Fetch entire hierarchy
-    hierarchies = db.query(blombooru_album_hierarchy).all()
-    children_map = {}
-    for pid, cid in hierarchies:
-        if pid not in children_map:
-            children_map[pid] = []
-        children_map[pid].append(cid)
-        
-    # 3. Recursive computation with memoization
-    memo = {}
-    rating_priority = {RatingEnum.explicit: 3, RatingEnum.questionable: 2, RatingEnum.safe: 1}
+def _recompute_album_aggregates(db: Session, album_ids: Iterable[int]):
+    """Recompute the aggregates of exactly these albums"""
+    album_ids = sorted(set(album_ids))
+    if album_ids:
+        _update_album_aggregates(
+            db, "SELECT unnest(CAST(:album_ids AS integer[])) AS album_id", {"album_ids": album_ids}
+        )
+
+def _update_album_aggregates(db: Session, targets: str, params: dict):
+    db.execute(text(f"""
+        WITH targets AS ({targets}),
+        members AS (
+            SELECT DISTINCT c.ancestor_id AS album_id, am.media_id
+            FROM blombooru_album_closure AS c
+            JOIN blombooru_album_media AS am ON am.album_id = c.descendant_id
+            WHERE c.ancestor_id IN (SELECT album_id FROM targets)
+        ),
+        stats AS (
+            SELECT mb.album_id, count(*) AS media_count, max(m.rating) AS max_rating
+            FROM members AS mb
+            JOIN blombooru_media AS m ON m.id = mb.media_id
+            GROUP BY mb.album_id
+        ),
+        covers AS (
+            SELECT album_id, array_agg(media_id) AS media_ids
+            FROM (
+                SELECT mb.album_id, mb.media_id,
+                       row_number() OVER (PARTITION BY mb.album_id ORDER BY random()) AS rn
+                FROM members AS mb
+                JOIN blombooru_media AS m ON m.id = mb.media_id
+                WHERE m.thumbnail_path IS NOT NULL
+            ) AS ranked
+            WHERE rn <= :cover_count
+            GROUP BY album_id
+        )
+        UPDATE blombooru_albums AS a
+        SET media_count = COALESCE(s.media_count, 0),
+            max_rating = COALESCE(s.max_rating, 'safe'),
+            cover_media_ids = COALESCE(cv.media_ids, '{{}}')
+        FROM targets AS t
+        LEFT JOIN stats AS s ON s.album_id = t.album_id
+        LEFT JOIN covers AS cv ON cv.album_id = t.album_id
+        WHERE a.id = t.album_id
+    """), {**params, "cover_count": ALBUM_COVER_COUNT})
+
+# (ancestor album, media) pairs that exist only through the given album
+# links: the same media may also reach an ancestor through another
+# sub-album, and then that ancestor's aggregates do not change.
+_LINK_ONLY_MEMBERS = """
+    links AS (
+        SELECT am.album_id, am.media_id
+        FROM unnest(CAST(:album_ids AS integer[]), CAST(:media_ids AS integer[])) AS l(album_id, media_id)
+        JOIN blombooru_album_media AS am ON am.album_id = l.album_id AND am.media_id = l.media_id
+    ),
+    members AS (
+        SELECT DISTINCT c.ancestor_id AS album_id, l.media_id
+        FROM links AS l
+        JOIN blombooru_album_closure AS c ON c.descendant_id = l.album_id
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM blombooru_album_closure AS other
+            JOIN blombooru_album_media AS am ON am.album_id = other.descendant_id
+            WHERE other.ancestor_id = c.ancestor_id
+              AND am.media_id = l.media_id
+              AND NOT EXISTS (
+                  SELECT 1 FROM links AS l2
+                  WHERE l2.album_id = am.album_id AND l2.media_id = am.media_id
+              )
+        )
+    ),
+    stats AS (
+        SELECT mb.album_id, count(*) AS media_count, max(m.rating) AS max_rating,
+               array_agg(m.id ORDER BY random()) FILTER (WHERE m.thumbnail_path IS NOT NULL) AS media_ids
+        FROM members AS mb
+        JOIN blombooru_media AS m ON m.id = mb.media_id
+        GROUP BY mb.album_id
+    )
+"""
+
+def _link_params(links: Iterable[Tuple[int, int]]) -> dict:
+    links = list(links)
+    return {
+        "album_ids": [album_id for album_id, _ in links],
+        "media_ids": [media_id for _, media_id in links]
+    }
 
-    def compute(aid, visited):
-        if aid in memo:
-            return memo[aid]
-        if aid in visited:
-            return {'rating': RatingEnum.safe, 'count': 0}
-        
-        # Avoid circular references
-        new_visited = visited | {aid}
-        
-        # Start with direct stats
-        stats = album_data.get(aid, {'ratings': set(), 'count': 0})
-        current_ratings = set(stats['ratings'])
-        current_count = stats['count']
-        
-        # Add child stats
-        for cid in children_map.get(aid, []):
-            child_stats = compute(cid, new_visited)
-            current_ratings.add(child_stats['rating'])
-            current_count += child_stats['count']
-            
-        # Determine highest rating
-        highest = RatingEnum.safe
-        if current_ratings:
-            highest = max(current_ratings, key=lambda r: rating_priority.get(r, 0))
-            
-        res = {'rating': highest, 'count': current_count}
-        memo[aid] = res
-        return res
+def album_media_added(db: Session, links: Iterable[Tuple[int, int]]):
+    """
+    Update the aggregates of every album above newly inserted
+    (album_id, media_id) links. Runs in the caller's transaction.
+    """
+    params = _link_params(links)
+    if not params["album_ids"]:
+        return
+
+    db.execute(text(f"""
+        WITH {_LINK_ONLY_MEMBERS}
+        UPDATE blombooru_albums AS a
+        SET media_count = a.media_count + s.media_count,
+            max_rating = GREATEST(a.max_rating, s.max_rating),
+            cover_media_ids = (a.cover_media_ids || COALESCE(s.media_ids, '{{}}'))[1:CAST(:cover_count AS integer)]
+        FROM stats AS s
+        WHERE a.id = s.album_id
+    """), {**params, "cover_count": ALBUM_COVER_COUNT})
 
-    final_results = {}
-    for aid in album_ids:
-        final_results[aid] = compute(aid, set())
-        
-    return final_results
+def _album_media_removing(db: Session, links: Iterable[Tuple[int, int]]) -> List[int]:
+    """
+    Lower the media counts of every album above (album_id, media_id) links
+    that are about to be deleted. Returns the albums that lose their highest
+    rated media or a cover, whose aggregates must be recomputed once the
+    links are gone.
+    """
+    params = _link_params(links)
+    if not params["album_ids"]:
+        return []
+
+    rows = db.execute(text(f"""
+        WITH {_LINK_ONLY_MEMBERS}
+        UPDATE blombooru_albums AS a
+        SET media_count = GREATEST(a.media_count - s.media_count, 0)
+        FROM stats AS s
+        WHERE a.id = s.album_id
+        RETURNING a.id,
+                  (a.max_rating <> 'safe' AND s.max_rating = a.max_rating)
+                  OR a.cover_media_ids && COALESCE(s.media_ids, '{{}}') AS stale
+    """), params).all()
+    return [album_id for album_id, stale in rows if stale]
+
+def unlink_media_from_all_albums(db: Session, media_id: int) -> List[int]:
+    """Remove a media item from every album it is in. Returns those album IDs"""
+    album_ids = [a_id for (a_id,) in db.query(blombooru_album_media.c.album_id).filter(
+        blombooru_album_media.c.media_id == media_id
+    ).all()]
+    remove_media_from_albums(db, album_ids, [media_id])
+    return album_ids
+
+def album_media_rating_changed(db: Session, media_id: int, old_rating: RatingEnum):
+    """
+    Update max_rating of every album containing a media item whose rating
+    changed from old_rating. Runs in the caller's transaction after the
+    new rating was flushed.
+    """
+    rows = db.execute(text("""
+        UPDATE blombooru_albums AS a
+        SET max_rating = GREATEST(a.max_rating, m.rating)
+        FROM blombooru_media AS m
+        WHERE m.id = :media_id
+          AND a.id IN (
+              SELECT c.ancestor_id
+              FROM blombooru_album_closure AS c
+              JOIN blombooru_album_media AS am ON am.album_id = c.descendant_id
+              WHERE am.media_id = :media_id
+          )
+        RETURNING a.id, m.rating < a.max_rating AND a.max_rating = CAST(:old_rating AS ratingenum) AS stale
+    """), {"media_id": media_id, "old_rating": RatingEnum(old_rating).value}).all()
+    # Albums whose highest rating was this media's old one may now be lower
+    _recompute_album_aggregates(db, [album_id for album_id, stale in rows if stale])
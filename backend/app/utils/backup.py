@@ -3,11 +3,12 @@ import zipfile
 import json
 import io
 import shutil
-from typing import Generator, BinaryIO, List
+from typing import Generator, BinaryIO, List, Optional
 from pathlib import Path
 from sqlalchemy.orm import Session, joinedload
 from ..models import Tag, TagAlias, Media, blombooru_media_tags
 from ..config import settings
+from .tag_utils import get_or_create_tags, apply_tag_count_deltas, normalize_tag_names
 from fastapi import HTTPException
 
 # Constants for batch processing
@@ -162,13 +163,11 @@ def import_full_backup(zip_source, db: Session):
         
         # 1. Handle tags.csv using existing CSV import logic
         if 'tags.csv' in zf.namelist():
-            # Import tags using the existing admin CSV import logic
-            # This ensures DRY - single source of truth
-            from ..routes.admin import import_tags_csv_logic
+            # Import tags using the shared streaming CSV import
+            from ..services.tag_import import import_tags_csv_stream
             
             with zf.open('tags.csv') as f:
-                content = f.read().decode('utf-8')
-                import_tags_csv_logic(content, db)
+                import_tags_csv_stream(db, f)
         
         # 2. Check for backup.json for media metadata
         if 'backup.json' in zf.namelist():
@@ -184,34 +183,29 @@ def import_full_backup(zip_source, db: Session):
             if 'tags.csv' not in zf.namelist():
                 raise HTTPException(status_code=400, detail="No valid backup data found")
 
+        legacy_hashes = {}
         if media_list:
-            import_media_logical(db, zf, media_list)
+            legacy_hashes = import_media_logical(db, zf, media_list)
             
         # 3. Import Albums
         albums_list = backup_data.get('albums', [])
         if albums_list:
-            import_albums_logical(db, albums_list)
+            import_albums_logical(db, albums_list, legacy_hashes)
 
     return {"message": "Import completed successfully"}
 
 def import_tags_logical(db: Session, tags: List[dict], aliases: List[dict]):
-    existing_tags = {t.name: t for t in db.query(Tag).all()}
-    tags_to_create = []
-
+    categories = {}
     for tag_data in tags:
-        name = tag_data['name']
-        if name not in existing_tags:
-            tags_to_create.append({
-                'name': name,
-                'category': tag_data.get('category', 'general'),
-                'post_count': 0
-            })
-
-    if tags_to_create:
-        for i in range(0, len(tags_to_create), DB_BATCH_SIZE):
-            chunk = tags_to_create[i:i+DB_BATCH_SIZE]
-            db.bulk_insert_mappings(Tag, chunk)
-            db.commit()
+        # Keyed by the stored form of the name so the category survives normalization
+        name = tag_data['name'].strip().lower()
+        if name:
+            categories[name] = tag_data.get('category', 'general')
+
+    names = list(categories.keys())
+    for i in range(0, len(names), DB_BATCH_SIZE):
+        get_or_create_tags(db, names[i:i+DB_BATCH_SIZE], categories)
+        db.commit()
   
     db.expire_all()
     existing_tags = {t.name: t for t in db.query(Tag).all()}
@@ -220,10 +214,11 @@ def import_tags_logical(db: Session, tags: List[dict], aliases: List[dict]):
     aliases_to_create = []
 
     for alias_data in aliases:
-        name = alias_data['alias_name']
-        target_name = alias_data.get('target_tag')
+        name = alias_data['alias_name'].strip().lower()
+        target_name = (alias_data.get('target_tag') or '').strip().lower()
 
-        if name not in existing_aliases and target_name in existing_tags:
+        if name and name not in existing_aliases and target_name in existing_tags:
+            existing_aliases.add(name)
             aliases_to_create.append({
                 'alias_name': name,
                 'target_tag_id': existing_tags[target_name].id
@@ -236,7 +231,8 @@ def import_tags_logical(db: Session, tags: List[dict], aliases: List[dict]):
             db.commit()
 
 def import_media_logical(db: Session, zf: zipfile.ZipFile, media_list: List[dict]):
-    from ..utils.thumbnail_generator import generate_thumbnail
+    from ..services.media_processing import media_processing
+    from ..services.media_ingest import stage_stream
     from ..schemas import FileTypeEnum
     
     print(f"Starting logical media import for {len(media_list)} items...")
@@ -248,7 +244,13 @@ def import_media_logical(db: Session, zf: zipfile.ZipFile, media_list: List[dict
     
     imported_count = 0
     skipped_count = 0
+    tag_deltas = {}
     parent_links = []
+    # (media, future, thumb_path) - thumbnails are generated in the process pool
+    # while the next files are copied out of the archive
+    pending_thumbnails = []
+    # backup hash -> content hash, for entries exported with a legacy hash
+    legacy_hashes = {}
     
     for media_data in media_list:
         file_hash = media_data.get('hash')
@@ -281,8 +283,22 @@ def import_media_logical(db: Session, zf: zipfile.ZipFile, media_list: List[dict
             import uuid
             target_path = target_path.with_name(f"{stem}_{uuid.uuid4().hex[:8]}{suffix}")
 
-        with zf.open(zip_entry_name) as source, open(target_path, "wb") as target:
-            shutil.copyfileobj(source, target)
+        # Hash while copying so backups made before the switch to SHA-256
+        # (and any corrupted entries) still deduplicate correctly. The copy is
+        # staged under a temp name so the folder watcher ignores it
+        with zf.open(zip_entry_name) as source:
+            temp_path, copied_hash, _ = stage_stream(source)
+
+        if copied_hash != file_hash:
+            if file_hash:
+                legacy_hashes[file_hash] = copied_hash
+            file_hash = copied_hash
+            if file_hash in existing_hashes:
+                temp_path.unlink(missing_ok=True)
+                skipped_count += 1
+                continue
+        existing_hashes.add(file_hash)
+        temp_path.replace(target_path)
             
         # Generate Thumbnail
         thumb_filename = target_path.stem + ".jpg" # Always JPEG
@@ -297,15 +313,12 @@ def import_media_logical(db: Session, zf: zipfile.ZipFile, media_list: List[dict
         elif file_type_str == 'gif':
             file_type_enum = FileTypeEnum.gif
             
-        try:
-            generate_thumbnail(target_path, thumb_path, file_type_enum)
-        except Exception as e:
-            print(f"Failed to generate thumbnail for {target_path}: {e}")
+        thumb_future = media_processing.generate_thumbnail(target_path, thumb_path, file_type_enum)
 
         new_media = Media(
             filename=target_path.name,
             path=str(target_path),
-            thumbnail_path=str(thumb_path) if thumb_path.exists() else None,
+            thumbnail_path=None,
             hash=file_hash,
             file_type=media_data.get('file_type'),
             mime_type=media_data.get('mime_type'),
@@ -317,28 +330,40 @@ def import_media_logical(db: Session, zf: zipfile.ZipFile, media_list: List[dict
         )
         db.add(new_media)
         db.flush() # Get ID
+        pending_thumbnails.append((new_media, thumb_future, thumb_path))
         
         # Track parent for linking
         parent_hash = media_data.get('parent_hash')
         if parent_hash:
             parent_links.append((new_media.id, parent_hash))
 
-        tag_names = media_data.get('tags', [])
-        tag_ids_to_link = []
-        for tname in tag_names:
-            if tname in all_tags:
-                tag_ids_to_link.append(all_tags[tname])
+        tag_names = normalize_tag_names(media_data.get('tags', []))
+        unknown_tags = [tname for tname in tag_names if tname not in all_tags]
+        if unknown_tags:
+            for tag in get_or_create_tags(db, unknown_tags):
+                all_tags[tag.name] = tag.id
+        tag_ids_to_link = list({all_tags[tname] for tname in tag_names if tname in all_tags})
 
         if tag_ids_to_link:
             stmt = blombooru_media_tags.insert().values([
                 {'media_id': new_media.id, 'tag_id': tid} for tid in tag_ids_to_link
             ])
             db.execute(stmt)
+            for tid in tag_ids_to_link:
+                tag_deltas[tid] = tag_deltas.get(tid, 0) + 1
             
         imported_count += 1
         if imported_count % 100 == 0:
             print(f"Imported {imported_count} media files...")
 
+    for media, thumb_future, thumb_path in pending_thumbnails:
+        try:
+            if thumb_future.result():
+                media.thumbnail_path = str(thumb_path)
+        except Exception as e:
+            print(f"Failed to generate thumbnail for {media.path}: {e}")
+
+    apply_tag_count_deltas(db, tag_deltas)
     db.commit()
     
     # Post-process parent links
@@ -349,6 +374,7 @@ def import_media_logical(db: Session, zf: zipfile.ZipFile, media_list: List[dict
         
         updates = []
         for child_id, parent_hash in parent_links:
+            parent_hash = legacy_hashes.get(parent_hash, parent_hash)
             if parent_hash in all_media_map:
                 parent_id = all_media_map[parent_hash]
                 # Avoid self-ref
@@ -361,9 +387,12 @@ def import_media_logical(db: Session, zf: zipfile.ZipFile, media_list: List[dict
              print(f"Linked {len(updates)} parent relationships.")
     
     print(f"Media import complete. Imported: {imported_count}, Skipped: {skipped_count}")
+    return legacy_hashes
 
-def import_albums_logical(db: Session, albums_list: List[dict]):
+def import_albums_logical(db: Session, albums_list: List[dict], legacy_hashes: Optional[dict] = None):
     from ..models import Album, blombooru_album_media, blombooru_album_hierarchy, Media
+    from .album_hierarchy import rebuild_album_closure
+    from .album_utils import refresh_album_aggregates
     from datetime import datetime
     
     print(f"Starting album import for {len(albums_list)} albums...")
@@ -420,6 +449,8 @@ def import_albums_logical(db: Session, albums_list: List[dict]):
         )
         
         for mh in media_hashes:
+            if legacy_hashes:
+                mh = legacy_hashes.get(mh, mh)
             if mh in media_map:
                 media_id = media_map[mh]
                 if media_id not in existing_links:
@@ -477,5 +508,10 @@ def import_albums_logical(db: Session, albums_list: List[dict]):
             chunk = hierarchy_inserts[i:i+DB_BATCH_SIZE]
             db.execute(blombooru_album_hierarchy.insert(), chunk)
             db.commit()
+    
+    # New albums and edges change the closure of arbitrary subtrees
+    rebuild_album_closure(db)
+    refresh_album_aggregates(db)
+    db.commit()
             
     print("Pass 3: Hierarchy reconstructed.")
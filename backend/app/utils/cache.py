@@ -70,13 +70,24 @@ def invalidate_media_cache():
     """Invalidate all media-related caches"""
     invalidate_cache("media_list", "media_detail", "search", "danbooru")
 
-def invalidate_tag_cache():
-    """Invalidate all tag-related caches"""
+def invalidate_tag_cache(rebuild_index: bool = False):
+    """
+    Invalidate all tag-related caches. Pass rebuild_index when tags or
+    aliases were deleted, recategorized or aliased, which the autocomplete
+    index cannot apply incrementally.
+    """
     invalidate_cache("tags", "tag_detail", "autocomplete", "danbooru", "media_list", "search")
+    
+    from ..services.tag_autocomplete import tag_autocomplete
+    tag_autocomplete.invalidate(rebuild=rebuild_index)
 
 def invalidate_album_cache():
     """Invalidate all album-related caches"""
     invalidate_cache("album_list", "album_contents", "danbooru")
+    
+    # Sampled covers may point at media that left the album
+    from ..services.album_covers import album_covers
+    album_covers.clear()
 
 def invalidate_media_item_cache(media_id: int):
     """
@@ -1,11 +1,23 @@
+import os
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple, TYPE_CHECKING
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from ..models import Media
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from ..models import Media, ScanManifestEntry
 from ..config import settings
 from .media_processor import calculate_file_hash
 import uuid
 import re
 
+if TYPE_CHECKING:
+    from ..services.jobs import Job
+
+# Hashing is mostly I/O bound and hashlib releases the GIL on large buffers
+SCAN_HASH_WORKERS = min(8, os.cpu_count() or 1)
+MANIFEST_BATCH_SIZE = 1000
+
 SUPPORTED_EXTENSIONS = {
     'image': ['.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tiff'],
     'gif': ['.gif'],
@@ -36,8 +48,48 @@ def sanitize_filename(filename: str) -> str:
     
     return f"{stem}{ext}"
 
-def find_untracked_media(db: Session) -> dict:
-    """Find untracked media files without processing them"""
+def iter_media_files(root: Path) -> Iterator[Tuple[Path, os.stat_result]]:
+    """Walk a directory with os.scandir, yielding supported files and their stat (symlinks are skipped)"""
+    stack = [str(root)]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_symlink():
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False) and is_supported_file(entry.name):
+                            yield Path(entry.path), entry.stat(follow_symlinks=False)
+                    except OSError as e:
+                        print(f"Error reading {entry.path}: {e}")
+        except OSError as e:
+            print(f"Error scanning directory {directory}: {e}")
+
+def _save_manifest(db: Session, rows: List[dict]):
+    for i in range(0, len(rows), MANIFEST_BATCH_SIZE):
+        stmt = pg_insert(ScanManifestEntry).values(rows[i:i + MANIFEST_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['path'],
+            set_={
+                'file_size': stmt.excluded.file_size,
+                'mtime_ns': stmt.excluded.mtime_ns,
+                'hash': stmt.excluded.hash,
+                'scanned_at': func.now()
+            }
+        )
+        db.execute(stmt)
+    db.commit()
+
+def find_untracked_media(db: Session, job: Optional["Job"] = None) -> dict:
+    """
+    Find untracked media files without processing them.
+    
+    Files whose size and mtime match the scan manifest reuse the stored
+    hash; new or changed files are hashed in a thread pool and recorded.
+    """
     original_dir = settings.ORIGINAL_DIR
     untracked_files = []
     
@@ -49,60 +101,104 @@ def find_untracked_media(db: Session) -> dict:
     # 3. Filenames
     tracked_filenames = set()
     
-    all_media = db.query(Media).all()
-    
-    for media in all_media:
-        if media.hash:
-            tracked_hashes.add(media.hash)
-        if media.filename:
-            tracked_filenames.add(media.filename)
-        if media.path:
-            try:
-                abs_path = (settings.BASE_DIR / media.path).resolve()
-                tracked_paths.add(str(abs_path))
-            except:
-                pass
-        
-        if hasattr(media, 'original_path') and media.original_path:
-            try:
-                abs_path = Path(media.original_path).resolve()
-                tracked_paths.add(str(abs_path))
-            except:
-                pass
+    base_dir = settings.BASE_DIR
+    for media_hash, media_path, filename in db.query(Media.hash, Media.path, Media.filename).yield_per(10000):
+        if media_hash:
+            tracked_hashes.add(media_hash)
+        if filename:
+            tracked_filenames.add(filename)
+        if media_path:
+            tracked_paths.add(os.path.normpath(base_dir / media_path))
+    
+    manifest = {
+        entry.path: entry
+        for entry in db.query(ScanManifestEntry.path, ScanManifestEntry.file_size, ScanManifestEntry.mtime_ns, ScanManifestEntry.hash).yield_per(10000)
+    }
     
     print(f"Scanning directory: {original_dir}")
     print(f"Tracked hashes: {len(tracked_hashes)}")
     print(f"Tracked paths: {len(tracked_paths)}")
     print(f"Tracked filenames: {len(tracked_filenames)}")
+    print(f"Manifest entries: {len(manifest)}")
     
-    for file_path in original_dir.rglob('*'):
-        if file_path.is_symlink():
+    root = original_dir
+    seen_paths = set()
+    known = []
+    to_hash = []
+    
+    for file_path, stat in iter_media_files(root):
+        if os.path.normpath(file_path) in tracked_paths:
             continue
-            
-        if not file_path.is_file() or not is_supported_file(file_path.name):
+        if file_path.name in tracked_filenames:
             continue
         
+        relative_path = file_path.relative_to(root).as_posix()
+        seen_paths.add(relative_path)
+        
+        entry = manifest.get(relative_path)
+        if entry and entry.file_size == stat.st_size and entry.mtime_ns == stat.st_mtime_ns:
+            known.append((file_path, entry.hash))
+        else:
+            to_hash.append((file_path, relative_path, stat))
+    
+    print(f"Files unchanged since last scan: {len(known)}, to hash: {len(to_hash)}")
+    if job:
+        job.update(progress=0, total=len(to_hash), message="hashing")
+    
+    def hash_file(item):
+        file_path = item[0]
         try:
-            abs_path = str(file_path.resolve())
-            
-            if abs_path in tracked_paths:
-                continue
-            if file_path.name in tracked_filenames:
-                continue
-            
-            file_hash = calculate_file_hash(file_path)
-            if file_hash in tracked_hashes:
-                continue
-            
-            untracked_files.append({
-                'path': str(file_path),
-                'filename': file_path.name,
-                'hash': file_hash
-            })
-            
+            return item, calculate_file_hash(file_path)
         except Exception as e:
             print(f"Error checking file {file_path.name}: {str(e)}")
+            return item, None
+    
+    # Saved in batches so hashes computed before a cancel or crash are kept
+    manifest_rows = []
+    with ThreadPoolExecutor(max_workers=SCAN_HASH_WORKERS) as executor:
+        try:
+            for (file_path, relative_path, stat), file_hash in executor.map(hash_file, to_hash):
+                if job:
+                    job.update(advance=1)
+                    job.check_cancelled()
+                if file_hash is None:
+                    continue
+                known.append((file_path, file_hash))
+                manifest_rows.append({
+                    'path': relative_path,
+                    'file_size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'hash': file_hash
+                })
+                if len(manifest_rows) >= MANIFEST_BATCH_SIZE:
+                    _save_manifest(db, manifest_rows)
+                    manifest_rows = []
+        except Exception:
+            # Drop queued files instead of hashing them all before exiting
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    
+    if manifest_rows:
+        _save_manifest(db, manifest_rows)
+    
+    # Drop entries for files that were removed or have since been imported
+    stale_paths = [path for path in manifest if path not in seen_paths]
+    for i in range(0, len(stale_paths), MANIFEST_BATCH_SIZE):
+        db.query(ScanManifestEntry).filter(
+            ScanManifestEntry.path.in_(stale_paths[i:i + MANIFEST_BATCH_SIZE])
+        ).delete(synchronize_session=False)
+    if stale_paths:
+        db.commit()
+    
+    for file_path, file_hash in known:
+        if file_hash in tracked_hashes:
             continue
+        
+        untracked_files.append({
+            'path': str(file_path),
+            'filename': file_path.name,
+            'hash': file_hash
+        })
     
     print(f"Found {len(untracked_files)} untracked files")
     
@@ -110,3 +206,18 @@ def find_untracked_media(db: Session) -> dict:
         'new_files': len(untracked_files),
         'files': untracked_files
     }
+
+def run_media_scan(job: "Job") -> dict:
+    """Background job: scan ORIGINAL_DIR for untracked media"""
+    from ..database import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        result = find_untracked_media(db, job)
+    finally:
+        db.close()
+    
+    return {
+        'new_files': result['new_files'],
+        'files': [f['path'] for f in result['files']]
+    }
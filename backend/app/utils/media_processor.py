@@ -3,16 +3,40 @@ from pathlib import Path
 from PIL import Image
 import cv2
 import magic
-from typing import Tuple, Optional
+from typing import Tuple, Optional, BinaryIO
 from ..schemas import FileTypeEnum
 
+# Every media hash (uploads, scans, imports) uses this algorithm
+HASH_ALGORITHM = "sha256"
+HASH_HEX_LENGTH = 64
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# dHash: 8x8 horizontal gradient bits, stored as 16 hex characters
+PERCEPTUAL_HASH_SIZE = 8
+PERCEPTUAL_HASH_HEX_LENGTH = 16
+
+def new_file_hasher():
+    """Create an incremental hasher for media content"""
+    return hashlib.new(HASH_ALGORITHM)
+
 def calculate_file_hash(file_path: Path) -> str:
-    """Calculate MD5 hash of a file"""
-    hash_md5 = hashlib.md5()
+    """Calculate SHA-256 hash of a file"""
+    hasher = new_file_hasher()
     with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def stream_to_file(source: BinaryIO, target_path: Path) -> Tuple[str, int]:
+    """Copy a stream to disk in chunks, hashing it on the way. Returns (hash, size)"""
+    hasher = new_file_hasher()
+    size = 0
+    with open(target_path, "wb") as target:
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+            target.write(chunk)
+            size += len(chunk)
+    return hasher.hexdigest(), size
 
 def get_mime_type(file_path: Path) -> str:
     """Get MIME type of a file"""
@@ -91,10 +115,41 @@ def get_video_info(file_path: Path) -> Optional[dict]:
     except Exception:
         return None
 
-def process_media_file(file_path: Path) -> dict:
-    """Process media file and extract metadata"""
+def _dhash_bits(gray: Image.Image) -> str:
+    """dHash of a grayscale image: one bit per horizontally adjacent pixel pair"""
+    size = PERCEPTUAL_HASH_SIZE
+    pixels = list(gray.resize((size + 1, size), Image.Resampling.LANCZOS).getdata())
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{value:0{PERCEPTUAL_HASH_HEX_LENGTH}x}"
+
+def calculate_perceptual_hash(file_path: Path, file_type: FileTypeEnum) -> Optional[str]:
+    """Perceptual (difference) hash of an image, or of the first frame of a GIF/video"""
+    try:
+        if file_type == FileTypeEnum.video:
+            cap = cv2.VideoCapture(str(file_path))
+            ret, frame = cap.read()
+            cap.release()
+            if not ret:
+                return None
+            return _dhash_bits(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)))
+
+        with Image.open(file_path) as img:
+            # Lets JPEG decode at a reduced scale - the hash only needs 9x8 pixels
+            img.draft('L', (64, 64))
+            return _dhash_bits(img.convert('L'))
+    except Exception as e:
+        print(f"Error calculating perceptual hash for {file_path}: {e}")
+        return None
+
+def process_media_file(file_path: Path, file_hash: Optional[str] = None) -> dict:
+    """Process media file and extract metadata (pass file_hash if already known)"""
     file_size = file_path.stat().st_size
-    file_hash = calculate_file_hash(file_path)
+    if file_hash is None:
+        file_hash = calculate_file_hash(file_path)
     mime_type = get_mime_type(file_path)
     file_type = determine_file_type(mime_type, file_path.name, file_path)
     
@@ -105,7 +160,8 @@ def process_media_file(file_path: Path) -> dict:
         'file_size': file_size,
         'width': None,
         'height': None,
-        'duration': None
+        'duration': None,
+        'perceptual_hash': None
     }
     
     if file_type in [FileTypeEnum.image, FileTypeEnum.gif]:
@@ -116,4 +172,5 @@ def process_media_file(file_path: Path) -> dict:
         video_info = get_video_info(file_path)
         if video_info:
             result.update(video_info)
+    result['perceptual_hash'] = calculate_perceptual_hash(file_path, file_type)
     return result
@@ -1,9 +1,10 @@
 import re
 from typing import List, Dict, Any, Optional, Tuple, Union
 from datetime import datetime, timedelta
-from sqlalchemy import or_, and_, not_, desc, asc, func, exists, cast, Date, Float, case, text, literal
+from sqlalchemy import or_, and_, not_, desc, asc, func, exists, cast, Date, Float, case, text, literal, select
 from sqlalchemy.orm import Session, Query, aliased
 from ..models import Media, Tag, RatingEnum, blombooru_media_tags, Album, blombooru_album_media, TagCategoryEnum
+from .album_hierarchy import descendant_media_ids_query
 
 TOKEN_PATTERN = re.compile(r'(-?)(?:([a-zA-Z0-9_]+):)?("[^"]*"|[^\s"]+)')
 
@@ -446,10 +447,13 @@ def apply_search_criteria(query: Query, parsed_query: Dict[str, Any], db: Sessio
             elif val == 'none':
                 cond = ~Media.albums.any()
             elif val.isdigit():
-                cond = Media.albums.any(Album.id == int(val))
+                # Includes media in sub-albums
+                cond = Media.id.in_(descendant_media_ids_query(int(val)))
             else:
                 name_clean = val.replace('_', ' ')
-                cond = Media.albums.any(Album.name.ilike(name_clean))
+                cond = Media.id.in_(descendant_media_ids_query(
+                    select(Album.id).where(Album.name.ilike(name_clean))
+                ))
             
             if negated:
                  query = query.filter(not_(cond))
@@ -479,6 +483,32 @@ def apply_search_criteria(query: Query, parsed_query: Dict[str, Any], db: Sessio
                 cond = exists().where(child_alias.parent_id == Media.id)
                 query = query.filter(cond)
 
+    similar_distances = {}
+    if 'similar' in meta:
+        from ..services.phash_index import phash_index, DEFAULT_NEAR_DUPLICATE_DISTANCE, MAX_NEAR_DUPLICATE_DISTANCE
+        
+        # similar:ID or similar:ID,DISTANCE
+        for item in meta['similar']:
+            parts = item['value'].split(',')
+            try:
+                media_id = int(parts[0])
+                max_distance = int(parts[1]) if len(parts) > 1 else DEFAULT_NEAR_DUPLICATE_DISTANCE
+            except ValueError:
+                continue
+            max_distance = max(0, min(max_distance, MAX_NEAR_DUPLICATE_DISTANCE))
+            
+            source_hash = db.query(Media.perceptual_hash).filter(Media.id == media_id).scalar()
+            matches = phash_index.search(db, source_hash, max_distance) if source_hash else []
+            
+            if item['negated']:
+                if matches:
+                    query = query.filter(~Media.id.in_([m_id for m_id, _ in matches]))
+            elif matches:
+                query = query.filter(Media.id.in_([m_id for m_id, _ in matches]))
+                similar_distances.update({m_id: distance for m_id, distance in matches})
+            else:
+                return query.filter(literal(False))
+
     tag_counts_map = {
         'tagcount': None,
         'gentags': TagCategoryEnum.general,
@@ -525,6 +555,8 @@ def apply_search_criteria(query: Query, parsed_query: Dict[str, Any], db: Sessio
         order_val = meta['order'][-1]['value']
     elif 'sort' in meta:
         order_val = meta['sort'][-1]['value']
+    elif similar_distances:
+        order_val = 'similarity'
         
     if order_val == 'id': query = query.order_by(desc(Media.id))
     elif order_val == 'id_asc': query = query.order_by(asc(Media.id))
@@ -533,6 +565,8 @@ def apply_search_criteria(query: Query, parsed_query: Dict[str, Any], db: Sessio
     elif order_val == 'landscape': query = query.order_by(desc(cast(Media.width, Float) / Media.height))
     elif order_val == 'portrait': query = query.order_by(desc(cast(Media.height, Float) / Media.width))
     elif order_val == 'md5': query = query.order_by(Media.hash)
+    elif order_val == 'similarity' and similar_distances:
+        query = query.order_by(case(similar_distances, value=Media.id), desc(Media.id))
     elif order_val == 'custom':
         id_list = None
         if 'id' in meta:
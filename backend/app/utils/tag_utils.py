@@ -0,0 +1,109 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import Dict, Iterable, List, Optional
+
+from ..models import Tag, TagCategoryEnum
+
+def normalize_tag_names(tag_names: Iterable[str]) -> List[str]:
+    """Lowercase, strip and de-duplicate tag names, keeping their order"""
+    names = []
+    seen = set()
+    for name in tag_names:
+        name = name.strip().lower()
+        if name and name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+def get_or_create_tags(
+    db: Session,
+    tag_names: Iterable[str],
+    categories: Optional[Dict[str, str]] = None
+) -> List[Tag]:
+    """
+    Get or create tags by name using one SELECT and at most one
+    INSERT ... ON CONFLICT DO NOTHING. Optional categories (name -> category)
+    apply to newly created tags only.
+    """
+    names = normalize_tag_names(tag_names)
+    if not names:
+        return []
+
+    tags = {tag.name: tag for tag in db.query(Tag).filter(Tag.name.in_(names)).all()}
+    missing = [name for name in names if name not in tags]
+
+    if missing:
+        rows = [
+            {
+                'name': name,
+                'category': (categories or {}).get(name) or TagCategoryEnum.general,
+                'post_count': 0
+            }
+            for name in missing
+        ]
+        stmt = pg_insert(Tag).values(rows).on_conflict_do_nothing(index_elements=['name']).returning(Tag)
+        for tag in db.scalars(stmt):
+            tags[tag.name] = tag
+
+        # Names created by a concurrent transaction are skipped by ON CONFLICT
+        # and not returned, so load them separately
+        still_missing = [name for name in missing if name not in tags]
+        if still_missing:
+            for tag in db.query(Tag).filter(Tag.name.in_(still_missing)).all():
+                tags[tag.name] = tag
+
+    return [tags[name] for name in names if name in tags]
+
+def tag_count_deltas(old_tag_ids: Iterable[int], new_tag_ids: Iterable[int]) -> Dict[int, int]:
+    """Post count changes for one media item whose tags went from old to new"""
+    old_ids = set(old_tag_ids)
+    new_ids = set(new_tag_ids)
+    deltas = {tag_id: 1 for tag_id in new_ids - old_ids}
+    deltas.update({tag_id: -1 for tag_id in old_ids - new_ids})
+    return deltas
+
+def apply_tag_count_deltas(db: Session, deltas: Dict[int, int]):
+    """
+    Add per-tag deltas to post_count with a single UPDATE. Runs in the
+    caller's transaction, so counts commit together with the tag links.
+    """
+    deltas = {tag_id: delta for tag_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    # Sorted so concurrent writers lock tag rows in the same order
+    tag_ids = sorted(deltas)
+    db.execute(
+        text("""
+            UPDATE blombooru_tags AS t
+            SET post_count = GREATEST(COALESCE(t.post_count, 0) + d.delta, 0)
+            FROM (
+                SELECT unnest(CAST(:tag_ids AS integer[])) AS tag_id,
+                       unnest(CAST(:deltas AS integer[])) AS delta
+            ) AS d
+            WHERE t.id = d.tag_id
+        """),
+        {"tag_ids": tag_ids, "deltas": [deltas[tag_id] for tag_id in tag_ids]}
+    )
+    
+    from ..services.tag_autocomplete import tag_autocomplete
+    from ..services.tag_cooccurrence import cooccurrence_refresher
+    tag_autocomplete.apply_count_deltas(deltas)
+    cooccurrence_refresher.mark_changed(tag_ids)
+
+def reconcile_tag_counts(db: Session) -> int:
+    """Recount every tag's post_count in one grouped UPDATE. Returns the number of tags fixed"""
+    result = db.execute(text("""
+        UPDATE blombooru_tags AS t
+        SET post_count = COALESCE(c.count, 0)
+        FROM blombooru_tags AS t2
+        LEFT JOIN (
+            SELECT tag_id, count(*) AS count
+            FROM blombooru_media_tags
+            GROUP BY tag_id
+        ) AS c ON c.tag_id = t2.id
+        WHERE t.id = t2.id
+          AND t.post_count IS DISTINCT FROM COALESCE(c.count, 0)
+    """))
+    return result.rowcount
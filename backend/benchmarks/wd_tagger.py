@@ -0,0 +1,80 @@
+"""
+WD tagger throughput benchmark.
+
+Measures images/sec for every model (or the ones given with --models) on a
+folder of sample media: preprocessing alone with the thread pool and with
+the process pool, and the full pipeline (preprocessing overlapped with
+inference) in the configured mode.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.wd_tagger path/to/images --limit 64
+"""
+import argparse
+import time
+from pathlib import Path
+
+from backend.app.config import settings
+from backend.app.services.wd_tagger import WDTagger, get_wd_tagger
+from backend.app.utils.file_scanner import iter_media_files
+
+
+def set_process_preprocessing(enabled: bool):
+    settings.file_settings.setdefault("ai_tagger", {})["preprocess_processes"] = enabled
+
+
+def preprocess_rate(tagger: WDTagger, file_paths, batch_size: int, processes: bool) -> float:
+    set_process_preprocessing(processes)
+    started = time.perf_counter()
+    for i in range(0, len(file_paths), batch_size):
+        tagger._start_batch([(fp, None) for fp in file_paths[i:i + batch_size]]).result()
+    return len(file_paths) / (time.perf_counter() - started)
+
+
+def pipeline_rate(tagger: WDTagger, file_paths, model_name: str, processes: bool) -> float:
+    set_process_preprocessing(processes)
+    started = time.perf_counter()
+    for _ in tagger.score_files_streaming(file_paths, model_name=model_name):
+        pass
+    return len(file_paths) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", type=Path, help="folder with sample images/videos")
+    parser.add_argument("--limit", type=int, default=64, help="number of files to use")
+    parser.add_argument("--models", nargs="+", choices=list(WDTagger.AVAILABLE_MODELS),
+                        help="models to benchmark (default: all)")
+    args = parser.parse_args()
+
+    file_paths = sorted(str(path) for path, _ in iter_media_files(args.folder))[:args.limit]
+    if not file_paths:
+        parser.error(f"no supported media found in {args.folder}")
+
+    models = args.models or sorted(WDTagger.AVAILABLE_MODELS, key=WDTagger.MODEL_SPEED_RANKING.get)
+    tagger = get_wd_tagger()
+    processes_configured = settings.AI_TAGGER_PREPROCESS_PROCESSES
+
+    print(f"{len(file_paths)} files, images/sec")
+    print(f"{'model':<28}{'input':>7}{'batch':>7}{'prep threads':>14}{'prep procs':>12}{'pipeline':>10}")
+    try:
+        for model_name in models:
+            tagger.ensure_loaded(model_name)
+            batch_size = tagger.get_optimal_batch_size(model_name)
+
+            # Warm up the model and the process pool
+            pipeline_rate(tagger, file_paths[:batch_size], model_name, processes_configured)
+            preprocess_rate(tagger, file_paths[:batch_size], batch_size, True)
+
+            threads = preprocess_rate(tagger, file_paths, batch_size, False)
+            procs = preprocess_rate(tagger, file_paths, batch_size, True)
+            pipeline = pipeline_rate(tagger, file_paths, model_name, processes_configured)
+            print(f"{model_name:<28}{tagger._target_size:>7}{batch_size:>7}{threads:>14.1f}{procs:>12.1f}{pipeline:>10.1f}")
+    finally:
+        from backend.app.services.media_processing import media_processing
+        media_processing.shutdown()
+        tagger.shutdown()
+
+
+if __name__ == "__main__":
+    main()
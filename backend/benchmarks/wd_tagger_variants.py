@@ -0,0 +1,112 @@
+"""
+WD tagger fp32 vs INT8 comparison.
+
+For every model (or the ones given with --models) and both variants, reports:
+- load time, cold (no cached quantized/optimized model) and warm (cached)
+- images/sec through the full pipeline
+- agreement of the INT8 results with fp32: overlap of the top-K general
+  tags per image, and of the tags passing the default thresholds
+
+Run from the repository root:
+
+    python -m backend.benchmarks.wd_tagger_variants path/to/images --limit 64
+"""
+import argparse
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+from backend.app.config import settings
+from backend.app.services.wd_tagger import WDTagger, get_wd_tagger
+from backend.app.utils.file_scanner import iter_media_files
+
+
+def set_variant(variant: str):
+    settings.file_settings.setdefault("ai_tagger", {})["model_variant"] = variant
+
+
+def load_time(tagger: WDTagger, model_name: str, variant: str, cold: bool) -> float:
+    set_variant(variant)
+    tagger._model = None
+    if cold:
+        shutil.rmtree(settings.DATA_DIR / WDTagger.MODEL_CACHE_DIRNAME / model_name, ignore_errors=True)
+    started = time.perf_counter()
+    tagger.ensure_loaded(model_name)
+    return time.perf_counter() - started
+
+
+def score_all(tagger: WDTagger, file_paths, model_name: str):
+    started = time.perf_counter()
+    scores = dict(tagger.score_files_streaming(file_paths, model_name=model_name))
+    return scores, len(file_paths) / (time.perf_counter() - started)
+
+
+def overlap(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def agreement(tagger: WDTagger, fp32_scores: dict, int8_scores: dict, top_k: int):
+    general = tagger._tag_data['general']
+    top_overlaps = []
+    tag_overlaps = []
+    for fp, reference in fp32_scores.items():
+        other = int8_scores.get(fp)
+        if reference is None or other is None:
+            continue
+        top_overlaps.append(overlap(
+            set(general[np.argsort(-reference[general])[:top_k]]),
+            set(general[np.argsort(-other[general])[:top_k]])
+        ))
+        tag_overlaps.append(overlap(
+            {t['name'] for t in tagger.tags_from_scores(reference)},
+            {t['name'] for t in tagger.tags_from_scores(other)}
+        ))
+    if not top_overlaps:
+        return float('nan'), float('nan')
+    return float(np.mean(top_overlaps)), float(np.mean(tag_overlaps))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", type=Path, help="folder with sample images/videos")
+    parser.add_argument("--limit", type=int, default=64, help="number of files to use")
+    parser.add_argument("--top-k", type=int, default=10, help="general tags compared per image")
+    parser.add_argument("--models", nargs="+", choices=list(WDTagger.AVAILABLE_MODELS),
+                        help="models to benchmark (default: all)")
+    args = parser.parse_args()
+
+    file_paths = sorted(str(path) for path, _ in iter_media_files(args.folder))[:args.limit]
+    if not file_paths:
+        parser.error(f"no supported media found in {args.folder}")
+
+    models = args.models or sorted(WDTagger.AVAILABLE_MODELS, key=WDTagger.MODEL_SPEED_RANKING.get)
+    tagger = get_wd_tagger()
+
+    print(f"{len(file_paths)} files")
+    print(f"{'model':<28}{'variant':>8}{'cold load s':>13}{'warm load s':>13}{'img/s':>8}"
+          f"{f'top-{args.top_k} agree':>14}{'tags agree':>12}")
+    try:
+        for model_name in models:
+            results = {}
+            for variant in WDTagger.MODEL_VARIANTS:
+                cold = load_time(tagger, model_name, variant, cold=True)
+                warm = load_time(tagger, model_name, variant, cold=False)
+                # Warm up before timing throughput
+                score_all(tagger, file_paths[:tagger.get_optimal_batch_size(model_name)], model_name)
+                scores, rate = score_all(tagger, file_paths, model_name)
+                results[variant] = scores
+
+                if variant == "fp32":
+                    agree = ""
+                else:
+                    top, tags = agreement(tagger, results["fp32"], scores, args.top_k)
+                    agree = f"{top:>14.3f}{tags:>12.3f}"
+                print(f"{model_name:<28}{tagger.current_variant:>8}{cold:>13.2f}{warm:>13.2f}{rate:>8.1f}{agree}")
+    finally:
+        tagger.shutdown()
+
+
+if __name__ == "__main__":
+    main()
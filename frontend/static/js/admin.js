@@ -120,6 +120,11 @@ class AdminPanel {
             scanBtn.addEventListener('click', () => this.scanMedia());
         }
 
+        const importUntrackedBtn = document.getElementById('import-untracked-btn');
+        if (importUntrackedBtn) {
+            importUntrackedBtn.addEventListener('click', () => this.importAllUntracked());
+        }
+
         // Add tags form
         const addTagsForm = document.getElementById('add-tags-form');
         if (addTagsForm) {
@@ -601,6 +606,91 @@ class AdminPanel {
         }
     }
 
+    async runMediaScan(scanBtn) {
+        const { job_id } = await app.apiCall('/api/admin/scan-media', {
+            method: 'POST'
+        });
+
+        // The scan runs as a background job - poll until it finishes
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const job = await app.apiCall(`/api/admin/scan-media/${job_id}`);
+
+            if (job.status === 'completed') {
+                return job.result;
+            }
+            if (job.status === 'failed' || job.status === 'cancelled') {
+                throw new Error(job.error || job.status);
+            }
+            if (job.total) {
+                scanBtn.textContent = window.i18n.t('admin.messages.scan_hashing', { current: job.progress, total: job.total });
+            }
+        }
+    }
+
+    async importAllUntracked() {
+        if (!confirm(window.i18n.t('admin.messages.import_untracked_confirm'))) return;
+
+        const importBtn = document.getElementById('import-untracked-btn');
+        const originalText = importBtn.textContent;
+        importBtn.disabled = true;
+        importBtn.textContent = window.i18n.t('admin.actions.scanning');
+
+        // Use the uploader's base rating, tags, albums and source as defaults
+        const uploader = window.uploaderInstance;
+        const options = uploader ? {
+            rating: uploader.baseRating,
+            tags: uploader.baseTags,
+            album_ids: Array.from(uploader.baseAlbumIds),
+            source: uploader.baseSource
+        } : {};
+
+        try {
+            const { job_id } = await app.apiCall('/api/admin/import-untracked', {
+                method: 'POST',
+                body: JSON.stringify(options)
+            });
+
+            let job;
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                job = await app.apiCall(`/api/jobs/${job_id}`);
+
+                if (job.status === 'failed') {
+                    throw new Error(job.error || job.status);
+                }
+                if (job.status === 'completed' || job.status === 'cancelled') {
+                    break;
+                }
+                if (job.total) {
+                    const key = job.message === 'importing' ? 'admin.messages.import_untracked_progress' : 'admin.messages.scan_hashing';
+                    importBtn.textContent = window.i18n.t(key, { current: job.progress, total: job.total });
+                }
+            }
+
+            const result = job.result || { imported: 0, duplicates: 0, failed: 0 };
+            if (result.imported === 0 && result.duplicates === 0 && result.failed === 0) {
+                app.showNotification(window.i18n.t('notifications.admin.no_untracked_media'), 'info');
+                return;
+            }
+
+            let message = window.i18n.t('upload.progress.upload_success', { count: result.imported });
+            if (result.duplicates > 0) {
+                message += ` ${window.i18n.t('upload.progress.duplicates_skipped', { count: result.duplicates })}`;
+            }
+            if (result.failed > 0) {
+                message += ` ${window.i18n.t('upload.progress.failed', { count: result.failed })}`;
+            }
+            app.showNotification(message, result.failed > 0 ? 'warning' : 'success');
+        } catch (error) {
+            console.error('Import error:', error);
+            app.showNotification(error.message, 'error', window.i18n.t('notifications.admin.error_scanning_media'));
+        } finally {
+            importBtn.disabled = false;
+            importBtn.textContent = originalText;
+        }
+    }
+
     async scanMedia() {
         const scanBtn = document.getElementById('scan-media-btn');
         const originalText = scanBtn.textContent;
@@ -608,9 +698,7 @@ class AdminPanel {
         scanBtn.textContent = window.i18n.t('admin.actions.scanning');
 
         try {
-            const result = await app.apiCall('/api/admin/scan-media', {
-                method: 'POST'
-            });
+            const result = await this.runMediaScan(scanBtn);
 
             if (result.new_files === 0) {
                 app.showNotification(window.i18n.t('notifications.admin.no_untracked_media'), 'info');
@@ -849,7 +937,29 @@ class AdminPanel {
                 throw new Error(error.detail || 'Upload failed');
             }
 
-            const result = await response.json();
+            const { job_id } = await response.json();
+            const statusText = progressDiv.querySelector('strong');
+
+            let job;
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                job = await app.apiCall(`/api/jobs/${job_id}`);
+
+                if (job.status === 'failed' || job.status === 'cancelled') {
+                    throw new Error(job.error || job.status);
+                }
+                if (job.status === 'completed') {
+                    break;
+                }
+                if (job.message === 'merging') {
+                    statusText.textContent = window.i18n.t('admin.messages.tags_import_merging');
+                } else if (job.total) {
+                    const percent = Math.floor(job.progress / job.total * 100);
+                    statusText.textContent = window.i18n.t('admin.messages.tags_import_reading', { percent });
+                }
+            }
+
+            const result = job.result;
 
             let html = `
                 <div class="bg-success p-3 mb-2 tag-text">
@@ -850,17 +850,13 @@ class BaseGallery {
             if (!result) return;
 
             const mediaIds = Array.from(this.selectedItems);
-            let successCount = 0;
 
-            for (const albumId of result.ids) {
-                await app.apiCall(`/api/albums/${albumId}/media`, {
-                    method: 'POST',
-                    body: JSON.stringify({ media_ids: mediaIds })
-                });
-                successCount++;
-            }
+            const response = await app.apiCall('/api/albums/media/add', {
+                method: 'POST',
+                body: JSON.stringify({ album_ids: result.ids, media_ids: mediaIds })
+            });
 
-            app.showNotification(window.i18n.t('notifications.gallery.added_to_albums', { itemCount, albumCount: successCount }), 'success');
+            app.showNotification(window.i18n.t('notifications.gallery.added_to_albums', { itemCount, albumCount: response.album_ids.length }), 'success');
             this.clearSelection();
         } catch (error) {
             console.error('Error adding to albums:', error);
@@ -677,10 +677,10 @@ class MediaViewer extends MediaViewerBase {
 
             try {
                 // Process additions
-                for (const albumId of addedIds) {
-                    await app.apiCall(`/api/albums/${albumId}/media`, {
+                if (addedIds.length > 0) {
+                    await app.apiCall('/api/albums/media/add', {
                         method: 'POST',
-                        body: JSON.stringify({ media_ids: [parseInt(this.mediaId)] })
+                        body: JSON.stringify({ album_ids: addedIds, media_ids: [parseInt(this.mediaId)] })
                     });
                 }
 
@@ -7,6 +7,7 @@ class Uploader {
         this.baseRating = 'safe';
         this.baseTags = [];
         this.baseAlbumIds = new Set();
+        this.bulkUploadSize = 25;
         this.allAlbums = [];
         this.baseSource = '';
         this.fileHashes = new Set();
@@ -525,8 +526,8 @@ class Uploader {
     async handleFiles(files) {
         for (const file of files) {
             // Check if it's a zip or tar.gz file
-            if (file.name.endsWith('.zip') || file.name.endsWith('.tar.gz') || file.name.endsWith('.tgz')) {
-                await this.handleArchive(file);
+            if (this.isArchiveFile(file)) {
+                this.addArchive(file);
                 continue;
             }
 
@@ -564,71 +565,91 @@ class Uploader {
         }
     }
 
-    async handleArchive(archiveFile) {
-        // Show loading indicator
-        const loadingDiv = document.createElement('div');
-        loadingDiv.className = 'bg-primary primary-text p-2 mb-2 text-xs';
-        loadingDiv.textContent = window.i18n.t('upload.progress.extracting', { filename: archiveFile.name });
-        this.uploadArea.parentNode.insertBefore(loadingDiv, this.uploadArea.nextSibling);
+    isArchiveFile(file) {
+        const name = file.name.toLowerCase();
+        return name.endsWith('.zip') || name.endsWith('.tar.gz') || name.endsWith('.tgz');
+    }
 
-        try {
-            const formData = new FormData();
-            formData.append('file', archiveFile);
+    addArchive(archiveFile) {
+        // Archives are imported on the server when submitted, using the same
+        // rating, tags and albums as regular files
+        const hash = `archive-${archiveFile.name}-${archiveFile.size}-${archiveFile.lastModified}`;
+        if (this.fileHashes.has(hash)) {
+            return;
+        }
 
-            const response = await fetch('/api/media/extract-archive', {
-                method: 'POST',
-                body: formData
-            });
+        this.fileHashes.add(hash);
+
+        const fileData = {
+            file: archiveFile,
+            hash: hash,
+            rating: this.baseRating,
+            source: this.baseSource,
+            additionalTags: [],
+            individualAlbumIds: new Set(),
+            preview: null,
+            scannedPath: null,
+            isArchive: true
+        };
+
+        this.uploadedFiles.push(fileData);
+        this.createPreview(fileData, this.uploadedFiles.length - 1);
+    }
 
-            if (!response.ok) {
-                throw new Error(`Failed to extract archive: ${response.statusText}`);
-            }
+    async importArchive(fileData, onProgress) {
+        const allTags = [...this.baseTags, ...fileData.additionalTags];
+        const uniqueTags = [...new Set(allTags)];
+        const allAlbumIds = new Set([...this.baseAlbumIds, ...fileData.individualAlbumIds]);
 
-            const result = await response.json();
+        const formData = new FormData();
+        formData.append('file', fileData.file);
+        formData.append('rating', fileData.rating);
+        formData.append('tags', uniqueTags.join(' '));
 
-            // result.files contains array of extracted file data
-            for (const extractedFileData of result.files) {
-                // Convert base64 to blob
-                const binaryString = atob(extractedFileData.content);
-                const bytes = new Uint8Array(binaryString.length);
-                for (let i = 0; i < binaryString.length; i++) {
-                    bytes[i] = binaryString.charCodeAt(i);
-                }
-                const blob = new Blob([bytes], { type: extractedFileData.mime_type });
-                const file = new File([blob], extractedFileData.filename, { type: extractedFileData.mime_type });
+        if (allAlbumIds.size > 0) {
+            formData.append('album_ids', Array.from(allAlbumIds).join(','));
+        }
 
-                if (this.isValidFile(file)) {
-                    const hash = await this.computeFileHash(file);
+        if (fileData.source) {
+            formData.append('source', fileData.source);
+        }
 
-                    if (this.fileHashes.has(hash)) {
-                        continue;
-                    }
+        const response = await fetch('/api/media/import-archive', {
+            method: 'POST',
+            body: formData
+        });
 
-                    this.fileHashes.add(hash);
+        if (!response.ok) {
+            const error = await response.json();
+            throw new Error(`Archive import failed (${response.status}): ${error.detail || response.statusText}`);
+        }
 
-                    const fileData = {
-                        file: file,
-                        hash: hash,
-                        rating: this.baseRating,
-                        source: this.baseSource,
-                        additionalTags: [],
-                        preview: null
-                    };
+        const { job_id } = await response.json();
 
-                    this.uploadedFiles.push(fileData);
-                    this.createPreview(fileData, this.uploadedFiles.length - 1);
-                }
-            }
+        // Follow the import job until it finishes
+        return await new Promise((resolve, reject) => {
+            const events = new EventSource(`/api/jobs/${job_id}/events`);
 
-            loadingDiv.textContent = window.i18n.t('upload.progress.extracted_success', { count: result.files.length, filename: archiveFile.name });
-            setTimeout(() => loadingDiv.remove(), 3000);
+            events.onmessage = (e) => {
+                const data = JSON.parse(e.data);
 
-        } catch (error) {
-            console.error('Archive extraction error:', error);
-            loadingDiv.className = 'bg-danger tag-text p-2 mb-2 text-xs';
-            loadingDiv.textContent = window.i18n.t('upload.progress.extracted_error', { filename: archiveFile.name, error: error.message });
-            setTimeout(() => loadingDiv.remove(), 5000);
-        }
+                if (data.type === 'progress') {
+                    onProgress(data.progress, data.total);
+                } else if (data.type === 'done') {
+                    events.close();
+                    if (data.status === 'failed') {
+                        reject(new Error(data.error || 'Archive import failed'));
+                    } else {
+                        resolve(data.result || { imported: 0, duplicates: 0, failed: 0 });
+                    }
+                }
+            };
+
+            events.onerror = () => {
+                events.close();
+                reject(new Error('Lost connection to archive import'));
+            };
+        });
     }
 
     isValidFile(file) {
@@ -647,7 +668,12 @@ class Uploader {
 
         const isVideo = fileData.file.type.startsWith('video/');
 
-        if (isVideo) {
+        if (fileData.isArchive) {
+            const placeholder = document.createElement('div');
+            placeholder.className = 'w-full h-24 flex items-center justify-center text-xs text-secondary p-1 break-all';
+            placeholder.textContent = fileData.file.name;
+            thumbnailDiv.appendChild(placeholder);
+        } else if (isVideo) {
             const video = document.createElement('video');
             video.className = 'w-full h-24 object-cover';
             video.src = URL.createObjectURL(fileData.file);
@@ -676,7 +702,7 @@ class Uploader {
             const clickedIndex = parseInt(e.currentTarget.dataset.index);
             if (this.selectedFileIndex === clickedIndex) {
                 const fileData = this.uploadedFiles[clickedIndex];
-                if (fileData && fileData.file) {
+                if (fileData && fileData.file && !fileData.isArchive) {
                     const src = URL.createObjectURL(fileData.file);
                     const isVideo = fileData.file.type.startsWith('video/');
                     this.fullscreenViewer.open(src, isVideo);
@@ -840,23 +866,63 @@ class Uploader {
         let successCount = 0;
         let failCount = 0;
         let duplicateCount = 0;
+        let nearDuplicateCount = 0;
+        let processedCount = 0;
+        const total = this.uploadedFiles.length;
+
+        // Files sharing rating, tags, albums and source are sent together in bulk requests
+        const groups = new Map();
+        const archives = [];
+        for (const fileData of this.uploadedFiles) {
+            if (fileData.isArchive) {
+                archives.push(fileData);
+                continue;
+            }
+
+            const key = JSON.stringify(this.getUploadOptions(fileData));
+            if (!groups.has(key)) {
+                groups.set(key, []);
+            }
+            groups.get(key).push(fileData);
+        }
+
+        for (const group of groups.values()) {
+            for (let i = 0; i < group.length; i += this.bulkUploadSize) {
+                const chunk = group.slice(i, i + this.bulkUploadSize);
+                submitBtn.textContent = window.i18n.t('upload.progress.uploading_progress', { current: processedCount + chunk.length, total: total });
+
+                try {
+                    const result = await this.uploadBulk(chunk);
+                    successCount += result.imported;
+                    duplicateCount += result.duplicates;
+                    failCount += result.failed;
+                    nearDuplicateCount += result.near_duplicates || 0;
+                } catch (error) {
+                    console.error('Upload error:', error);
+                    failCount += chunk.length;
+                }
+                processedCount += chunk.length;
+            }
+        }
 
-        for (let i = 0; i < this.uploadedFiles.length; i++) {
-            const fileData = this.uploadedFiles[i];
-            submitBtn.textContent = window.i18n.t('upload.progress.uploading_progress', { current: i + 1, total: this.uploadedFiles.length });
+        for (const fileData of archives) {
+            processedCount++;
+            submitBtn.textContent = window.i18n.t('upload.progress.uploading_progress', { current: processedCount, total: total });
 
             try {
-                await this.uploadFile(fileData);
-                successCount++;
+                const result = await this.importArchive(fileData, (current, archiveTotal) => {
+                    submitBtn.textContent = window.i18n.t('upload.progress.importing_archive', {
+                        filename: fileData.file.name,
+                        current: current,
+                        total: archiveTotal ?? '?'
+                    });
+                });
+                successCount += result.imported;
+                duplicateCount += result.duplicates;
+                failCount += result.failed;
             } catch (error) {
-                console.error('Upload error:', error);
-
-                // Check if it's a duplicate error (409 status)
-                if (error.message.includes('409') || error.message.includes('already exists')) {
-                    duplicateCount++;
-                } else {
-                    failCount++;
-                }
+                console.error('Archive import error:', error);
+                failCount++;
             }
         }
 
@@ -868,6 +934,9 @@ class Uploader {
         if (failCount > 0) {
             message += ` ${window.i18n.t('upload.progress.failed', { count: failCount })}`;
         }
+        if (nearDuplicateCount > 0) {
+            message += ` ${window.i18n.t('upload.progress.near_duplicates', { count: nearDuplicateCount })}`;
+        }
 
         app.showNotification(message, 'success');
 
@@ -880,30 +949,48 @@ class Uploader {
         }
     }
 
-    async uploadFile(fileData) {
+    getUploadOptions(fileData) {
         const allTags = [...this.baseTags, ...fileData.additionalTags];
         const uniqueTags = [...new Set(allTags)];
         const allAlbumIds = new Set([...this.baseAlbumIds, ...fileData.individualAlbumIds]);
 
+        return {
+            rating: fileData.rating,
+            tags: uniqueTags.join(' '),
+            albumIds: Array.from(allAlbumIds).sort((a, b) => a - b).join(','),
+            source: fileData.source || ''
+        };
+    }
+
+    async uploadBulk(fileDataList) {
+        const options = this.getUploadOptions(fileDataList[0]);
+
         const formData = new FormData();
-        if (fileData.scannedPath) {
-            formData.append('scanned_path', fileData.scannedPath);
-        } else {
-            formData.append('file', fileData.file);
+        const scannedPaths = [];
+        for (const fileData of fileDataList) {
+            if (fileData.scannedPath) {
+                scannedPaths.push(fileData.scannedPath);
+            } else {
+                formData.append('files', fileData.file);
+            }
         }
 
-        formData.append('rating', fileData.rating);
-        formData.append('tags', uniqueTags.join(' '));
+        if (scannedPaths.length > 0) {
+            formData.append('scanned_paths', JSON.stringify(scannedPaths));
+        }
 
-        if (allAlbumIds.size > 0) {
-            formData.append('album_ids', Array.from(allAlbumIds).join(','));
+        formData.append('rating', options.rating);
+        formData.append('tags', options.tags);
+
+        if (options.albumIds) {
+            formData.append('album_ids', options.albumIds);
         }
 
-        if (fileData.source) {
-            formData.append('source', fileData.source);
+        if (options.source) {
+            formData.append('source', options.source);
         }
 
-        const response = await fetch('/api/media/', {
+        const response = await fetch('/api/media/bulk', {
             method: 'POST',
             body: formData
         });